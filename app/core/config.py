@@ -17,15 +17,100 @@ class Settings(BaseSettings):
     
     # Vector DB
     vector_db_path: str = os.getenv("VECTOR_DB_PATH", "./data/db/chroma")
+    ann_nprobe: int = int(os.getenv("ANN_NPROBE", 16))
+    ann_min_rows: int = int(os.getenv("ANN_MIN_ROWS", 50000))
+    # Compact the vector index once this fraction of its rows belongs to deleted documents
+    index_compact_ratio: float = float(os.getenv("INDEX_COMPACT_RATIO", 0.2))
+    lexical_index_path: str = os.getenv("LEXICAL_INDEX_PATH", "./data/db/lexical.db")
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "hybrid")  # hybrid, lexical or vector
     
     # LLM
     openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY", None)
     anthropic_api_key: Optional[str] = os.getenv("ANTHROPIC_API_KEY", None)
     default_llm: str = os.getenv("DEFAULT_LLM", "openai")
+    # Prompt budget for context passages when packing batched questions
+    llm_context_tokens: int = int(os.getenv("LLM_CONTEXT_TOKENS", 6000))
+    openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    anthropic_model: str = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+    anthropic_base_url: str = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com/v1")
+    llm_max_tokens: int = int(os.getenv("LLM_MAX_TOKENS", 1024))
+    llm_timeout_s: float = float(os.getenv("LLM_TIMEOUT_S", 60))
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))  # per provider
+    llm_requests_per_minute: float = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+    llm_tokens_per_minute: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", 0))  # 0 = unlimited
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", 2))
+    llm_stub_latency_ms: float = float(os.getenv("LLM_STUB_LATENCY_MS", 200))
+    
+    # LLM response cache
+    llm_cache_enabled: bool = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+    llm_cache_path: str = os.getenv("LLM_CACHE_PATH", "./data/cache/llm.db")
+    llm_cache_max_bytes: int = int(os.getenv("LLM_CACHE_MAX_BYTES", 268435456))  # 256MB
+    llm_cache_ttl_s: float = float(os.getenv("LLM_CACHE_TTL_S", 0))  # 0 = never expire
+    llm_cache_memory_entries: int = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", 2000))
+    
+    # Answer cache
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+    answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+    
+    # Streaming
+    stream_flush_chars: int = int(os.getenv("STREAM_FLUSH_CHARS", 64))
+    stream_flush_ms: float = float(os.getenv("STREAM_FLUSH_MS", 50))
     
     # Upload settings
     max_upload_size: int = int(os.getenv("MAX_UPLOAD_SIZE", 52428800))  # 50MB
     upload_dir: str = os.getenv("UPLOAD_DIR", "./data/uploads")
+    upload_chunk_size: int = int(os.getenv("UPLOAD_CHUNK_SIZE", 1048576))  # 1MB
+    
+    # PDF extraction
+    pdf_workers: int = int(os.getenv("PDF_WORKERS", os.cpu_count() or 2))
+    pdf_pages_per_task: int = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+    
+    # Extracted text cache
+    text_cache_dir: str = os.getenv("TEXT_CACHE_DIR", "./data/cache/text")
+    text_cache_max_bytes: int = int(os.getenv("TEXT_CACHE_MAX_BYTES", 1073741824))  # 1GB
+    
+    # Chunking
+    chunk_max_tokens: int = int(os.getenv("CHUNK_MAX_TOKENS", 200))
+    chunk_overlap_tokens: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+    # Smallest chunk a section heading may close
+    chunk_min_tokens: int = int(os.getenv("CHUNK_MIN_TOKENS", 32))
+    
+    # Embeddings
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+    embedding_max_wait_ms: float = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
+    embedding_cache_size: int = int(os.getenv("EMBEDDING_CACHE_SIZE", 50000))
+    embedding_model_pool_size: int = int(os.getenv("EMBEDDING_MODEL_POOL_SIZE", 2))
+    
+    # Background jobs
+    job_queue_size: int = int(os.getenv("JOB_QUEUE_SIZE", 1000))
+    job_cpu_workers: int = int(os.getenv("JOB_CPU_WORKERS", os.cpu_count() or 2))
+    job_io_workers: int = int(os.getenv("JOB_IO_WORKERS", 8))
+    
+    # Webhooks
+    webhook_timeout_s: float = float(os.getenv("WEBHOOK_TIMEOUT_S", 10))
+    webhook_max_connections: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 100))
+    webhook_endpoint_concurrency: int = int(os.getenv("WEBHOOK_ENDPOINT_CONCURRENCY", 4))
+    webhook_batch_window_ms: float = float(os.getenv("WEBHOOK_BATCH_WINDOW_MS", 1000))
+    webhook_batch_max: int = int(os.getenv("WEBHOOK_BATCH_MAX", 100))
+    webhook_max_attempts: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))
+    webhook_backoff_base_s: float = float(os.getenv("WEBHOOK_BACKOFF_BASE_S", 2))
+    webhook_backoff_max_s: float = float(os.getenv("WEBHOOK_BACKOFF_MAX_S", 600))
+    
+    # Bulk audit
+    audit_export_dir: str = os.getenv("AUDIT_EXPORT_DIR", "./data/audits")
+    bulk_audit_shard_size: int = int(os.getenv("BULK_AUDIT_SHARD_SIZE", 32))
+    
+    # Request profiling; profiles expose stacks and timings, so they are off by default
+    # and the header and /admin/profiles both need ADMIN_TOKEN
+    profiling_enabled: bool = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+    admin_token: Optional[str] = os.getenv("ADMIN_TOKEN", None)
+    profile_header: str = os.getenv("PROFILE_HEADER", "X-Profile")
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+    profile_buffer_size: int = int(os.getenv("PROFILE_BUFFER_SIZE", 50))
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,123 @@
+"""ASGI middleware"""
+import random
+import time
+from typing import Callable, Dict, Optional
+
+from app.core.security import admin_token_matches
+from app.services.metrics import get_metrics
+from app.services.profiler import get_profiler
+
+
+def _route(scope, routes: Dict[Callable, str]) -> str:
+    """The matched route template (``/jobs/{job_id}``), memoised per endpoint"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    route = routes.get(endpoint)
+    if route is None:
+        app = scope.get("app")
+        for candidate in getattr(app, "routes", ()):
+            if getattr(candidate, "endpoint", None) is endpoint:
+                route = candidate.path
+                break
+        else:
+            route = "unmatched"
+        routes[endpoint] = route
+    return route
+
+
+class MetricsMiddleware:
+    """
+    Per-route request counts and latency histograms
+
+    Requests are labelled with the route template, not the raw path, so
+    label cardinality stays bounded. Streaming responses are timed until
+    their last body chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            get_metrics().observe(
+                "http_request_duration_seconds",
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=_route(scope, self._routes),
+                status=status
+            )
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests that ask for it, or a random sample of them
+
+    A request is profiled when it carries the profile header set to the
+    admin ``token`` or is drawn at ``sample_rate``; without a token only
+    sampling applies. Unprofiled requests pay for one header scan. The
+    profile id is returned in ``X-Profile-Id``; the profile itself is
+    served by ``/admin/profiles``.
+    """
+
+    def __init__(self, app, header: str = "X-Profile", sample_rate: float = 0.0, token: Optional[str] = None):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+        self.sample_rate = sample_rate
+        self.token = token
+        self._routes: Dict[Callable, str] = {}
+
+    def _reason(self, scope):
+        for name, value in scope["headers"]:
+            if name == self.header:
+                return "header" if admin_token_matches(value.decode("latin-1"), self.token) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = self._reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = get_profiler()
+        handle = profiler.begin(scope["method"], scope["path"], reason)
+        if handle is None:
+            # Another request is being profiled
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        profile_id = handle[0].id.encode("latin-1")
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.finish(handle, _route(scope, self._routes), status)
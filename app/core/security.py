@@ -0,0 +1,19 @@
+"""Admin token checks"""
+from fastapi import Header, HTTPException
+from typing import Optional
+import hmac
+
+from app.core.config import get_settings
+
+
+def admin_token_matches(value: Optional[str], token: Optional[str]) -> bool:
+    """Constant-time check of a presented token; always False when no token is configured"""
+    if not token or value is None:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), token.encode("utf-8"))
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Dependency for admin endpoints that expose request internals"""
+    if not admin_token_matches(x_admin_token, get_settings().admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
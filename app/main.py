@@ -3,8 +3,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.openapi.utils import get_openapi
+import importlib
 import os
 
+from app.core.config import get_settings
+from app.core.middleware import MetricsMiddleware, ProfilingMiddleware
+
 # Create app instance
 app = FastAPI(
     title="Contract Intelligence API",
@@ -24,6 +28,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Route latency histograms for /admin/metrics
+app.add_middleware(MetricsMiddleware)
+
+# Opt-in per-request profiles for /admin/profiles; not installed at all when disabled
+_settings = get_settings()
+if _settings.profiling_enabled:
+    app.add_middleware(
+        ProfilingMiddleware,
+        header=_settings.profile_header,
+        sample_rate=_settings.profile_sample_rate,
+        token=_settings.admin_token
+    )
+
 
 @app.get("/")
 async def root():
@@ -42,19 +59,41 @@ async def health():
     return {"status": "healthy"}
 
 
-# Import and register routers
-try:
-    from app.routers import ingest, extract, ask, audit, webhook, admin
-    
-    app.include_router(ingest.router, prefix="/ingest", tags=["ingest"])
-    app.include_router(extract.router, prefix="/extract", tags=["extract"])
-    app.include_router(ask.router, prefix="/ask", tags=["ask"])
-    app.include_router(audit.router, prefix="/audit", tags=["audit"])
-    app.include_router(webhook.router, prefix="/webhook", tags=["webhook"])
-    app.include_router(admin.router, prefix="/admin", tags=["admin"])
-    
-except ImportError as e:
-    print(f"Warning: Could not import routers: {e}")
+# Import and register routers; one failing import must not take down the others
+for _name, _prefix in [
+    ("ingest", "/ingest"),
+    ("jobs", "/jobs"),
+    ("extract", "/extract"),
+    ("ask", "/ask"),
+    ("audit", "/audit"),
+    ("webhook", "/webhooks"),
+    ("admin", "/admin"),
+]:
+    try:
+        _module = importlib.import_module(f"app.routers.{_name}")
+        app.include_router(_module.router, prefix=_prefix, tags=[_name])
+    except ImportError as e:
+        print(f"Warning: Could not import router {_name}: {e}")
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    """Start job workers and webhook delivery, resuming work interrupted by a restart"""
+    from app.services.job_queue import get_job_queue
+    from app.services.webhook_service import get_webhook_dispatcher
+    get_job_queue().start()
+    get_webhook_dispatcher().start()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    """Stop job workers, webhook delivery and pooled LLM clients"""
+    from app.services.job_queue import get_job_queue
+    from app.services.llm_service import close_llm_providers
+    from app.services.webhook_service import get_webhook_dispatcher
+    get_job_queue().stop()
+    get_webhook_dispatcher().stop()
+    await close_llm_providers()
 
 
 @app.exception_handler(Exception)
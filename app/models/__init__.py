@@ -0,0 +1 @@
+"""Data models"""
@@ -0,0 +1,170 @@
+"""Database models and session management"""
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, create_engine
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.config import get_settings
+
+Base = declarative_base()
+
+
+class Contract(Base):
+    """Catalog entry for an ingested document, keyed by content hash"""
+    __tablename__ = "contracts"
+
+    id = Column(String(64), primary_key=True)
+    filename = Column(String(512), nullable=False, index=True)
+    size = Column(Integer, nullable=False, index=True)
+    upload_date = Column(DateTime, nullable=False, index=True)
+    pages = Column(Integer, nullable=True)
+    processed = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        # Keyset pagination walks (upload_date, id) in order
+        Index("ix_contracts_upload_date_id", "upload_date", "id"),
+    )
+
+
+class ContractAlias(Base):
+    """Filename -> most recent document uploaded under that name"""
+    __tablename__ = "contract_aliases"
+
+    filename = Column(String(512), primary_key=True)
+    contract_id = Column(String(64), ForeignKey("contracts.id", ondelete="CASCADE"), nullable=False, index=True)
+
+
+class Job(Base):
+    """Background processing job"""
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(32), nullable=False)
+    document_id = Column(String(64), nullable=True, index=True)
+    status = Column(String(16), nullable=False, default="queued")
+    stage = Column(String(64), nullable=True)
+    payload = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
+
+
+class ExtractedField(Base):
+    """One extracted field value for a document"""
+    __tablename__ = "extracted_fields"
+
+    document_id = Column(String(64), ForeignKey("contracts.id", ondelete="CASCADE"), primary_key=True)
+    field = Column(String(64), primary_key=True)
+    value = Column(Text, nullable=True)  # JSON
+    confidence = Column(Float, nullable=False, default=0.0)
+    method = Column(String(16), nullable=True)
+    pages = Column(Text, nullable=True)  # JSON list
+    # Field fingerprint and text extractor version the value was computed with
+    fingerprint = Column(String(16), nullable=False)
+    extractor_version = Column(String(16), nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class Audit(Base):
+    """Risk audit of a document's text under one rule set"""
+    __tablename__ = "audits"
+
+    document_id = Column(String(64), ForeignKey("contracts.id", ondelete="CASCADE"), primary_key=True)
+    ruleset_version = Column(String(16), primary_key=True)
+    text_version = Column(String(16), nullable=False)
+    summary = Column(Text, nullable=False)  # JSON
+    llm_calls = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+class AuditFinding(Base):
+    """A risky clause found by an audit"""
+    __tablename__ = "audit_findings"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(String(64), nullable=False)
+    ruleset_version = Column(String(16), nullable=False)
+    rule_id = Column(String(64), nullable=False)
+    clause_type = Column(String(64), nullable=False)
+    severity = Column(String(16), nullable=False)
+    description = Column(Text, nullable=False)
+    recommendation = Column(Text, nullable=True)
+    start = Column(Integer, nullable=False)
+    end = Column(Integer, nullable=False)
+    page = Column(Integer, nullable=True)
+    text = Column(Text, nullable=False)
+    method = Column(String(16), nullable=False)
+    ambiguous = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index("ix_audit_findings_document_ruleset_severity", "document_id", "ruleset_version", "severity"),
+    )
+
+
+class Webhook(Base):
+    """Registered webhook endpoint"""
+    __tablename__ = "webhooks"
+
+    id = Column(String(32), primary_key=True)
+    url = Column(String(2048), nullable=False)
+    events = Column(Text, nullable=False)  # JSON list
+    secret = Column(String(256), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+
+
+class WebhookDelivery(Base):
+    """A payload waiting for (or done with) delivery to a webhook"""
+    __tablename__ = "webhook_deliveries"
+
+    id = Column(String(32), primary_key=True)
+    webhook_id = Column(String(32), ForeignKey("webhooks.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_type = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # The dispatcher polls for due pending deliveries
+        Index("ix_webhook_deliveries_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+
+_engines: Dict[str, Engine] = {}
+
+
+def get_engine(database_url: Optional[str] = None) -> Engine:
+    """Get a shared engine for a database URL"""
+    database_url = database_url or get_settings().database_url
+    engine = _engines.get(database_url)
+    if engine is None:
+        connect_args = {}
+        if database_url.startswith("sqlite"):
+            connect_args["check_same_thread"] = False
+            path = database_url.split("///", 1)[-1]
+            if path and path != ":memory:":
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+        engine = create_engine(database_url, connect_args=connect_args)
+        _engines[database_url] = engine
+    return engine
+
+
+def create_tables(database_url: Optional[str] = None):
+    """Create all tables that do not exist yet"""
+    Base.metadata.create_all(get_engine(database_url))
+
+
+def get_session_local(database_url: Optional[str] = None) -> sessionmaker:
+    """Get a session factory bound to the database"""
+    return sessionmaker(bind=get_engine(database_url), autoflush=False, expire_on_commit=False)
@@ -0,0 +1,143 @@
+"""Admin Router"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timezone
+from typing import Dict
+import os
+import platform
+import sys
+import time
+
+from app.core.security import require_admin_token
+from app.services.answer_cache import get_answer_cache
+from app.services.embedding_service import get_embedding_service
+from app.services.job_queue import get_job_queue
+from app.services.llm_cache import get_llm_cache
+from app.services.llm_service import RemoteLLMProvider, get_default_provider
+from app.services.metrics import get_metrics
+from app.services.profiler import get_profiler
+from app.services.text_cache import get_text_cache
+from app.services.webhook_service import get_webhook_dispatcher
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+router = APIRouter()
+
+
+def _system() -> Dict:
+    """Host and process resource usage, from psutil when it is installed"""
+    info = {
+        "pid": os.getpid(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "load_average": list(os.getloadavg()) if hasattr(os, "getloadavg") else None
+    }
+    if psutil is not None:
+        process = psutil.Process()
+        memory = psutil.virtual_memory()
+        info.update({
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "memory_available_mb": memory.available / 1048576,
+            "process_rss_mb": process.memory_info().rss / 1048576
+        })
+    else:
+        try:
+            import resource
+            # ru_maxrss is KiB on Linux
+            info["process_max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:  # pragma: no cover - not available on Windows
+            pass
+    return info
+
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness check"""
+    return {"status": "healthy"}
+
+
+@router.get("/metrics")
+async def metrics(format: str = Query("json", pattern="^(json|prometheus)$")):
+    """
+    Service metrics since process start
+
+    Query Parameters:
+    - format: ``json`` (default) or ``prometheus`` for the text exposition format
+
+    Returns:
+    - Headline counters and averages, plus every counter and latency
+      histogram (count, mean, p50/p95/p99 in ms) by route and by pipeline stage
+    """
+    registry = get_metrics()
+    if format == "prometheus":
+        return PlainTextResponse(registry.prometheus(), media_type="text/plain; version=0.0.4")
+    return {
+        "documents_ingested": registry.counter("documents_ingested_total"),
+        "total_queries": registry.counter("queries_total"),
+        "total_audit_runs": registry.counter("audit_runs_total"),
+        "llm_calls": registry.counter("llm_calls_total"),
+        "uptime_seconds": time.time() - registry.started,
+        "average_extraction_time_ms": registry.mean_ms("job_duration_seconds", kind="extract"),
+        "average_qa_time_ms": registry.mean_ms("http_request_duration_seconds", route="/ask/"),
+        **registry.snapshot()
+    }
+
+
+@router.get("/status")
+async def status():
+    """System resources, queue depth and cache statistics"""
+    try:
+        registry = get_metrics()
+        provider = get_default_provider()
+        llm_cache = get_llm_cache()
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "uptime_seconds": time.time() - registry.started,
+            "system": _system(),
+            "jobs": {"pending": get_job_queue().pending},
+            "caches": {
+                "answers": get_answer_cache().stats(),
+                "embeddings": get_embedding_service().stats(),
+                "text": get_text_cache().stats(),
+                "llm_responses": llm_cache.stats() if llm_cache is not None else None
+            },
+            "webhooks": await run_in_threadpool(get_webhook_dispatcher().stats),
+            "llm": provider.stats() if isinstance(provider, RemoteLLMProvider) else {"provider": provider.name}
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin_token)])
+async def list_profiles():
+    """Recently profiled requests, newest first"""
+    return get_profiler().list()
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def get_profile(profile_id: str, format: str = Query("json", pattern="^(json|collapsed|spans)$")):
+    """
+    Get one request profile
+
+    Needs the ``X-Admin-Token`` header, as does listing profiles.
+
+    Query Parameters:
+    - format: ``json`` (default) for the span tree and sampled stacks,
+      ``collapsed`` for the stacks as folded lines, or ``spans`` for the
+      span tree as folded lines weighted by microseconds; both folded
+      formats load into flamegraph.pl, speedscope and inferno
+    """
+    profile = get_profiler().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    if format == "spans":
+        return PlainTextResponse(profile.collapsed_spans())
+    return profile.to_dict()
@@ -1,40 +1,258 @@
 """Question Answering Router"""
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from contextlib import contextmanager
+from typing import Dict, Optional, List
 import asyncio
 import json
+import time
+
+from app.core.config import get_settings
+from app.services.answer_cache import get_answer_cache
+from app.services.embedding_service import get_embedding_service
+from app.services.llm_service import get_default_provider, pack_questions
+from app.services.metrics import get_metrics
+from app.services.retrieval import RETRIEVAL_MODES, retrieve, retrieve_many
+from app.services.streaming import coalesce_tokens
 
 router = APIRouter()
 
+settings = get_settings()
+
 
 class AskRequest(BaseModel):
     """Question asking request"""
     question: str
     document_ids: Optional[List[str]] = None
     top_k: int = 5
+    mode: Optional[str] = None
+
+
+class BatchAskRequest(BaseModel):
+    """Several questions over the same documents"""
+    questions: List[str]
+    document_ids: Optional[List[str]] = None
+    top_k: int = 5
+    mode: Optional[str] = None
+    stream: bool = False
+
+
+def _check_mode(mode: Optional[str]):
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RETRIEVAL_MODES)}")
+
+
+@contextmanager
+def _stage(timings: Dict[str, float], name: str):
+    """Time one step of answering into the stage histograms and the request's timings"""
+    with get_metrics().timer("stage_duration_seconds", pipeline="ask", stage=name) as timing:
+        yield
+    timings[name] = timing.seconds
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+async def _cache_lookup(
+    question: str,
+    document_ids: Optional[List[str]],
+    top_k: int,
+    mode: Optional[str],
+    timings: Dict[str, float]
+):
+    """
+    Look a question up in the answer cache
+    
+    Returns:
+    - (scope, question embedding or None, cached answer or None)
+    """
+    mode = mode or settings.retrieval_mode
+    cache = get_answer_cache()
+    scope = cache.scope(document_ids, mode, top_k)
+    # Lexical mode never loads the embedding model, so only exact matches apply
+    embedding = None
+    if mode != "lexical":
+        with _stage(timings, "embed"):
+            embedding = (await get_embedding_service().aembed_batch([question]))[0]
+    with _stage(timings, "cache"):
+        cached = cache.get(scope, question, embedding)
+    return scope, embedding, cached
 
 
 @router.post("/")
-async def ask_question(request: AskRequest):
-    """Ask a question about contracts"""
+async def ask_question(request: AskRequest, http_response: Response):
+    """
+    Ask a question about contracts
+    
+    The Server-Timing response header breaks the request down into its
+    embed, cache, retrieve and llm stages.
+    """
+    timings: Dict[str, float] = {}
     try:
-        return {
+        if request.document_ids is not None and not request.document_ids:
+            raise HTTPException(status_code=400, detail="No documents to search")
+        _check_mode(request.mode)
+        get_metrics().inc("queries_total", endpoint="ask")
+        
+        scope, embedding, cached = await _cache_lookup(
+            request.question, request.document_ids, request.top_k, request.mode, timings
+        )
+        if cached is not None:
+            http_response.headers["Server-Timing"] = _server_timing(timings)
+            return {**cached.response, "question": request.question, "cached": True}
+        
+        with _stage(timings, "retrieve"):
+            chunks = await retrieve(request.question, request.document_ids, request.top_k, request.mode)
+        if not chunks:
+            raise HTTPException(status_code=400, detail="No indexed content matches the requested documents")
+        
+        best = chunks[0]
+        provider = get_default_provider()
+        with _stage(timings, "llm"):
+            answer = await provider.answer_question(request.question, [c.text for c in chunks])
+        get_metrics().inc("llm_calls_total", operation="answer_question")
+        http_response.headers["Server-Timing"] = _server_timing(timings)
+        response = {
             "question": request.question,
-            "answer": "Feature not yet implemented",
-            "sources": [],
-            "confidence": 0.0
+            "answer": answer.strip(),
+            "sources": [chunk.to_source() for chunk in chunks],
+            "confidence": min(1.0, max(0.0, best.score))
         }
+        get_answer_cache().put(scope, request.question, response, embedding)
+        return {**response, "cached": False}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/batch")
+async def ask_batch(request: BatchAskRequest):
+    """
+    Answer several questions over one set of documents
+    
+    Questions are embedded in one pass and retrieved with a single
+    multi-query search. Questions that miss the answer cache are packed
+    into as few LLM calls as the context budget allows, each call sharing
+    the deduplicated chunks of its questions.
+    
+    Returns:
+    - {"results": [...], "llm_calls": n} with one result per question, in
+      request order, or NDJSON lines (each with its ``index``) as answers
+      complete when ``stream`` is set
+    """
+    try:
+        if not request.questions:
+            raise HTTPException(status_code=400, detail="No questions provided")
+        if request.document_ids is not None and not request.document_ids:
+            raise HTTPException(status_code=400, detail="No documents to search")
+        _check_mode(request.mode)
+        
+        questions = request.questions
+        get_metrics().inc("queries_total", len(questions), endpoint="batch")
+        timings: Dict[str, float] = {}
+        mode = request.mode or settings.retrieval_mode
+        cache = get_answer_cache()
+        scope = cache.scope(request.document_ids, mode, request.top_k)
+        embeddings = None
+        if mode != "lexical":
+            with _stage(timings, "embed"):
+                embeddings = await get_embedding_service().aembed_batch(questions)
+        
+        results: List[Optional[dict]] = [None] * len(questions)
+        misses = []
+        with _stage(timings, "cache"):
+            for i, question in enumerate(questions):
+                cached = cache.get(scope, question, None if embeddings is None else embeddings[i])
+                if cached is not None:
+                    results[i] = {**cached.response, "question": question, "cached": True}
+                else:
+                    misses.append(i)
+        
+        retrieved = {}
+        if misses:
+            with _stage(timings, "retrieve"):
+                chunk_lists = await retrieve_many(
+                    [questions[i] for i in misses], request.document_ids, request.top_k, mode,
+                    None if embeddings is None else embeddings[misses]
+                )
+            for i, chunks in zip(misses, chunk_lists):
+                if chunks:
+                    retrieved[i] = chunks
+                else:
+                    results[i] = {
+                        "question": questions[i],
+                        "error": "No indexed content matches the requested documents"
+                    }
+        
+        answerable = [i for i in misses if i in retrieved]
+        groups = [
+            [answerable[j] for j in group]
+            for group in pack_questions(
+                [[c.text for c in retrieved[i]] for i in answerable], settings.llm_context_tokens
+            )
+        ]
+        provider = get_default_provider()
+        
+        async def answer_group(group: List[int]) -> List[int]:
+            # Union of the group's chunks, deduplicated, in retrieval order
+            context = {}
+            for i in group:
+                for chunk in retrieved[i]:
+                    context.setdefault(chunk.chunk_id, chunk.text)
+            try:
+                with _stage(timings, "llm"):
+                    answers = await provider.answer_questions([questions[i] for i in group], list(context.values()))
+                get_metrics().inc("llm_calls_total", operation="answer_questions")
+            except Exception as e:
+                for i in group:
+                    results[i] = {"question": questions[i], "error": str(e)}
+                return group
+            for i, answer in zip(group, answers):
+                chunks = retrieved[i]
+                response = {
+                    "question": questions[i],
+                    "answer": answer.strip(),
+                    "sources": [chunk.to_source() for chunk in chunks],
+                    "confidence": min(1.0, max(0.0, chunks[0].score))
+                }
+                cache.put(scope, questions[i], response, None if embeddings is None else embeddings[i])
+                results[i] = {**response, "cached": False}
+            return group
+        
+        if not request.stream:
+            await asyncio.gather(*[answer_group(group) for group in groups])
+            return {"results": results, "llm_calls": len(groups)}
+        
+        async def ndjson_generator():
+            # Cache hits and unanswerable questions are ready immediately
+            for i in [i for i, result in enumerate(results) if result is not None]:
+                yield json.dumps({"index": i, **results[i]}) + "\n"
+            tasks = [asyncio.ensure_future(answer_group(group)) for group in groups]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    for i in await finished:
+                        yield json.dumps({"index": i, **results[i]}) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/stream")
 async def stream_answer(
+    request: Request,
     question: str = Query(...),
     document_ids: Optional[str] = Query(None),
-    top_k: int = Query(5)
+    top_k: int = Query(5),
+    mode: Optional[str] = Query(None)
 ):
     """
     Stream answer tokens using Server-Sent Events (SSE)
@@ -43,32 +261,85 @@ async def stream_answer(
     - question: The question to ask
     - document_ids: Optional comma-separated document IDs to search
     - top_k: Number of top results to consider
+    - mode: Retrieval mode (hybrid, lexical or vector)
     
     Returns:
     - SSE stream with answer tokens
     """
+    _check_mode(mode)
+    doc_ids = document_ids.split(',') if document_ids else None
+    started = time.perf_counter()
+    get_metrics().inc("queries_total", endpoint="stream")
+    
+    # Resolved before the stream starts, so failures get a status code as in /ask
+    timings: Dict[str, float] = {}
+    try:
+        scope, embedding, cached = await _cache_lookup(question, doc_ids, top_k, mode, timings)
+        chunks = []
+        if cached is None:
+            with _stage(timings, "retrieve"):
+                chunks = await retrieve(question, doc_ids, top_k, mode)
+            if not chunks:
+                raise HTTPException(status_code=400, detail="No indexed content matches the requested documents")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
     async def stream_generator():
+        tokens = None
         try:
-            # Simulate streaming response with SSE format
-            # In production, this would call LLM with streaming
+            if cached is not None:
+                # Replay the cached answer as a single frame
+                yield f"data: {json.dumps({'type': 'metadata', 'question': question, 'document_ids': doc_ids or [], 'sources': cached.response['sources'], 'cached': True})}\n\n"
+                yield f"data: {json.dumps({'type': 'token', 'token': cached.response['answer'], 'index': 0, 'count': 1})}\n\n"
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                yield f"data: {json.dumps({'type': 'done', 'total_tokens': 1, 'frames': 1, 'cached': True, 'ttft_ms': elapsed_ms, 'duration_ms': elapsed_ms})}\n\n"
+                return
             
             # Send initial metadata
-            yield f"data: {json.dumps({'type': 'metadata', 'question': question, 'document_ids': document_ids.split(',') if document_ids else []})}\n\n"
+            yield f"data: {json.dumps({'type': 'metadata', 'question': question, 'document_ids': doc_ids or [], 'sources': [c.to_source() for c in chunks], 'cached': False})}\n\n"
+            
+            provider = get_default_provider()
+            get_metrics().inc("llm_calls_total", operation="stream_answer")
+            tokens = coalesce_tokens(
+                provider.stream_answer(question, [c.text for c in chunks]),
+                max_chars=settings.stream_flush_chars,
+                max_delay_ms=settings.stream_flush_ms
+            )
             
-            # Simulate token streaming
-            sample_answer = "The contract contains standard terms with moderate risk factors. Key provisions include automatic renewal clauses, liability limitations, and indemnification obligations. Consider negotiating longer notice periods for renewal termination."
+            total_tokens = 0
+            frames = 0
+            ttft_ms = None
+            parts = []
+            async for batch in tokens:
+                if await request.is_disconnected():
+                    # Closing the coalescer cancels upstream generation
+                    return
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                    get_metrics().observe("ask_ttft_seconds", ttft_ms / 1000)
+                yield f"data: {json.dumps({'type': 'token', 'token': ''.join(batch), 'index': frames, 'count': len(batch)})}\n\n"
+                parts.extend(batch)
+                total_tokens += len(batch)
+                frames += 1
             
-            words = sample_answer.split()
-            for i, word in enumerate(words):
-                # Send each token/word as SSE event
-                yield f"data: {json.dumps({'type': 'token', 'token': word + ' ', 'index': i})}\n\n"
-                await asyncio.sleep(0.05)  # Simulate streaming delay
+            # Only complete answers are cached
+            get_answer_cache().put(scope, question, {
+                "question": question,
+                "answer": "".join(parts).strip(),
+                "sources": [c.to_source() for c in chunks],
+                "confidence": min(1.0, max(0.0, chunks[0].score))
+            }, embedding)
             
             # Send completion event
-            yield f"data: {json.dumps({'type': 'done', 'total_tokens': len(words)})}\n\n"
+            yield f"data: {json.dumps({'type': 'done', 'total_tokens': total_tokens, 'frames': frames, 'cached': False, 'provider': provider.name, 'ttft_ms': ttft_ms, 'duration_ms': (time.perf_counter() - started) * 1000})}\n\n"
             
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+        finally:
+            if tokens is not None:
+                await tokens.aclose()
     
     return StreamingResponse(
         stream_generator(),
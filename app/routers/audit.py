@@ -0,0 +1,154 @@
+"""Risk Audit Router"""
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import List, Optional
+import asyncio
+import json
+
+from app.services.audit_store import audit_document, get_audit_store
+from app.services.document_store import get_document_store
+from app.services.job_queue import QueueFullError, get_job_queue
+from app.services.pipelines import bulk_audit_path
+from app.services.risk_engine import SEVERITIES, select_rules
+
+router = APIRouter()
+
+
+def _require_document(document_id: str):
+    if get_document_store().get(document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+
+@router.post("/")
+async def run_audit(document_id: str = Query(...), force: bool = Query(False)):
+    """
+    Audit a contract for risky clauses
+
+    Query Parameters:
+    - document_id: Document to audit
+    - force: Re-run even if a current audit is stored
+
+    Returns:
+    - Summary and findings with severity, page and character offsets
+    """
+    try:
+        _require_document(document_id)
+        return await audit_document(document_id, force=force)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/findings/{document_id}")
+async def get_findings(document_id: str, severity: Optional[str] = Query(None)):
+    """Get audit findings for a document, optionally of one severity"""
+    try:
+        if severity is not None and severity not in SEVERITIES:
+            raise HTTPException(status_code=400, detail=f"severity must be one of {', '.join(SEVERITIES)}")
+        _require_document(document_id)
+        if await run_in_threadpool(get_audit_store().summary, document_id) is None:
+            await audit_document(document_id)
+        return await run_in_threadpool(get_audit_store().findings, document_id, severity)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/summary/{document_id}")
+async def get_summary(document_id: str):
+    """Get the audit summary for a document"""
+    try:
+        _require_document(document_id)
+        summary = await run_in_threadpool(get_audit_store().summary, document_id)
+        if summary is None:
+            summary = (await audit_document(document_id))["summary"]
+        return summary
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BulkAuditRequest(BaseModel):
+    """Portfolio audit: a rule set and a document filter"""
+    rules: Optional[List[str]] = None
+    document_ids: Optional[List[str]] = None
+    filename: Optional[str] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    force: bool = False
+
+
+@router.post("/bulk")
+async def bulk_audit(request: BulkAuditRequest):
+    """
+    Audit many documents in one background job
+
+    Returns:
+    - job_id; poll /jobs/{job_id} for progress and docs/sec, or read
+      /audit/bulk/{job_id}/stream for findings as NDJSON
+    """
+    try:
+        try:
+            select_rules(request.rules)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        filters = request.model_dump(exclude={"rules", "force"}, exclude_none=True, mode="json")
+        job_id = get_job_queue().submit(
+            "bulk_audit",
+            payload={"rules": request.rules, "filter": filters, "force": request.force}
+        )
+        return {"job_id": job_id, "status": "queued", "stream": f"/audit/bulk/{job_id}/stream"}
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/bulk/{job_id}/stream")
+async def stream_bulk_audit(job_id: str, poll_ms: int = Query(200, ge=10, le=5000)):
+    """
+    Stream a bulk audit's NDJSON output, following it until the job ends
+
+    Query Parameters:
+    - poll_ms: How often to check for new output while the job runs
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None or job["kind"] != "bulk_audit":
+        raise HTTPException(status_code=404, detail="Job not found")
+    path = bulk_audit_path(job_id)
+
+    async def ndjson_generator():
+        position = 0
+        buffered = ""
+        while True:
+            # Read the status before the file, so output written just before the job ended is not missed
+            job = await run_in_threadpool(queue.get, job_id)
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    f.seek(position)
+                    data = f.read()
+                    position = f.tell()
+                buffered += data
+                # Only complete lines; a partial line waits for the next poll
+                complete, _, buffered = buffered.rpartition("\n")
+                if complete:
+                    yield complete + "\n"
+            if job["status"] not in ("queued", "running"):
+                if job["status"] == "failed":
+                    yield json.dumps({"type": "error", "error": job["error"]}) + "\n"
+                return
+            await asyncio.sleep(poll_ms / 1000)
+
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
@@ -1,25 +1,61 @@
 """Field Extraction Router"""
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from typing import Optional
+import json
+
+from app.services.document_store import get_document_store
+from app.services.field_store import get_field_store
+from app.services.job_queue import QueueFullError, get_job_queue
 
 router = APIRouter()
 
 
 @router.post("/")
-async def extract_fields(document_id: str = Query(...)):
-    """Extract structured fields from contract"""
+async def extract_fields(document_id: str = Query(...), force: bool = Query(False)):
+    """
+    Extract structured fields from contract
+
+    Query Parameters:
+    - document_id: Document to extract from
+    - force: Recompute every field even if stored values are current
+
+    Returns:
+    - Stored fields when all are current, otherwise a queued job that
+      recomputes only the stale ones. An active job for the document is
+      reused; force on a job that is already running returns 409.
+    """
     try:
+        if get_document_store().get(document_id) is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+
+        if not force:
+            stored = get_field_store().get(document_id)
+            if stored is not None and not stored["stale"]:
+                return {**stored, "job_id": None, "status": "completed"}
+
+        queue = get_job_queue()
+        job_id = queue.submit("extract", document_id=document_id, payload={"force": force})
+        if force and not queue.payload(job_id).get("force"):
+            # An extraction without force was already active: a queued one
+            # takes the flag, a running one has already planned its fields
+            queue.submit("extract", document_id=document_id, payload={"force": True}, merge=True)
+            if queue.get(job_id)["status"] != "queued":
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Extraction job {job_id} is already running without force; retry once it finishes"
+                )
         return {
             "document_id": document_id,
-            "fields": {
-                "parties": "TBD",
-                "governing_law": "TBD",
-                "liability_cap": "TBD",
-                "payment_terms": "TBD",
-                "effective_date": "TBD"
-            },
+            "job_id": job_id,
+            "status": "queued",
             "message": "Extraction in progress"
         }
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -28,10 +64,31 @@ async def extract_fields(document_id: str = Query(...)):
 async def get_extracted_fields(document_id: str):
     """Get previously extracted fields"""
     try:
-        return {
-            "document_id": document_id,
-            "fields": {},
-            "message": "No extracted fields found"
-        }
+        stored = get_field_store().get(document_id)
+        if stored is None:
+            return {
+                "document_id": document_id,
+                "fields": {},
+                "message": "No extracted fields found"
+            }
+        return stored
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/export")
+async def export_fields(batch_size: int = Query(500, ge=1, le=5000)):
+    """
+    Export every extracted document as NDJSON
+
+    Query Parameters:
+    - batch_size: Documents read from the database per query
+
+    Returns:
+    - One JSON object per line, ordered by document id
+    """
+    async def ndjson_generator():
+        async for document in iterate_in_threadpool(get_field_store().iter_all(batch_size)):
+            yield json.dumps(document) + "\n"
+
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
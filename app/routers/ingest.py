@@ -1,63 +1,102 @@
 """PDF Ingestion Router"""
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
-import os
-from pathlib import Path
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import List, Optional
+
+from app.services.document_store import get_document_store
+from app.services.invalidation import delete_document as remove_document
+from app.services.job_queue import QueueFullError, get_job_queue
 
 router = APIRouter()
 
-UPLOAD_DIR = Path("./data/uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+def _resolve(document_id: str):
+    """Find a document by content hash, falling back to its filename"""
+    store = get_document_store()
+    document = store.get(document_id)
+    if document is None:
+        sha256 = store.resolve_filename(document_id)
+        document = store.get(sha256) if sha256 else None
+    return document
 
 
 @router.post("/")
 async def ingest_documents(files: List[UploadFile] = File(...)):
     """Upload and ingest PDF documents"""
     try:
+        store = get_document_store()
+        queue = get_job_queue()
         document_ids = []
         documents = []
-        
+        job_ids = []
+
         for file in files:
             if not file.filename.endswith('.pdf'):
                 raise HTTPException(status_code=400, detail="Only PDF files allowed")
-            
-            # Save file
-            file_path = UPLOAD_DIR / file.filename
-            content = await file.read()
-            
-            with open(file_path, "wb") as f:
-                f.write(content)
-            
-            document_ids.append(file.filename)
-            documents.append({
-                "id": file.filename,
-                "filename": file.filename,
-                "size": len(content)
-            })
-        
+
+            # Identical bytes resolve to the existing document and are not reprocessed
+            document = await store.put_upload(file)
+            entry = document.to_dict()
+
+            if not document.processed:
+                entry["job_id"] = queue.submit("ingest", document_id=document.id)
+                job_ids.append(entry["job_id"])
+
+            document_ids.append(document.id)
+            documents.append(entry)
+
         return {
             "document_ids": document_ids,
             "documents": documents,
+            "job_ids": job_ids,
             "message": f"Ingested {len(document_ids)} documents"
         }
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/documents")
-async def list_documents(skip: int = 0, limit: int = 10):
-    """List ingested documents"""
+async def list_documents(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    filename: Optional[str] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None
+):
+    """
+    List ingested documents
+    
+    Query Parameters:
+    - cursor: Opaque cursor from a previous page's X-Next-Cursor header
+    - filename: Filename prefix filter
+    - min_size / max_size: Size bounds in bytes
+    - uploaded_after / uploaded_before: Upload time bounds (UTC)
+    """
     try:
-        files = list(UPLOAD_DIR.glob("*.pdf"))[skip:skip+limit]
-        documents = [
-            {
-                "id": f.stem,
-                "filename": f.name,
-                "size": f.stat().st_size
-            }
-            for f in files
-        ]
-        return documents
+        documents, next_cursor = get_document_store().list(
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            filename=filename,
+            min_size=min_size,
+            max_size=max_size,
+            uploaded_after=uploaded_after,
+            uploaded_before=uploaded_before
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return [d.to_dict() for d in documents]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -66,28 +105,71 @@ async def list_documents(skip: int = 0, limit: int = 10):
 async def get_document(document_id: str):
     """Get document details"""
     try:
-        file_path = UPLOAD_DIR / f"{document_id}.pdf"
-        if not file_path.exists():
+        document = _resolve(document_id)
+        if document is None:
             raise HTTPException(status_code=404, detail="Document not found")
-        
-        return {
-            "id": document_id,
-            "filename": f"{document_id}.pdf",
-            "size": file_path.stat().st_size
-        }
+
+        return document.to_dict()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.put("/documents/{document_id}")
+async def replace_document(document_id: str, file: UploadFile = File(...)):
+    """
+    Upload a new version of a document
+
+    The new version is ingested under its own id. Once it is searchable the
+    previous version and everything derived from it are removed; chunks
+    whose text is unchanged reuse their stored embeddings.
+    """
+    try:
+        previous = _resolve(document_id)
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if not file.filename.endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="Only PDF files allowed")
+
+        document = await get_document_store().put_upload(file)
+        entry = document.to_dict()
+        entry["replaces"] = previous.id
+        if document.id == previous.id:
+            entry["message"] = "Document unchanged"
+        elif document.processed:
+            # Already indexed under its own id
+            entry["removed"] = await run_in_threadpool(remove_document, previous.id)
+        else:
+            # An ingest of the new content may already be queued or running;
+            # the replacement is merged into it rather than dropped
+            entry["job_id"] = get_job_queue().submit(
+                "ingest", document_id=document.id, payload={"replaces": [previous.id]}, merge=True
+            )
+            current = get_document_store().get(document.id)
+            if current is not None and current.processed:
+                # That job finished before it could see the merge
+                entry["removed"] = await run_in_threadpool(remove_document, previous.id)
+        return entry
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.delete("/documents/{document_id}")
 async def delete_document(document_id: str):
-    """Delete a document"""
+    """Delete a document and its index entries, fields, findings and cached answers"""
     try:
-        file_path = UPLOAD_DIR / f"{document_id}.pdf"
-        if not file_path.exists():
+        document = _resolve(document_id)
+        if document is None:
             raise HTTPException(status_code=404, detail="Document not found")
-        
-        file_path.unlink()
-        return {"message": f"Document {document_id} deleted"}
+
+        removed = await run_in_threadpool(remove_document, document.id)
+        return {"message": f"Document {document.id} deleted", "removed": removed}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
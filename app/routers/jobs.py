@@ -0,0 +1,20 @@
+"""Background Jobs Router"""
+from fastapi import APIRouter, HTTPException
+
+from app.services.job_queue import get_job_queue
+
+router = APIRouter()
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Get background job status"""
+    try:
+        job = get_job_queue().get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
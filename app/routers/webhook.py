@@ -0,0 +1,78 @@
+"""Webhook Router"""
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+
+from app.services.webhook_service import EVENT_TYPES, get_webhook_dispatcher
+
+router = APIRouter()
+
+
+class WebhookRegistration(BaseModel):
+    """Webhook registration request"""
+    url: str
+    events: List[str]
+    secret: Optional[str] = None
+
+
+@router.post("/register")
+async def register_webhook(request: WebhookRegistration):
+    """
+    Register a webhook endpoint
+
+    Deliveries are POSTed as JSON with ``event_type``, ``task_id``, ``data``
+    and ``timestamp``. Per-document events may arrive batched, with
+    ``batched: true`` and the individual events under ``data.events``.
+    When a secret is given, ``X-Webhook-Signature`` carries an HMAC-SHA256
+    of the body.
+    """
+    try:
+        if not request.url.startswith(("http://", "https://")):
+            raise HTTPException(status_code=400, detail="url must be an http(s) URL")
+        try:
+            webhook = await run_in_threadpool(
+                get_webhook_dispatcher().register, request.url, request.events, request.secret
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{e}; valid events: {', '.join(EVENT_TYPES)}")
+        return {**webhook, "message": "Webhook registered"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/list")
+async def list_webhooks():
+    """List registered webhooks"""
+    try:
+        return await run_in_threadpool(get_webhook_dispatcher().list)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{webhook_id}/deliveries")
+async def list_deliveries(
+    webhook_id: str,
+    status: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Recent deliveries to a webhook, optionally filtered by status (pending, delivered, failed)"""
+    try:
+        return await run_in_threadpool(get_webhook_dispatcher().deliveries, webhook_id, status, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/{webhook_id}")
+async def unregister_webhook(webhook_id: str):
+    """Unregister a webhook"""
+    try:
+        if not await run_in_threadpool(get_webhook_dispatcher().unregister, webhook_id):
+            raise HTTPException(status_code=404, detail="Webhook not found")
+        return {"message": f"Webhook {webhook_id} unregistered"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,365 @@
+"""Approximate nearest-neighbour search"""
+from typing import Dict, Iterable, List, Optional
+import json
+import os
+import time
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.vector_store import LocalVectorIndex, SearchHit, get_vector_index
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on L2-normalised rows, returning (k, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        # Reseed empty lists from random rows so every list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over a LocalVectorIndex
+
+    Rows are assigned to the nearest of ``nlist`` k-means centroids. A query
+    scores the centroids, then only the rows in the ``nprobe`` best lists;
+    raising ``nprobe`` trades latency for recall. Assignments are appended
+    to ``ivf.assign.i32`` as rows arrive, so inserts are incremental: new
+    rows sit in a tail that is scanned exhaustively until it grows large
+    enough to be merged into the sorted list layout.
+
+    Until the base index has ``min_rows`` rows, or when a ``document_ids``
+    filter leaves few enough rows to score directly, search is exact.
+
+    All state is guarded by the base index's read/write lock, so row
+    numbers, assignments and lists always agree during a search.
+    """
+
+    def __init__(
+        self,
+        base: LocalVectorIndex,
+        nprobe: int = 16,
+        min_rows: int = 50000,
+        exact_threshold: int = 20000
+    ):
+        self.base = base
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.exact_threshold = exact_threshold
+        self.centroids_path = base.root / "ivf.centroids.npy"
+        self.assign_path = base.root / "ivf.assign.i32"
+        self.header_path = base.root / "ivf.json"
+
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_rows = 0
+        self._order = np.empty(0, dtype=np.int64)
+        self._bounds = np.zeros(1, dtype=np.int64)
+        self._built_rows = 0
+        self._assigned_rows = 0
+        self._load()
+
+    # Persistence
+    def _load(self):
+        if not (self.centroids_path.exists() and self.header_path.exists()):
+            return
+        with open(self.header_path, "r", encoding="utf-8") as f:
+            self.trained_rows = json.load(f)["trained_rows"]
+        self.centroids = np.load(self.centroids_path)
+        self._assigned_rows = self.assign_path.stat().st_size // 4 if self.assign_path.exists() else 0
+        self._rebuild_lists()
+
+    def _assignments(self) -> np.ndarray:
+        if self._assigned_rows == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.memmap(self.assign_path, dtype=np.int32, mode="r", shape=(self._assigned_rows,))
+
+    def _rebuild_lists(self):
+        """Sort assigned rows by list so each list is a contiguous slice"""
+        assign = np.asarray(self._assignments())
+        self._order = np.argsort(assign, kind="stable")
+        self._bounds = np.searchsorted(assign[self._order], np.arange(len(self.centroids) + 1))
+        self._built_rows = len(assign)
+
+    # Building
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, nlist: Optional[int] = None, sample_size: int = 100000, iterations: int = 10):
+        """(Re)train centroids and reassign every row"""
+        # k-means runs on a copied sample, so searches continue meanwhile
+        with self.base.lock.read():
+            rows = len(self.base)
+            nlist = nlist or max(1, min(4096, int(4 * np.sqrt(rows))))
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(rows, size=min(rows, sample_size), replace=False))
+            sample = np.array(self.base.vectors()[sample_rows])
+        centroids = kmeans(sample, min(nlist, len(sample_rows)), iterations)
+
+        with self.base.lock.write():
+            # Rows may have been added or compacted away while training
+            rows = len(self.base)
+            vectors = self.base.vectors()
+            self.centroids = centroids
+            np.save(self.centroids_path, centroids)
+            tmp_path = self.assign_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                for start in range(0, rows, LocalVectorIndex.BLOCK_ROWS):
+                    block = vectors[start:start + LocalVectorIndex.BLOCK_ROWS]
+                    f.write(np.argmax(block @ centroids.T, axis=1).astype(np.int32).tobytes())
+            os.replace(tmp_path, self.assign_path)
+            self._assigned_rows = rows
+            self.trained_rows = rows
+            with open(self.header_path, "w", encoding="utf-8") as f:
+                json.dump({"trained_rows": rows, "nlist": len(centroids)}, f)
+            self._rebuild_lists()
+
+    def sync(self):
+        """
+        Bring the index up to date with the base index
+
+        Trains once the base is large enough, retrains when it has grown
+        8x since the last training, and otherwise assigns new rows to
+        existing centroids.
+        """
+        rows = len(self.base)
+        if rows < self.min_rows:
+            return
+        if not self.trained or rows > 8 * self.trained_rows:
+            self.train()
+            return
+
+        with self.base.lock.write():
+            rows = len(self.base)
+            if rows <= self._assigned_rows:
+                return
+            vectors = self.base.vectors()
+            with open(self.assign_path, "ab") as f:
+                for start in range(self._assigned_rows, rows, LocalVectorIndex.BLOCK_ROWS):
+                    block = vectors[start:min(start + LocalVectorIndex.BLOCK_ROWS, rows)]
+                    f.write(np.argmax(block @ self.centroids.T, axis=1).astype(np.int32).tobytes())
+            self._assigned_rows = rows
+            tail = self._assigned_rows - self._built_rows
+            if tail > max(10000, self._built_rows // 20):
+                self._rebuild_lists()
+
+    def compact(self) -> Optional[np.ndarray]:
+        """
+        Compact the base index and drop the removed rows' assignments
+
+        Both happen in one write section of the shared lock, so no search
+        sees renumbered rows with stale lists. Centroids are kept.
+
+        Returns:
+        - The base index's ``compact`` result
+        """
+        with self.base.lock.write():
+            kept = self.base._compact()
+            if kept is None or not self.trained:
+                return kept
+            assign = np.asarray(self._assignments())[kept[kept < self._assigned_rows]]
+            tmp_path = self.assign_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(assign.astype(np.int32).tobytes())
+            os.replace(tmp_path, self.assign_path)
+            self._assigned_rows = len(assign)
+            self._rebuild_lists()
+            return kept
+
+    # Search
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the nprobe lists closest to the query, plus the unmerged tail"""
+        centroid_scores = self.centroids @ query
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        parts = [self._order[self._bounds[i]:self._bounds[i + 1]] for i in lists]
+        parts.append(np.arange(self._built_rows, len(self.base)))
+        return np.concatenate(parts)
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        document_ids: Optional[Iterable[str]] = None,
+        nprobe: Optional[int] = None
+    ) -> List[SearchHit]:
+        """Approximate cosine top-k"""
+        with self.base.lock.read():
+            return self._search(query, top_k, document_ids, nprobe)
+
+    def _search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        document_ids: Optional[Iterable[str]],
+        nprobe: Optional[int]
+    ) -> List[SearchHit]:
+        if len(self.base) == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        mask = self.base.row_mask(document_ids)
+        if not self.trained:
+            if mask is None:
+                return self.base._search(query, top_k, None)
+            return self._score(query, np.flatnonzero(mask), top_k)
+        if mask is not None:
+            allowed = np.flatnonzero(mask)
+            if len(allowed) <= self.exact_threshold:
+                return self._score(query, allowed, top_k)
+
+        rows = self.candidates(query, nprobe or self.nprobe)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return self._score(query, rows, top_k)
+
+    def search_many(
+        self,
+        queries: np.ndarray,
+        top_k: int = 5,
+        document_ids: Optional[Iterable[str]] = None,
+        nprobe: Optional[int] = None
+    ) -> List[List[SearchHit]]:
+        """
+        Top-k for several queries at once
+
+        Candidate rows for every query are unioned and scored against all
+        queries with one matrix product per block, so a batch of questions
+        costs one pass over the candidates instead of one per question.
+        """
+        with self.base.lock.read():
+            return self._search_many(queries, top_k, document_ids, nprobe)
+
+    def _search_many(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        document_ids: Optional[Iterable[str]],
+        nprobe: Optional[int]
+    ) -> List[List[SearchHit]]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self.base) == 0 or top_k <= 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+
+        mask = self.base.row_mask(document_ids)
+        rows = None if mask is None else np.flatnonzero(mask)
+        if self.trained and (rows is None or len(rows) > self.exact_threshold):
+            probe = nprobe or self.nprobe
+            union = np.unique(np.concatenate([self.candidates(q, probe) for q in queries]))
+            rows = union if mask is None else union[mask[union]]
+        return self._score_many(queries, rows, top_k)
+
+    def _score_many(self, queries: np.ndarray, rows: Optional[np.ndarray], top_k: int) -> List[List[SearchHit]]:
+        """Exact top-k per query over the given rows (all rows when None)"""
+        vectors = self.base.vectors()
+        total = len(self.base) if rows is None else len(rows)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+        for start in range(0, total, LocalVectorIndex.BLOCK_ROWS):
+            end = min(start + LocalVectorIndex.BLOCK_ROWS, total)
+            block_rows = np.arange(start, end) if rows is None else rows[start:end]
+            block = vectors[start:end] if rows is None else vectors[block_rows]
+            scores = (block @ queries.T).T
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1)
+            if best_scores.shape[1] > top_k:
+                part = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_scores = np.take_along_axis(best_scores, part, axis=1)
+                best_rows = np.take_along_axis(best_rows, part, axis=1)
+
+        results = []
+        metadata_cache: Dict[int, Dict] = {}
+        for query_rows, query_scores in zip(best_rows, best_scores):
+            hits = []
+            for i in np.argsort(-query_scores):
+                row = int(query_rows[i])
+                if row not in metadata_cache:
+                    metadata_cache[row] = self.base._metadata(row)
+                hits.append(SearchHit(row=row, score=float(query_scores[i]), metadata=metadata_cache[row]))
+            results.append(hits)
+        return results
+
+    def _score(self, query: np.ndarray, rows: np.ndarray, top_k: int) -> List[SearchHit]:
+        if len(rows) == 0:
+            return []
+        rows = np.sort(rows)
+        scores = self.base.vectors()[rows] @ query
+        if len(scores) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[part], scores[part]
+        order = np.argsort(-scores)
+        return [
+            SearchHit(row=int(rows[i]), score=float(scores[i]), metadata=self.base._metadata(int(rows[i])))
+            for i in order
+        ]
+
+
+def benchmark(
+    index: IVFIndex,
+    queries: np.ndarray,
+    top_k: int = 10,
+    nprobes: Iterable[int] = (1, 4, 16, 64)
+) -> List[Dict]:
+    """
+    Compare IVF search against exact search
+
+    Returns one row per nprobe with recall@k and p50/p99 latency in
+    milliseconds; the exact baseline is reported with ``nprobe`` of None.
+    """
+    def timed(fn):
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append({hit.row for hit in fn(query)})
+            latencies.append((time.perf_counter() - start) * 1000)
+        return results, np.array(latencies)
+
+    exact, exact_latency = timed(lambda q: index.base.search(q, top_k))
+    report = [{
+        "nprobe": None,
+        "recall": 1.0,
+        "p50_ms": float(np.percentile(exact_latency, 50)),
+        "p99_ms": float(np.percentile(exact_latency, 99))
+    }]
+    for nprobe in nprobes:
+        approx, latency = timed(lambda q: index.search(q, top_k, nprobe=nprobe))
+        recall = np.mean([len(a & e) / max(1, len(e)) for a, e in zip(approx, exact)])
+        report.append({
+            "nprobe": nprobe,
+            "recall": float(recall),
+            "p50_ms": float(np.percentile(latency, 50)),
+            "p99_ms": float(np.percentile(latency, 99))
+        })
+    return report
+
+
+_ann: Optional[IVFIndex] = None
+
+
+def get_ann_index() -> IVFIndex:
+    """Get the shared approximate index"""
+    global _ann
+    if _ann is None:
+        settings = get_settings()
+        _ann = IVFIndex(
+            get_vector_index(),
+            nprobe=settings.ann_nprobe,
+            min_rows=settings.ann_min_rows
+        )
+    return _ann
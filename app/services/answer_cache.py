@@ -0,0 +1,157 @@
+"""Semantic answer cache for question answering"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Set, Tuple
+import re
+import threading
+
+import numpy as np
+
+from app.core.config import get_settings
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+# Scope used for questions asked across every document
+ALL_DOCUMENTS = "*"
+
+
+def normalize_question(question: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a question"""
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", question.lower())).strip()
+
+
+@dataclass
+class CachedAnswer:
+    """A stored answer and the question embedding it was cached under"""
+    question: str
+    response: Dict
+    embedding: Optional[np.ndarray]
+
+
+class AnswerCache:
+    """
+    Answers keyed by normalised question within a document scope
+
+    A scope is the retrieval mode, top_k and the set of document ids (or
+    every document). Lookups first try the exact normalised question and
+    then, when a query embedding is supplied, the cached question in the
+    same scope with the highest cosine similarity above ``threshold``.
+
+    A reverse index from document id to scopes lets ingest and delete drop
+    exactly the scopes a document can affect; changes to any document also
+    clear the all-documents scopes.
+    """
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._scopes: Dict[Tuple, "OrderedDict[str, CachedAnswer]"] = {}
+        self._by_document: Dict[str, Set[Tuple]] = {}
+        self._size = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def scope(document_ids: Optional[Iterable[str]], mode: str, top_k: int) -> Tuple:
+        """Cache scope for a request"""
+        documents = ALL_DOCUMENTS if document_ids is None else tuple(sorted(set(document_ids)))
+        return (mode, top_k, documents)
+
+    def get(self, scope: Tuple, question: str, embedding: Optional[np.ndarray] = None) -> Optional[CachedAnswer]:
+        """Cached answer for a question in a scope, or None"""
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries:
+                hit = entries.get(key)
+                if hit is not None:
+                    entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return hit
+
+                if embedding is not None:
+                    candidates = [(k, e) for k, e in entries.items() if e.embedding is not None]
+                    if candidates:
+                        matrix = np.stack([e.embedding for _, e in candidates])
+                        scores = matrix @ embedding
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.threshold:
+                            entries.move_to_end(candidates[best][0])
+                            self.semantic_hits += 1
+                            return candidates[best][1]
+            self.misses += 1
+            return None
+
+    def put(self, scope: Tuple, question: str, response: Dict, embedding: Optional[np.ndarray] = None):
+        """Store an answer"""
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._scopes.setdefault(scope, OrderedDict())
+            if key not in entries:
+                self._size += 1
+            entries[key] = CachedAnswer(question=question, response=response, embedding=embedding)
+            entries.move_to_end(key)
+            documents = scope[2]
+            if documents != ALL_DOCUMENTS:
+                for document_id in documents:
+                    self._by_document.setdefault(document_id, set()).add(scope)
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used entry of the largest scope until within bounds"""
+        while self._size > self.max_entries:
+            scope = max(self._scopes, key=lambda s: len(self._scopes[s]))
+            self._scopes[scope].popitem(last=False)
+            self._size -= 1
+            if not self._scopes[scope]:
+                self._drop_scope(scope)
+
+    def _drop_scope(self, scope: Tuple):
+        entries = self._scopes.pop(scope, None)
+        if entries:
+            self._size -= len(entries)
+        if scope[2] != ALL_DOCUMENTS:
+            for document_id in scope[2]:
+                scopes = self._by_document.get(document_id)
+                if scopes is not None:
+                    scopes.discard(scope)
+                    if not scopes:
+                        del self._by_document[document_id]
+
+    def invalidate_document(self, document_id: str):
+        """Forget answers that could depend on a document"""
+        with self._lock:
+            affected = set(self._by_document.get(document_id, ()))
+            affected.update(s for s in self._scopes if s[2] == ALL_DOCUMENTS)
+            for scope in affected:
+                self._drop_scope(scope)
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        """Hit-rate counters"""
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": self._size,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
+_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """Get the shared answer cache"""
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = AnswerCache(settings.answer_cache_size, settings.answer_cache_threshold)
+    return _cache
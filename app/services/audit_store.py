@@ -0,0 +1,162 @@
+"""Persistent risk audit results"""
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+import json
+
+from app.core.config import get_settings
+from app.models.database import Audit, AuditFinding, create_tables, get_session_local
+from app.services.llm_service import get_default_provider
+from app.services.metrics import get_metrics
+from app.services.pdf_service import EXTRACTOR_VERSION
+from app.services.risk_engine import RULESET_VERSION, Finding, get_risk_engine, summarize
+from app.services.text_cache import get_document_pages
+from app.services.webhook_service import get_webhook_dispatcher
+
+
+class AuditStore:
+    """
+    Audit summaries and findings per (document, rule set)
+
+    Each audit records the text extractor version it ran on, so an audit
+    is reusable exactly when both the document text and the rules are
+    unchanged.
+    """
+
+    def __init__(self, database_url: Optional[str] = None):
+        create_tables(database_url)
+        self.SessionLocal = get_session_local(database_url)
+
+    def save(
+        self,
+        document_id: str,
+        findings: Sequence[Finding],
+        summary: Dict,
+        llm_calls: int = 0,
+        ruleset_version: str = RULESET_VERSION
+    ):
+        """Replace the stored audit of a document under a rule set"""
+        self.save_many([(document_id, findings, summary, llm_calls)], ruleset_version)
+
+    def save_many(self, audits: Iterable, ruleset_version: str = RULESET_VERSION):
+        """Store (document_id, findings, summary, llm_calls) tuples in one transaction"""
+        now = datetime.utcnow()
+        with self.SessionLocal() as session:
+            for document_id, findings, summary, llm_calls in audits:
+                session.query(AuditFinding).filter(
+                    AuditFinding.document_id == document_id,
+                    AuditFinding.ruleset_version == ruleset_version
+                ).delete()
+                session.merge(Audit(
+                    document_id=document_id,
+                    ruleset_version=ruleset_version,
+                    text_version=EXTRACTOR_VERSION,
+                    summary=json.dumps(summary),
+                    llm_calls=llm_calls,
+                    created_at=now
+                ))
+                session.add_all([
+                    AuditFinding(document_id=document_id, ruleset_version=ruleset_version, **f.to_dict())
+                    for f in findings
+                ])
+            session.commit()
+
+    def audited(self, document_ids: Sequence[str], ruleset_version: str = RULESET_VERSION) -> Set[str]:
+        """The documents whose current text has been audited under a rule set"""
+        found: Set[str] = set()
+        with self.SessionLocal() as session:
+            # Stay well under SQLite's bound parameter limit
+            for i in range(0, len(document_ids), 500):
+                found.update(r[0] for r in session.query(Audit.document_id).filter(
+                    Audit.document_id.in_(document_ids[i:i + 500]),
+                    Audit.ruleset_version == ruleset_version,
+                    Audit.text_version == EXTRACTOR_VERSION
+                ))
+        return found
+
+    def summary(self, document_id: str, ruleset_version: str = RULESET_VERSION) -> Optional[Dict]:
+        """
+        Stored summary, or None if the document was never audited
+
+        Falls back to the most recent audit under any rule set, marked
+        ``current: false``.
+        """
+        with self.SessionLocal() as session:
+            row = session.get(Audit, (document_id, ruleset_version))
+            if row is None or row.text_version != EXTRACTOR_VERSION:
+                row = (
+                    session.query(Audit)
+                    .filter(Audit.document_id == document_id)
+                    .order_by(Audit.created_at.desc())
+                    .first()
+                )
+        if row is None:
+            return None
+        return {
+            **json.loads(row.summary),
+            "document_id": document_id,
+            "current": row.ruleset_version == ruleset_version and row.text_version == EXTRACTOR_VERSION,
+            "llm_calls": row.llm_calls,
+            "audited_at": row.created_at.isoformat()
+        }
+
+    def findings(
+        self,
+        document_id: str,
+        severity: Optional[str] = None,
+        ruleset_version: Optional[str] = None
+    ) -> List[Dict]:
+        """Findings of the latest audit (or the given rule set) in document order, optionally of one severity"""
+        if ruleset_version is None:
+            summary = self.summary(document_id)
+            if summary is None:
+                return []
+            ruleset_version = summary["ruleset_version"]
+        with self.SessionLocal() as session:
+            query = session.query(AuditFinding).filter(
+                AuditFinding.document_id == document_id,
+                AuditFinding.ruleset_version == ruleset_version
+            )
+            if severity is not None:
+                query = query.filter(AuditFinding.severity == severity)
+            rows = query.order_by(AuditFinding.start).all()
+        columns = [c.name for c in AuditFinding.__table__.columns if c.name not in ("id", "document_id", "ruleset_version")]
+        return [{name: getattr(row, name) for name in columns} for row in rows]
+
+    def delete(self, document_id: str):
+        """Forget every audit of a document"""
+        with self.SessionLocal() as session:
+            session.query(AuditFinding).filter(AuditFinding.document_id == document_id).delete()
+            session.query(Audit).filter(Audit.document_id == document_id).delete()
+            session.commit()
+
+
+_store: Optional[AuditStore] = None
+
+
+def get_audit_store() -> AuditStore:
+    """Get the shared audit store"""
+    global _store
+    if _store is None:
+        _store = AuditStore(get_settings().database_url)
+    return _store
+
+
+async def audit_document(document_id: str, force: bool = False) -> Dict:
+    """
+    Audit a stored document, reusing the stored result when text and rules are unchanged
+
+    Returns:
+    - {"document_id", "summary", "findings"}
+    """
+    store = get_audit_store()
+    summary = None if force else await run_in_threadpool(store.summary, document_id)
+    if summary is None or not summary["current"]:
+        pages = await run_in_threadpool(get_document_pages, document_id)
+        findings, llm_calls = await get_risk_engine().audit(pages, get_default_provider())
+        await run_in_threadpool(store.save, document_id, findings, summarize(findings), llm_calls)
+        get_metrics().inc("audit_runs_total", source="api")
+        summary = await run_in_threadpool(store.summary, document_id)
+        get_webhook_dispatcher().emit("audit_complete", {"document_id": document_id, "summary": summary})
+    findings = await run_in_threadpool(store.findings, document_id, None, summary["ruleset_version"])
+    return {"document_id": document_id, "summary": summary, "findings": findings}
@@ -0,0 +1,200 @@
+"""Clause-aware chunking of page text"""
+from dataclasses import dataclass
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import re
+
+from app.services.pdf_service import PageText
+
+# Words and individual punctuation marks; close to (a little under) subword token counts
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+# Ends of sentences and lines; periods in "1.5" or "U.S.C" are not followed by whitespace and
+# those after a digit ("1. Payment", "Section 2.") are left to the next boundary
+_BOUNDARY = re.compile(r"(?<!\d)[.;!?](?=\s)|\n")
+_LEADING_SPACE = re.compile(r"\s*")
+# Line openings that start a new section: "ARTICLE IV", "Section 5", "12.3 Payment", "INDEMNIFICATION"
+_HEADING = re.compile(
+    r"(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|SCHEDULE|Schedule|EXHIBIT|Exhibit)\s+[\dIVXLC]+\b"
+    r"|\d{1,2}(?:\.\d{1,2})*\.?\s+[A-Z]"
+    r"|[A-Z][A-Z0-9 ,&/-]{3,}(?=\n|$)"
+)
+
+# (page, document offset of the page, start, end, tokens, section); start/end index the page text
+_Unit = Tuple[PageText, int, int, int, int, Optional[str]]
+
+
+@dataclass
+class Chunk:
+    """
+    A span of a document sized for retrieval
+
+    ``start`` and ``end`` are offsets into the document text as joined by
+    ``risk_engine.document_text`` (pages separated by one newline), so a
+    citation can point at the exact characters.
+    """
+    index: int
+    text: str
+    page: int
+    page_end: int
+    start: int
+    end: int
+    tokens: int
+    section: Optional[str]
+
+    def to_dict(self, document_id: str) -> Dict:
+        """Chunk record as stored by the lexical and vector indexes"""
+        return {
+            "chunk_id": f"{document_id}:{self.index}",
+            "document_id": document_id,
+            "page": self.page,
+            "page_end": self.page_end,
+            "start": self.start,
+            "end": self.end,
+            "tokens": self.tokens,
+            "section": self.section,
+            "text": self.text
+        }
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count used for chunk budgets"""
+    return len(_TOKEN.findall(text))
+
+
+class ClauseChunker:
+    """
+    Split a stream of pages into token-bounded chunks along clause lines
+
+    Text is cut into units at sentence and line ends, tracked purely as
+    offsets. Units are packed into chunks of at most ``max_tokens``; when
+    a chunk fills up, the next one repeats up to ``overlap_tokens`` of its
+    trailing units. A section heading closes the current chunk (without
+    overlap, as the next section is unrelated) once it holds at least
+    ``min_tokens``, so small headings stay with their first clause. Units
+    longer than the budget are split at token boundaries.
+
+    Pages are consumed one at a time and each chunk's text is built with a
+    single slice per page it spans, so work is linear in the input and only
+    the pages under the current chunk are held in memory. A chunk crossing
+    a page break keeps the whitespace around it and any blank pages in
+    between, so its text is exactly the document text between its offsets.
+    """
+
+    def __init__(self, max_tokens: int = 200, overlap_tokens: int = 40, min_tokens: int = 32):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+
+    def _units(self, pages: Iterable[PageText], blank: Dict[int, PageText]) -> Iterator[Tuple[_Unit, bool]]:
+        """
+        Units in document order, each with whether it opens a new section
+
+        Pages with no units are recorded in ``blank`` by document offset,
+        for chunks that span them.
+        """
+        offset = 0
+        section = None
+        for page in pages:
+            text = page.text
+            if not text.strip():
+                blank[offset] = page
+                offset += len(text) + 1
+                continue
+            position = 0
+            ends = (m.start() if m.group() == "\n" else m.end() for m in _BOUNDARY.finditer(text))
+            for end in chain(ends, (len(text),)):
+                start = _LEADING_SPACE.match(text, position, end).end()
+                line_start = start == 0 or text.rfind("\n", position, start) != -1
+                position = end
+                if start >= end:
+                    continue
+                heading = line_start and _HEADING.match(text, start) is not None
+                if heading:
+                    line_end = text.find("\n", start, start + 80)
+                    section = text[start:line_end if line_end != -1 else min(end, start + 80)].strip()
+                tokens = len(_TOKEN.findall(text, start, end))
+                if tokens > self.max_tokens:
+                    yield from self._split(page, offset, start, end, section, heading)
+                elif tokens:
+                    yield (page, offset, start, end, tokens, section), heading
+            offset += len(text) + 1
+
+    def _split(self, page: PageText, offset: int, start: int, end: int, section: Optional[str], heading: bool):
+        """Cut an oversized unit into pieces that leave room for overlap"""
+        size = max(1, self.max_tokens - self.overlap_tokens)
+        piece_start, count = None, 0
+        last_end = start
+        for match in _TOKEN.finditer(page.text, start, end):
+            if piece_start is None:
+                piece_start = match.start()
+            count += 1
+            last_end = match.end()
+            if count == size:
+                yield (page, offset, piece_start, last_end, count, section), heading
+                heading = False
+                piece_start, count = None, 0
+        if piece_start is not None:
+            yield (page, offset, piece_start, last_end, count, section), heading
+
+    @staticmethod
+    def _build(index: int, units: List[_Unit], blank: Dict[int, PageText]) -> Chunk:
+        parts = []
+        first = last = 0
+        previous = None
+        # One slice per page spanned: from the first unit or the page start
+        # to the last unit or the page end, joined as document_text joins pages
+        while first < len(units):
+            page, offset = units[first][0], units[first][1]
+            last = first
+            while last + 1 < len(units) and units[last + 1][0] is page:
+                last += 1
+            if previous is not None:
+                parts.extend(blank[o].text for o in sorted(blank) if previous < o < offset)
+            start = units[first][2] if first == 0 else 0
+            end = units[last][3] if last == len(units) - 1 else len(page.text)
+            parts.append(page.text[start:end])
+            previous = offset
+            first = last + 1
+        head, tail = units[0], units[-1]
+        return Chunk(
+            index=index,
+            text="\n".join(parts),
+            page=head[0].number,
+            page_end=tail[0].number,
+            start=head[1] + head[2],
+            end=tail[1] + tail[3],
+            tokens=sum(unit[4] for unit in units),
+            section=head[5]
+        )
+
+    def chunk(self, pages: Iterable[PageText]) -> Iterator[Chunk]:
+        """Chunks in document order; ``pages`` may be a generator"""
+        current: List[_Unit] = []
+        blank: Dict[int, PageText] = {}
+        tokens = 0
+        index = 0
+        for unit, heading in self._units(pages, blank):
+            if heading and current and tokens >= self.min_tokens:
+                yield self._build(index, current, blank)
+                index += 1
+                current, tokens = [], 0
+            elif current and tokens + unit[4] > self.max_tokens:
+                yield self._build(index, current, blank)
+                index += 1
+                # Carry trailing units into the next chunk as overlap
+                keep, kept = len(current), 0
+                while keep > 0 and kept + current[keep - 1][4] <= self.overlap_tokens:
+                    keep -= 1
+                    kept += current[keep][4]
+                if kept + unit[4] > self.max_tokens:
+                    keep, kept = len(current), 0
+                current, tokens = current[keep:], kept
+            current.append(unit)
+            tokens += unit[4]
+            # Blank pages before the current chunk can no longer be spanned
+            for offset in [o for o in blank if o < current[0][1]]:
+                del blank[offset]
+        if current:
+            yield self._build(index, current, blank)
@@ -0,0 +1,269 @@
+"""Content-addressed document storage"""
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlalchemy import tuple_
+from typing import Dict, List, Optional, Tuple
+import base64
+import hashlib
+import os
+import threading
+import uuid
+
+from app.core.config import get_settings
+from app.models.database import Contract, ContractAlias, create_tables, get_session_local
+
+
+@dataclass
+class StoredDocument:
+    """A document blob and its metadata"""
+    id: str
+    filename: str
+    size: int
+    sha256: str
+    uploaded_at: str
+    processed: bool = False
+    duplicate: bool = False
+
+    @classmethod
+    def from_row(cls, row: Contract, duplicate: bool = False) -> "StoredDocument":
+        return cls(
+            id=row.id,
+            filename=row.filename,
+            size=row.size,
+            sha256=row.id,
+            uploaded_at=row.upload_date.isoformat(),
+            processed=bool(row.processed),
+            duplicate=duplicate
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def encode_cursor(upload_date: datetime, document_id: str) -> str:
+    """Opaque keyset cursor for the position after a document"""
+    raw = f"{upload_date.isoformat()}|{document_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, document_id = raw.split("|", 1)
+        return _naive_utc(datetime.fromisoformat(timestamp)), document_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Upload dates are stored as naive UTC; convert aware datetimes to match"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class DocumentStore:
+    """
+    PDF storage keyed by SHA-256 of the file contents
+
+    Blobs live under ``<root>/objects/<aa>/<sha256>.pdf`` and are catalogued
+    in the ``contracts`` table. Because the id is the content hash, uploading
+    identical bytes again is a primary-key lookup and returns the existing
+    document without touching any downstream processing. Listing uses keyset
+    pagination over the (upload_date, id) index, so a page costs the same at
+    any depth of the corpus.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        database_url: Optional[str] = None,
+        chunk_size: int = 1048576,
+        max_size: Optional[int] = None
+    ):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / "tmp"
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        create_tables(database_url)
+        self.SessionLocal = get_session_local(database_url)
+
+    # Paths
+    def object_path(self, sha256: str) -> Path:
+        """Location of the blob for a content hash"""
+        return self.objects_dir / sha256[:2] / f"{sha256}.pdf"
+
+    # Writes
+    async def put_upload(self, file: UploadFile) -> StoredDocument:
+        """
+        Stream an upload into the store
+
+        The upload is copied in bounded chunks to a temporary file while
+        being hashed, with writes offloaded to the threadpool. If a blob with
+        the same hash already exists the temporary copy is discarded and the
+        existing document is returned with ``duplicate=True``.
+        """
+        tmp_path = self.tmp_dir / f"{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = 0
+
+        out = await run_in_threadpool(open, tmp_path, "wb")
+        try:
+            while True:
+                chunk = await file.read(self.chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if self.max_size is not None and size > self.max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"{file.filename} exceeds maximum upload size of {self.max_size} bytes"
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+        except BaseException:
+            await run_in_threadpool(out.close)
+            tmp_path.unlink(missing_ok=True)
+            raise
+        await run_in_threadpool(out.close)
+
+        return await run_in_threadpool(self._commit, tmp_path, file.filename, size, digest.hexdigest())
+
+    def _commit(self, tmp_path: Path, filename: str, size: int, sha256: str) -> StoredDocument:
+        """Move a fully written temp file into place, or drop it if already stored"""
+        with self._lock, self.SessionLocal() as session:
+            existing = session.get(Contract, sha256)
+            if existing is not None:
+                tmp_path.unlink(missing_ok=True)
+                session.merge(ContractAlias(filename=filename, contract_id=sha256))
+                session.commit()
+                return StoredDocument.from_row(existing, duplicate=True)
+
+            dest = self.object_path(sha256)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, dest)
+
+            row = Contract(
+                id=sha256,
+                filename=filename,
+                size=size,
+                upload_date=datetime.now(timezone.utc).replace(tzinfo=None),
+                processed=False
+            )
+            session.add(row)
+            session.flush()
+            session.merge(ContractAlias(filename=filename, contract_id=sha256))
+            session.commit()
+            return StoredDocument.from_row(row)
+
+    def mark_processed(self, document_id: str, pages: Optional[int] = None):
+        """Flag a document as fully processed by the ingest pipeline"""
+        with self.SessionLocal() as session:
+            row = session.get(Contract, document_id)
+            if row is None:
+                return
+            row.processed = True
+            if pages is not None:
+                row.pages = pages
+            session.commit()
+
+    def delete(self, document_id: str) -> bool:
+        """Remove a document blob and its catalog entries"""
+        with self._lock, self.SessionLocal() as session:
+            row = session.get(Contract, document_id)
+            if row is None:
+                return False
+            session.query(ContractAlias).filter(ContractAlias.contract_id == document_id).delete()
+            session.delete(row)
+            session.commit()
+            self.object_path(document_id).unlink(missing_ok=True)
+            return True
+
+    # Reads
+    def get(self, document_id: str) -> Optional[StoredDocument]:
+        """Look up a document by id"""
+        with self.SessionLocal() as session:
+            row = session.get(Contract, document_id)
+            return StoredDocument.from_row(row) if row else None
+
+    def resolve_filename(self, filename: str) -> Optional[str]:
+        """Document id most recently uploaded under a filename"""
+        with self.SessionLocal() as session:
+            alias = session.get(ContractAlias, filename)
+            return alias.contract_id if alias else None
+
+    def list(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        filename: Optional[str] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        uploaded_after: Optional[datetime] = None,
+        uploaded_before: Optional[datetime] = None
+    ) -> Tuple[List[StoredDocument], Optional[str]]:
+        """
+        List documents in upload order
+
+        Pass the returned cursor back to fetch the next page; ``skip`` is
+        still honoured for offset pagination but costs O(skip).
+
+        Returns:
+        - (documents, next cursor or None when exhausted)
+        """
+        with self.SessionLocal() as session:
+            query = session.query(Contract)
+            if cursor:
+                after_date, after_id = decode_cursor(cursor)
+                query = query.filter(tuple_(Contract.upload_date, Contract.id) > (after_date, after_id))
+            if filename:
+                # Escapes % and _ so they match literally
+                query = query.filter(Contract.filename.startswith(filename, autoescape=True))
+            if min_size is not None:
+                query = query.filter(Contract.size >= min_size)
+            if max_size is not None:
+                query = query.filter(Contract.size <= max_size)
+            if uploaded_after is not None:
+                query = query.filter(Contract.upload_date >= _naive_utc(uploaded_after))
+            if uploaded_before is not None:
+                query = query.filter(Contract.upload_date < _naive_utc(uploaded_before))
+
+            rows = (
+                query.order_by(Contract.upload_date, Contract.id)
+                .offset(skip)
+                .limit(limit + 1)
+                .all()
+            )
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].upload_date, rows[-1].id)
+        return [StoredDocument.from_row(r) for r in rows], next_cursor
+
+
+_store: Optional[DocumentStore] = None
+
+
+def get_document_store() -> DocumentStore:
+    """Get the shared document store"""
+    global _store
+    if _store is None:
+        settings = get_settings()
+        _store = DocumentStore(
+            settings.upload_dir,
+            database_url=settings.database_url,
+            chunk_size=settings.upload_chunk_size,
+            max_size=settings.max_upload_size
+        )
+    return _store
@@ -0,0 +1,289 @@
+"""Text embeddings"""
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+import asyncio
+import hashlib
+import logging
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.metrics import get_metrics
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # pragma: no cover - optional heavy dependency
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder used when sentence-transformers is unavailable
+
+    Unigrams and bigrams are feature-hashed into a fixed-size signed vector.
+    It has no semantic knowledge but is deterministic, fast and good enough
+    for lexical-overlap similarity in offline and test setups.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _bucket(self, token: str):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def encode(self, texts: Sequence[str], normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                index, sign = self._bucket(feature)
+                out[row, index] += sign
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+class _ModelPool:
+    """Process-wide pool of loaded models, bounded by count with LRU eviction"""
+
+    def __init__(self, max_models: int):
+        self.max_models = max_models
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(name: str):
+        if name == "hashing":
+            return HashingEmbedder()
+        if SentenceTransformer is None:
+            logger.warning(
+                "sentence-transformers is not installed; embedding model %s is replaced by the hashing embedder",
+                name
+            )
+            return HashingEmbedder()
+        logger.info("Loading embedding model %s", name)
+        return SentenceTransformer(name)
+
+    def get(self, name: str):
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                return model
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # Loading takes seconds; only callers of the same model wait for it
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+            if model is None:
+                model = self._load(name)
+                with self._lock:
+                    self._models[name] = model
+                    while len(self._models) > self.max_models:
+                        self._models.popitem(last=False)
+                    self._loading.pop(name, None)
+        return model
+
+
+_model_pool: Optional[_ModelPool] = None
+_model_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> _ModelPool:
+    """Get the process-wide model pool"""
+    global _model_pool
+    with _model_pool_lock:
+        if _model_pool is None:
+            _model_pool = _ModelPool(get_settings().embedding_model_pool_size)
+        return _model_pool
+
+
+@dataclass
+class _Request:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+
+
+class EmbeddingService:
+    """
+    Batched, cached embedding service
+
+    Calls from any thread or event loop are queued to a single batching
+    thread that waits up to ``max_wait_ms`` for more work, merges pending
+    requests into one forward pass of at most ``max_batch_size`` texts, and
+    splits the result back out. Each text is keyed by its SHA-1 in an LRU
+    cache, so repeated boilerplate clauses never reach the model. Results
+    are L2-normalised float32 NumPy arrays.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        cache_size: Optional[int] = None
+    ):
+        settings = get_settings()
+        self.model_name = model_name or settings.embedding_model
+        self.max_batch_size = max_batch_size or settings.embedding_batch_size
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.embedding_max_wait_ms) / 1000.0
+        self.cache_size = cache_size if cache_size is not None else settings.embedding_cache_size
+
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._requests: "queue.Queue[_Request]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+
+    @property
+    def model(self):
+        return get_model_pool().get(self.model_name)
+
+    @property
+    def model_id(self) -> str:
+        """Name of the model actually producing vectors, ``hashing`` when it stands in for another"""
+        return "hashing" if isinstance(self.model, HashingEmbedder) else self.model_name
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    # Public API
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts, returning an (n, dim) float32 matrix"""
+        return self._submit(texts).result()
+
+    async def aembed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """Async variant of embed_batch"""
+        return await asyncio.wrap_future(self._submit(texts))
+
+    def embed_text(self, text: str) -> np.ndarray:
+        """Embed a single text, returning a (dim,) float32 vector"""
+        return self.embed_batch([text])[0]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a search query"""
+        return self.embed_text(query)
+
+    def stats(self) -> Dict:
+        """Cache and batching counters"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model_name,
+            "cache_entries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "batches": self.batches
+        }
+
+    # Batching
+    def _submit(self, texts: Sequence[str]) -> Future:
+        request = _Request(texts=list(texts))
+        if not request.texts:
+            request.future.set_result(np.zeros((0, self.dimension), dtype=np.float32))
+            return request.future
+        self._ensure_thread()
+        self._requests.put(request)
+        return request.future
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            count = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                count += len(request.texts)
+
+            try:
+                self._process(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _process(self, batch: List[_Request]):
+        """Resolve a merged batch against the cache and run one forward pass for the rest"""
+        keys = [[hashlib.sha1(t.encode("utf-8")).digest() for t in r.texts] for r in batch]
+
+        missing: Dict[bytes, str] = {}
+        for request, request_keys in zip(batch, keys):
+            for text, key in zip(request.texts, request_keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                elif key not in missing:
+                    self.cache_misses += 1
+                    missing[key] = text
+
+        computed: Dict[bytes, np.ndarray] = {}
+        if missing:
+            with get_metrics().timer("stage_duration_seconds", pipeline="embedding", stage="encode"):
+                vectors = np.asarray(
+                    self.model.encode(
+                        list(missing.values()),
+                        batch_size=self.max_batch_size,
+                        convert_to_numpy=True,
+                        normalize_embeddings=True,
+                        show_progress_bar=False
+                    ),
+                    dtype=np.float32
+                )
+            self.batches += 1
+            computed = dict(zip(missing.keys(), vectors))
+
+        for request, request_keys in zip(batch, keys):
+            rows = [computed[k] if k in computed else self._cache[k] for k in request_keys]
+            request.future.set_result(np.stack(rows).astype(np.float32, copy=False))
+
+        for key, vector in computed.items():
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Get the shared embedding service"""
+    global _service
+    if _service is None:
+        _service = EmbeddingService()
+    return _service
@@ -0,0 +1,320 @@
+"""Schema-driven contract field extraction"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import re
+
+from app.services.llm_service import LLMProvider, estimate_tokens
+from app.services.metrics import get_metrics
+from app.services.pdf_service import PageText
+
+# Rule results at or above this confidence skip the LLM
+RULE_CONFIDENCE = 0.9
+
+_MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+        ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+        ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"), ("december", "dec")
+    ], start=1)
+    for name in names
+}
+_MONTH = r"(?P<month>" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?"
+_DATE = re.compile(
+    r"(?P<iso>(?P<iy>\d{4})-(?P<im>\d{1,2})-(?P<id>\d{1,2}))"
+    r"|(?P<us>(?P<um>\d{1,2})/(?P<ud>\d{1,2})/(?P<uy>\d{4}))"
+    rf"|(?:{_MONTH}\s+(?P<md>\d{{1,2}})(?:st|nd|rd|th)?,?\s+(?P<my>\d{{4}}))"
+    rf"|(?:(?P<dd>\d{{1,2}})(?:st|nd|rd|th)?(?:\s+day)?\s+(?:of\s+)?(?P<dmonth>" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?,?\s+(?P<dy>\d{4}))",
+    re.IGNORECASE
+)
+_AMOUNT = re.compile(
+    r"(?P<currency>USD|EUR|GBP|US\$|\$|€|£)\s?(?P<number>\d[\d,]*(?:\.\d+)?)"
+    r"(?:\s?(?P<scale>million|thousand|m\b|k\b))?",
+    re.IGNORECASE
+)
+_CURRENCIES = {"$": "USD", "us$": "USD", "usd": "USD", "€": "EUR", "eur": "EUR", "£": "GBP", "gbp": "GBP"}
+_SCALES = {"million": 1_000_000, "m": 1_000_000, "thousand": 1_000, "k": 1_000}
+
+_GOVERNING_LAW = re.compile(
+    r"governed\s+by,?\s+(?:and\s+(?:construed|interpreted)\s+(?:in\s+accordance\s+with|under),?\s+)?"
+    r"the\s+laws?\s+of\s+(?:the\s+)?(?:(?:State|Commonwealth|Province)\s+of\s+)?"
+    r"(?P<jurisdiction>[A-Z][\w.]*(?:\s+(?:of\s+)?[A-Z][\w.]*){0,3})"
+)
+_PAYMENT_DAYS = re.compile(
+    r"(?:net\s+(?P<net>\d{1,3})\b)"
+    r"|(?:within\s+(?:\w+\s+)?\(?(?P<days>\d{1,3})\)?\s+(?:calendar\s+|business\s+)?days\s+"
+    r"(?:of|after|from|following)\s+(?:the\s+)?(?:date\s+of\s+)?(?:receipt\s+of\s+)?(?:the\s+|an?\s+|each\s+)?invoice)",
+    re.IGNORECASE
+)
+_PARTIES = re.compile(
+    r"\bbetween\s+(?P<first>[A-Z][^,;()\n]{1,80}?)(?:\s*\([^)]*\))?,?\s+and\s+"
+    r"(?P<second>[A-Z][^,;()\n]{1,80}?)(?=\s*[,;.(]|\s+(?:effective|dated|as\s+of)\b|$)"
+)
+_CAP_CONTEXT = re.compile(r"(?:shall\s+not\s+exceed|limited\s+to|in\s+no\s+event\s+exceed|cap(?:ped)?\s+(?:at|of))", re.IGNORECASE)
+
+
+@dataclass
+class FieldSpec:
+    """A field to extract: where to look and how to settle it without an LLM"""
+    name: str
+    description: str
+    anchors: str
+    resolve: Callable[[str], Optional[Tuple[Any, float]]]
+    max_windows: int = 3
+    # Bump when the resolver changes meaning; anchors and description are fingerprinted already
+    version: str = "1"
+
+    @property
+    def fingerprint(self) -> str:
+        """Changes whenever stored values for this field may be out of date"""
+        key = "\x1f".join((self.name, self.description, self.anchors, str(self.max_windows), self.version))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class Candidate:
+    """A window of document text near an anchor for one field"""
+    field: str
+    page: int
+    start: int
+    end: int
+    text: str
+
+
+@dataclass
+class ExtractionResult:
+    """Field values with their provenance"""
+    fields: Dict[str, Any]
+    confidence: Dict[str, float]
+    method: Dict[str, Optional[str]]
+    llm_calls: int = 0
+    document_tokens: int = 0
+    llm_tokens: int = 0
+    pages: Dict[str, List[int]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {
+            "fields": self.fields,
+            "confidence": self.confidence,
+            "method": self.method,
+            "pages": self.pages,
+            "llm_calls": self.llm_calls,
+            "tokens": {"document": self.document_tokens, "llm": self.llm_tokens},
+            "schema_version": SCHEMA_VERSION
+        }
+
+
+# Deterministic resolvers
+def parse_date(text: str) -> Optional[str]:
+    """First recognisable date in text as ISO 8601"""
+    for match in _DATE.finditer(text):
+        g = match.groupdict()
+        try:
+            if g["iso"]:
+                value = date(int(g["iy"]), int(g["im"]), int(g["id"]))
+            elif g["us"]:
+                value = date(int(g["uy"]), int(g["um"]), int(g["ud"]))
+            elif g["month"]:
+                value = date(int(g["my"]), _MONTHS[g["month"].lower()], int(g["md"]))
+            else:
+                value = date(int(g["dy"]), _MONTHS[g["dmonth"].lower()], int(g["dd"]))
+        except ValueError:
+            continue
+        return value.isoformat()
+    return None
+
+
+def parse_amount(text: str) -> Optional[str]:
+    """First currency amount in text, normalised to e.g. ``USD 1,000,000``"""
+    match = _AMOUNT.search(text)
+    if match is None:
+        return None
+    amount = float(match.group("number").replace(",", ""))
+    scale = (match.group("scale") or "").lower()
+    amount *= _SCALES.get(scale, 1)
+    currency = _CURRENCIES[match.group("currency").lower()]
+    return f"{currency} {amount:,.0f}" if amount.is_integer() else f"{currency} {amount:,.2f}"
+
+
+def _resolve_effective_date(text: str) -> Optional[Tuple[Any, float]]:
+    anchored = re.search(r"effective(?:\s+date)?(?:\s+(?:as\s+of|on|from))?[\s:,]*", text, re.IGNORECASE)
+    if anchored:
+        value = parse_date(text[anchored.end():anchored.end() + 60])
+        if value:
+            return value, 0.95
+    value = parse_date(text)
+    return (value, 0.6) if value else None
+
+
+def _resolve_governing_law(text: str) -> Optional[Tuple[Any, float]]:
+    match = _GOVERNING_LAW.search(text)
+    if match:
+        return match.group("jurisdiction").rstrip("."), 0.95
+    return None
+
+
+def _resolve_liability_cap(text: str) -> Optional[Tuple[Any, float]]:
+    for anchor in _CAP_CONTEXT.finditer(text):
+        value = parse_amount(text[anchor.end():anchor.end() + 80])
+        if value:
+            return value, 0.9
+    value = parse_amount(text)
+    return (value, 0.5) if value else None
+
+
+def _resolve_payment_terms(text: str) -> Optional[Tuple[Any, float]]:
+    match = _PAYMENT_DAYS.search(text)
+    if match:
+        return f"Net {match.group('net') or match.group('days')}", 0.9
+    return None
+
+
+def _resolve_parties(text: str) -> Optional[Tuple[Any, float]]:
+    match = _PARTIES.search(text)
+    if match:
+        parties = [match.group("first").strip(), match.group("second").strip()]
+        # Party names are free text; agreement on a pattern is only a hint
+        return parties, 0.8
+    return None
+
+
+SCHEMA: Sequence[FieldSpec] = (
+    FieldSpec(
+        "parties", "The legal names of the contracting parties",
+        r"\b(?:by\s+and\s+between|between|parties|party)\b", _resolve_parties, max_windows=2
+    ),
+    FieldSpec(
+        "governing_law", "The jurisdiction whose law governs the agreement",
+        r"\b(?:governed\s+by|governing\s+law|laws\s+of)\b", _resolve_governing_law
+    ),
+    FieldSpec(
+        "liability_cap", "The maximum aggregate liability, as an amount or formula",
+        r"\b(?:limitation\s+of\s+liability|liability|aggregate)\b", _resolve_liability_cap
+    ),
+    FieldSpec(
+        "payment_terms", "When invoices must be paid",
+        r"\b(?:payment|invoice[sd]?|net\s+\d+)\b", _resolve_payment_terms
+    ),
+    FieldSpec(
+        "effective_date", "The date the agreement takes effect, as YYYY-MM-DD",
+        r"\b(?:effective|commencement\s+date|dated)\b", _resolve_effective_date
+    ),
+)
+
+# Identifies the schema as a whole; stored fields are matched per field fingerprint
+SCHEMA_VERSION = hashlib.sha1(",".join(spec.fingerprint for spec in SCHEMA).encode("ascii")).hexdigest()[:12]
+
+
+class FieldExtractor:
+    """
+    Extract the schema fields from page text
+
+    A single scan with the combined anchor regex collects small windows of
+    text around keywords for each field. Deterministic resolvers run on
+    those windows first; fields they settle with at least
+    ``RULE_CONFIDENCE`` never reach the LLM. The rest are sent together, as
+    their windows only, in one provider call per document.
+    """
+
+    def __init__(self, schema: Sequence[FieldSpec] = SCHEMA, window_chars: int = 300):
+        self.schema = list(schema)
+        self.window_chars = window_chars
+        # One alternation with a named group per field finds every anchor in a single scan
+        self._anchors = re.compile("|".join(f"(?P<{spec.name}>{spec.anchors})" for spec in self.schema), re.IGNORECASE)
+
+    def candidates(self, pages: Sequence[PageText]) -> Dict[str, List[Candidate]]:
+        """Anchor windows per field, merged where they overlap"""
+        limits = {spec.name: spec.max_windows for spec in self.schema}
+        found: Dict[str, List[Candidate]] = {spec.name: [] for spec in self.schema}
+        for page in pages:
+            text = page.text
+            for match in self._anchors.finditer(text):
+                name = match.lastgroup
+                if name not in found:
+                    continue
+                windows = found[name]
+                start = max(0, match.start() - self.window_chars // 3)
+                end = min(len(text), match.end() + self.window_chars)
+                last = windows[-1] if windows else None
+                if last is not None and last.page == page.number and start <= last.end:
+                    last.end = max(last.end, end)
+                    last.text = text[last.start:last.end]
+                elif len(windows) < limits[name]:
+                    windows.append(Candidate(name, page.number, start, end, text[start:end]))
+        return found
+
+    async def extract(self, pages: Sequence[PageText], provider: Optional[LLMProvider] = None) -> ExtractionResult:
+        """
+        Extract every schema field
+
+        Without a provider, low-confidence rule results are kept as they are.
+        """
+        found = self.candidates(pages)
+        result = ExtractionResult(
+            fields={spec.name: None for spec in self.schema},
+            confidence={spec.name: 0.0 for spec in self.schema},
+            method={spec.name: None for spec in self.schema},
+            document_tokens=sum(estimate_tokens(page.text) for page in pages)
+        )
+
+        unresolved: Dict[str, str] = {}
+        for spec in self.schema:
+            windows = found[spec.name]
+            result.pages[spec.name] = sorted({w.page for w in windows})
+            settled = None
+            for window in windows:
+                settled = spec.resolve(window.text)
+                if settled is not None:
+                    break
+            if settled is not None:
+                value, confidence = settled
+                result.fields[spec.name] = value
+                result.confidence[spec.name] = confidence
+                result.method[spec.name] = "rule"
+                if confidence >= RULE_CONFIDENCE:
+                    continue
+            if windows:
+                unresolved[spec.name] = spec.description
+
+        if unresolved and provider is not None:
+            context = self.llm_context(found, unresolved)
+            result.llm_tokens = estimate_tokens(context)
+            metrics = get_metrics()
+            with metrics.timer("stage_duration_seconds", pipeline="extract", stage="llm"):
+                answers = await provider.extract_fields(context, unresolved)
+            metrics.inc("llm_calls_total", operation="extract_fields")
+            result.llm_calls = 1
+            for name in unresolved:
+                value = answers.get(name)
+                if value not in (None, "", []):
+                    result.fields[name] = value
+                    result.confidence[name] = max(result.confidence[name], 0.7)
+                    result.method[name] = "llm"
+        return result
+
+    @staticmethod
+    def llm_context(found: Dict[str, List[Candidate]], fields: Dict[str, str]) -> str:
+        """Candidate windows for the given fields, deduplicated and labelled by page"""
+        seen = set()
+        sections = []
+        for name in fields:
+            for window in found[name]:
+                key = (window.page, window.start, window.end)
+                if key in seen:
+                    continue
+                seen.add(key)
+                sections.append(f"[page {window.page}]\n{window.text.strip()}")
+        return "\n\n".join(sections)
+
+
+def resolve_fields(text: str, fields: Sequence[str]) -> Dict[str, Any]:
+    """Best rule-based value for each field in text, regardless of confidence"""
+    specs = {spec.name: spec for spec in SCHEMA}
+    values: Dict[str, Any] = {}
+    for name in fields:
+        spec = specs.get(name)
+        settled = spec.resolve(text) if spec is not None else None
+        values[name] = settled[0] if settled else None
+    return values
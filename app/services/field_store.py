@@ -0,0 +1,126 @@
+"""Persistent store of extracted contract fields"""
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+import json
+
+from app.core.config import get_settings
+from app.models.database import ExtractedField, create_tables, get_session_local
+from app.services.field_extractor import SCHEMA, SCHEMA_VERSION, ExtractionResult, FieldSpec
+from app.services.pdf_service import EXTRACTOR_VERSION
+
+
+class FieldStore:
+    """
+    Extracted field values keyed by (document hash, field)
+
+    Each row records the fingerprint of the field definition and the text
+    extractor version it was computed with, so a schema change only marks
+    the added or changed fields stale and re-extraction can skip the rest.
+    """
+
+    def __init__(self, database_url: Optional[str] = None, schema: Sequence[FieldSpec] = SCHEMA):
+        create_tables(database_url)
+        self.SessionLocal = get_session_local(database_url)
+        self.schema = list(schema)
+
+    def _is_current(self, row: ExtractedField, spec: FieldSpec) -> bool:
+        return row.fingerprint == spec.fingerprint and row.extractor_version == EXTRACTOR_VERSION
+
+    def stale_fields(self, document_id: str) -> List[FieldSpec]:
+        """Schema fields with no stored value for the current definition"""
+        with self.SessionLocal() as session:
+            rows = {
+                row.field: row
+                for row in session.query(ExtractedField).filter(ExtractedField.document_id == document_id)
+            }
+        return [spec for spec in self.schema if spec.name not in rows or not self._is_current(rows[spec.name], spec)]
+
+    def save(self, document_id: str, result: ExtractionResult):
+        """Store the fields in an extraction result, replacing older values"""
+        specs = {spec.name: spec for spec in self.schema}
+        now = datetime.utcnow()
+        with self.SessionLocal() as session:
+            for name, value in result.fields.items():
+                session.merge(ExtractedField(
+                    document_id=document_id,
+                    field=name,
+                    value=json.dumps(value),
+                    confidence=result.confidence.get(name, 0.0),
+                    method=result.method.get(name),
+                    pages=json.dumps(result.pages.get(name, [])),
+                    fingerprint=specs[name].fingerprint,
+                    extractor_version=EXTRACTOR_VERSION,
+                    updated_at=now
+                ))
+            # Fields dropped from the schema
+            session.query(ExtractedField).filter(
+                ExtractedField.document_id == document_id,
+                ExtractedField.field.notin_(list(specs))
+            ).delete(synchronize_session=False)
+            session.commit()
+
+    def _to_dict(self, document_id: str, rows: List[ExtractedField]) -> Dict:
+        specs = {spec.name: spec for spec in self.schema}
+        current = {row.field: row for row in rows if row.field in specs and self._is_current(row, specs[row.field])}
+        return {
+            "document_id": document_id,
+            "fields": {name: json.loads(current[name].value) for name in specs if name in current},
+            "confidence": {name: current[name].confidence for name in specs if name in current},
+            "method": {name: current[name].method for name in specs if name in current},
+            "pages": {name: json.loads(current[name].pages or "[]") for name in specs if name in current},
+            "stale": [name for name in specs if name not in current],
+            "schema_version": SCHEMA_VERSION,
+            "updated_at": max(row.updated_at for row in rows).isoformat()
+        }
+
+    def get(self, document_id: str) -> Optional[Dict]:
+        """Stored fields for a document, or None if it was never extracted"""
+        with self.SessionLocal() as session:
+            rows = session.query(ExtractedField).filter(ExtractedField.document_id == document_id).all()
+        if not rows:
+            return None
+        return self._to_dict(document_id, rows)
+
+    def delete(self, document_id: str):
+        """Forget every field of a document"""
+        with self.SessionLocal() as session:
+            session.query(ExtractedField).filter(ExtractedField.document_id == document_id).delete()
+            session.commit()
+
+    def iter_all(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Every extracted document in id order, read in keyset-paginated batches"""
+        last_id = ""
+        while True:
+            with self.SessionLocal() as session:
+                ids = [
+                    r[0] for r in session.query(ExtractedField.document_id)
+                    .filter(ExtractedField.document_id > last_id)
+                    .distinct()
+                    .order_by(ExtractedField.document_id)
+                    .limit(batch_size)
+                ]
+                if not ids:
+                    return
+                rows = (
+                    session.query(ExtractedField)
+                    .filter(ExtractedField.document_id.in_(ids))
+                    .order_by(ExtractedField.document_id)
+                    .all()
+                )
+            grouped: Dict[str, List[ExtractedField]] = {}
+            for row in rows:
+                grouped.setdefault(row.document_id, []).append(row)
+            for document_id in ids:
+                yield self._to_dict(document_id, grouped[document_id])
+            last_id = ids[-1]
+
+
+_store: Optional[FieldStore] = None
+
+
+def get_field_store() -> FieldStore:
+    """Get the shared field store"""
+    global _store
+    if _store is None:
+        _store = FieldStore(get_settings().database_url)
+    return _store
@@ -0,0 +1,68 @@
+"""Removal of everything derived from a document"""
+from typing import Dict, Optional
+import logging
+
+from app.core.config import get_settings
+from app.services.answer_cache import get_answer_cache
+from app.services.audit_store import get_audit_store
+from app.services.document_store import get_document_store
+from app.services.field_store import get_field_store
+from app.services.job_queue import ACTIVE_STATUSES, QueueFullError, get_job_queue
+from app.services.lexical_index import get_lexical_index
+from app.services.text_cache import get_text_cache
+from app.services.vector_store import get_vector_index
+
+logger = logging.getLogger(__name__)
+
+_compaction_job: Optional[str] = None
+
+
+def drop_derived(document_id: str) -> Dict[str, int]:
+    """
+    Remove a document's chunks, fields, findings, cached text and answers
+
+    Every store built from a document is listed here, so delete and replace
+    cannot miss one. Index removal touches only that document's entries:
+    its vector rows are tombstoned and its lexical postings deleted.
+
+    Returns:
+    - Number of vector rows and lexical chunks removed
+    """
+    removed = {
+        "vector_rows": get_vector_index().delete_document(document_id),
+        "lexical_chunks": get_lexical_index().delete_document(document_id)
+    }
+    get_field_store().delete(document_id)
+    get_audit_store().delete(document_id)
+    get_text_cache().invalidate(document_id)
+    get_answer_cache().invalidate_document(document_id)
+    schedule_compaction()
+    return removed
+
+
+def delete_document(document_id: str) -> Dict[str, int]:
+    """Remove a document and everything derived from it"""
+    removed = drop_derived(document_id)
+    get_document_store().delete(document_id)
+    return removed
+
+
+def schedule_compaction() -> Optional[str]:
+    """Queue a vector index compaction once enough rows are tombstoned, returning the job id"""
+    global _compaction_job
+    index = get_vector_index()
+    tombstoned = index.tombstoned_rows
+    if tombstoned == 0 or tombstoned < get_settings().index_compact_ratio * len(index):
+        return None
+    queue = get_job_queue()
+    if _compaction_job is not None:
+        job = queue.get(_compaction_job)
+        if job is not None and job["status"] in ACTIVE_STATUSES:
+            return _compaction_job
+    try:
+        _compaction_job = queue.submit("compact")
+    except QueueFullError:
+        # The next delete tries again
+        logger.warning("Job queue full, vector index compaction deferred")
+        return None
+    return _compaction_job
@@ -0,0 +1,354 @@
+"""Background job queue and worker pool"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+
+from app.core.config import get_settings
+from app.models.database import Job, create_tables, get_session_local
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+@dataclass
+class Stage:
+    """
+    One step of a job pipeline
+
+    ``fn`` is a coroutine run on the worker loop; it receives the job context
+    dict and returns a dict merged back into it. Stages offload blocking
+    work themselves: to the threadpool, or to the process pool through
+    ``JobQueue.run_cpu``. Context keys starting with ``_`` are kept in memory
+    only and are not persisted with the job result.
+    """
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobQueue:
+    """
+    Persistent job queue with a bounded worker pool
+
+    Jobs are recorded in the ``jobs`` table before they are queued, so work
+    that was queued or running when the process stopped is picked up again
+    on the next start. Workers run stages as coroutines on a dedicated event
+    loop thread, with at most ``io_workers`` jobs in flight at once; CPU-heavy
+    steps go to a process pool of ``cpu_workers`` via ``run_cpu`` (PDF pages
+    are parsed in the extractor's own pool). ``submit`` refuses
+    new work with ``QueueFullError`` once ``max_pending`` jobs are waiting.
+    """
+
+    def __init__(
+        self,
+        database_url: Optional[str] = None,
+        max_pending: int = 1000,
+        cpu_workers: int = 2,
+        io_workers: int = 8
+    ):
+        self.max_pending = max_pending
+        self.cpu_workers = cpu_workers
+        self.io_workers = io_workers
+        self.pipelines: Dict[str, List[Stage]] = {}
+
+        create_tables(database_url)
+        self.SessionLocal = get_session_local(database_url)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    # Pipelines
+    def register(self, kind: str, stages: List[Stage]):
+        """Register the stages run for a job kind"""
+        self.pipelines[kind] = list(stages)
+
+    # Lifecycle
+    def start(self):
+        """Start the worker loop and requeue unfinished jobs"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="job-queue", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+        for job_id in self._recover():
+            self._enqueue(job_id)
+
+    def stop(self):
+        """Stop workers and shut down the process pool"""
+        with self._lock:
+            if self._thread is None:
+                return
+            loop, thread = self._loop, self._thread
+            self._thread = None
+        asyncio.run_coroutine_threadsafe(self._cancel_workers(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run_loop(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.io_workers)]
+        loop.call_soon(ready.set)
+        loop.run_forever()
+        loop.close()
+
+    async def _cancel_workers(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        # LLM clients opened by job stages belong to this loop and must be closed on it
+        from app.services.llm_service import close_llm_providers
+        await close_llm_providers()
+
+    def _recover(self) -> List[str]:
+        """Reset interrupted jobs to queued and return all queued ids"""
+        with self.SessionLocal() as session:
+            jobs = (
+                session.query(Job)
+                .filter(Job.status.in_(ACTIVE_STATUSES))
+                .order_by(Job.created_at)
+                .all()
+            )
+            for job in jobs:
+                job.status = "queued"
+                job.stage = None
+            session.commit()
+            return [job.id for job in jobs]
+
+    # Submission
+    def submit(
+        self,
+        kind: str,
+        document_id: Optional[str] = None,
+        payload: Optional[Dict] = None,
+        merge: bool = False
+    ) -> str:
+        """
+        Persist and queue a job, returning its id
+
+        If a job of the same kind is already queued or running for the
+        document, its id is returned instead of creating a second one. With
+        ``merge``, ``payload`` is folded into that job's stored payload
+        (list values are extended, others replaced); a queued job starts
+        with it, and a running one sees it through ``payload``.
+        """
+        if kind not in self.pipelines:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.start()
+
+        with self.SessionLocal() as session:
+            if document_id is not None:
+                active = (
+                    session.query(Job)
+                    .filter(Job.kind == kind, Job.document_id == document_id, Job.status.in_(ACTIVE_STATUSES))
+                    .first()
+                )
+                if active is not None:
+                    if merge and payload:
+                        stored = json.loads(active.payload or "{}")
+                        for key, value in payload.items():
+                            if isinstance(value, list):
+                                stored[key] = stored.get(key, []) + [v for v in value if v not in stored.get(key, [])]
+                            else:
+                                stored[key] = value
+                        active.payload = json.dumps(stored)
+                        active.updated_at = _utcnow()
+                        session.commit()
+                    return active.id
+
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    raise QueueFullError(f"Job queue is full ({self.max_pending} pending)")
+
+            now = _utcnow()
+            job = Job(
+                id=uuid.uuid4().hex,
+                kind=kind,
+                document_id=document_id,
+                status="queued",
+                payload=json.dumps(payload or {}),
+                created_at=now,
+                updated_at=now
+            )
+            session.add(job)
+            session.commit()
+            job_id = job.id
+
+        self._enqueue(job_id)
+        return job_id
+
+    def _enqueue(self, job_id: str):
+        with self._lock:
+            self._pending += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._pending
+
+    # Status
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get job status as a dict"""
+        with self.SessionLocal() as session:
+            job = session.get(Job, job_id)
+            if job is None:
+                return None
+            return {
+                "id": job.id,
+                "kind": job.kind,
+                "document_id": job.document_id,
+                "status": job.status,
+                "stage": job.stage,
+                "result": json.loads(job.result) if job.result else None,
+                "error": job.error,
+                "created_at": job.created_at.isoformat(),
+                "updated_at": job.updated_at.isoformat()
+            }
+
+    def payload(self, job_id: str) -> Dict:
+        """Current stored payload of a job, including anything merged in since it started"""
+        with self.SessionLocal() as session:
+            job = session.get(Job, job_id)
+            return json.loads(job.payload or "{}") if job is not None else {}
+
+    def report(self, job_id: str, progress: Dict):
+        """
+        Publish progress for a running job
+
+        Stored as the job result until the job finishes, so ``get`` shows it
+        while the job is still running.
+        """
+        self._update(job_id, result=json.dumps(progress, default=str))
+
+    def _update(self, job_id: str, **fields):
+        with self.SessionLocal() as session:
+            job = session.get(Job, job_id)
+            if job is None:
+                return None
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = _utcnow()
+            session.commit()
+            return job
+
+    # Execution
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned like the PDF pool: forking the multi-threaded server is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.cpu_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run_cpu(self, fn: Callable, *args) -> Any:
+        """
+        Run a module-level function in the CPU process pool from a job stage
+
+        Workers are spawned, so ``fn`` and its arguments must be picklable and
+        ``fn`` importable from its module.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            with self._lock:
+                self._pending -= 1
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(None, lambda: self._update(job_id, status="running"))
+        if job is None:
+            return
+
+        context: Dict[str, Any] = json.loads(job.payload or "{}")
+        context["job_id"] = job.id
+        context["document_id"] = job.document_id
+
+        metrics = get_metrics()
+        started = time.perf_counter()
+        stage_name = None
+        try:
+            stages = self.pipelines.get(job.kind)
+            if stages is None:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            for stage in stages:
+                stage_name = stage.name
+                await loop.run_in_executor(None, lambda: self._update(job_id, stage=stage_name))
+                with metrics.timer("stage_duration_seconds", pipeline=job.kind, stage=stage_name):
+                    output = await stage.fn(context)
+                if output:
+                    context.update(output)
+        except Exception as e:
+            logger.exception("Job %s failed in stage %s", job_id, stage_name)
+            metrics.inc("jobs_total", kind=job.kind, status="failed")
+            await loop.run_in_executor(None, lambda: self._update(job_id, status="failed", error=str(e)))
+            return
+
+        metrics.inc("jobs_total", kind=job.kind, status="succeeded")
+        metrics.observe("job_duration_seconds", time.perf_counter() - started, kind=job.kind)
+
+        result = {k: v for k, v in context.items() if not k.startswith("_")}
+        await loop.run_in_executor(
+            None,
+            lambda: self._update(job_id, status="succeeded", stage=None, result=json.dumps(result, default=str))
+        )
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get the shared job queue"""
+    global _queue
+    if _queue is None:
+        settings = get_settings()
+        _queue = JobQueue(
+            database_url=settings.database_url,
+            max_pending=settings.job_queue_size,
+            cpu_workers=settings.job_cpu_workers,
+            io_workers=settings.job_io_workers
+        )
+        from app.services.pipelines import register_pipelines
+        register_pipelines(_queue)
+    return _queue
@@ -0,0 +1,257 @@
+"""BM25 inverted index"""
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+import math
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from app.core.config import get_settings
+
+_TOKEN = re.compile(r"\w+")
+# Thousands separators would split "$1,000,000" into three tokens
+_DIGIT_COMMA = re.compile(r"(?<=\d),(?=\d)")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from has have if in into is it its of on or
+such that the their then there these they this to was were which will with shall
+""".split())
+
+
+# Longest first; enough to conflate indemnify / indemnification / indemnities
+_SUFFIXES = ("ifications", "ification", "ations", "ation", "ities", "ity", "ies", "ing", "ify", "ed", "es", "s")
+
+
+def stem(token: str) -> str:
+    """Strip one common English suffix, keeping at least four characters"""
+    if token.isdigit():
+        return token
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, lightly stemmed word tokens with stopwords removed"""
+    text = _DIGIT_COMMA.sub("", text.lower())
+    return [stem(t) for t in _TOKEN.findall(text) if t not in STOPWORDS]
+
+
+@dataclass
+class LexicalHit:
+    """A chunk matched by BM25"""
+    chunk_id: str
+    document_id: str
+    page: Optional[int]
+    text: str
+    score: float
+
+
+class BM25Index:
+    """
+    On-disk inverted index with BM25 scoring
+
+    Backed by a standalone SQLite file: ``postings`` is a WITHOUT ROWID
+    table clustered on (term, chunk) and carries the term frequency and
+    chunk length, so scoring a query term is one range scan with no joins.
+    Document frequencies and corpus totals are maintained on insert, and
+    scores are accumulated with NumPy.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    chunk_id TEXT UNIQUE NOT NULL,
+                    document_id TEXT NOT NULL,
+                    page INTEGER,
+                    length INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_chunks_document_id ON chunks (document_id);
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    chunk INTEGER NOT NULL,
+                    tf INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (term, chunk)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS terms (
+                    term TEXT PRIMARY KEY,
+                    df INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS totals (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO totals VALUES ('chunks', 0), ('length', 0);
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    # Writes
+    def add(self, chunks: Sequence[Dict]):
+        """
+        Index chunks
+
+        Each chunk dict needs ``chunk_id``, ``document_id`` and ``text`` and
+        may carry ``page``. Chunks whose id is already indexed are skipped.
+        """
+        with self._write_lock, self._conn() as conn:
+            df: Counter = Counter()
+            postings = []
+            added_length = 0
+            added_chunks = 0
+            for chunk in chunks:
+                tokens = tokenize(chunk["text"])
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO chunks (chunk_id, document_id, page, length, text) VALUES (?, ?, ?, ?, ?)",
+                    (chunk["chunk_id"], chunk["document_id"], chunk.get("page"), len(tokens), chunk["text"])
+                )
+                if cursor.rowcount == 0:
+                    continue
+                row = cursor.lastrowid
+                counts = Counter(tokens)
+                postings.extend((term, row, tf, len(tokens)) for term, tf in counts.items())
+                df.update(counts.keys())
+                added_length += len(tokens)
+                added_chunks += 1
+
+            conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", postings)
+            conn.executemany(
+                "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                df.items()
+            )
+            conn.execute("UPDATE totals SET value = value + ? WHERE key = 'chunks'", (added_chunks,))
+            conn.execute("UPDATE totals SET value = value + ? WHERE key = 'length'", (added_length,))
+
+    def delete_document(self, document_id: str) -> int:
+        """
+        Remove a document's chunks, returning how many were removed
+
+        Postings are located by re-tokenizing the stored chunk text, so the
+        cost is proportional to the document rather than the index.
+        """
+        with self._write_lock, self._conn() as conn:
+            rows = conn.execute("SELECT id, length, text FROM chunks WHERE document_id = ?", (document_id,)).fetchall()
+            if not rows:
+                return 0
+            df: Counter = Counter()
+            postings = []
+            for row, _, text in rows:
+                terms = set(tokenize(text))
+                postings.extend((term, row) for term in terms)
+                df.update(terms)
+
+            conn.executemany("DELETE FROM postings WHERE term = ? AND chunk = ?", postings)
+            conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in df.items()])
+            conn.executemany("DELETE FROM terms WHERE term = ? AND df <= 0", [(term,) for term in df])
+            conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+            conn.execute("UPDATE totals SET value = value - ? WHERE key = 'chunks'", (len(rows),))
+            conn.execute("UPDATE totals SET value = value - ? WHERE key = 'length'", (sum(r[1] for r in rows),))
+            return len(rows)
+
+    # Reads
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT value FROM totals WHERE key = 'chunks'").fetchone()[0]
+
+    def search(self, query: str, top_k: int = 5, document_ids: Optional[Iterable[str]] = None) -> List[LexicalHit]:
+        """BM25 top-k, optionally restricted to some documents"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+        conn = self._conn()
+        totals = dict(conn.execute("SELECT key, value FROM totals"))
+        n_chunks = totals["chunks"]
+        if n_chunks == 0:
+            return []
+        avg_length = totals["length"] / n_chunks
+
+        allowed = None
+        if document_ids is not None:
+            document_ids = list(document_ids)
+            if not document_ids:
+                return []
+            placeholders = ",".join("?" * len(document_ids))
+            allowed = np.fromiter(
+                (r[0] for r in conn.execute(f"SELECT id FROM chunks WHERE document_id IN ({placeholders})", document_ids)),
+                dtype=np.int64
+            )
+
+        rows_parts, score_parts = [], []
+        for term in terms:
+            df_row = conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+            if df_row is None:
+                continue
+            idf = math.log(1 + (n_chunks - df_row[0] + 0.5) / (df_row[0] + 0.5))
+            data = np.array(conn.execute("SELECT chunk, tf, length FROM postings WHERE term = ?", (term,)).fetchall(), dtype=np.float64)
+            if len(data) == 0:
+                continue
+            tf, length = data[:, 1], data[:, 2]
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            rows_parts.append(data[:, 0].astype(np.int64))
+            score_parts.append(idf * tf * (self.k1 + 1) / norm)
+
+        if not rows_parts:
+            return []
+        rows = np.concatenate(rows_parts)
+        scores = np.concatenate(score_parts)
+        if allowed is not None:
+            keep = np.isin(rows, allowed)
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) == 0:
+            return []
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        totals_per_row = np.zeros(len(unique_rows))
+        np.add.at(totals_per_row, inverse, scores)
+
+        k = min(top_k, len(unique_rows))
+        best = np.argpartition(-totals_per_row, k - 1)[:k]
+        best = best[np.argsort(-totals_per_row[best])]
+
+        ids = [int(unique_rows[i]) for i in best]
+        placeholders = ",".join("?" * len(ids))
+        stored = {
+            r[0]: r for r in conn.execute(
+                f"SELECT id, chunk_id, document_id, page, text FROM chunks WHERE id IN ({placeholders})", ids
+            )
+        }
+        return [
+            LexicalHit(
+                chunk_id=stored[row][1],
+                document_id=stored[row][2],
+                page=stored[row][3],
+                text=stored[row][4],
+                score=float(totals_per_row[i])
+            )
+            for row, i in zip(ids, best)
+        ]
+
+
+_index: Optional[BM25Index] = None
+
+
+def get_lexical_index() -> BM25Index:
+    """Get the shared lexical index"""
+    global _index
+    if _index is None:
+        _index = BM25Index(get_settings().lexical_index_path)
+    return _index
@@ -0,0 +1,228 @@
+"""Persistent cache of LLM responses"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from app.core.config import get_settings
+
+
+def cache_key(provider: str, model: str, body: Dict) -> str:
+    """Key for one request: provider, model, and a hash of the prompt and every parameter"""
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{provider}:{model}:{digest}"
+
+
+class LLMResponseCache:
+    """
+    LLM responses on disk, with a small in-memory tier in front
+
+    Entries live in a standalone SQLite file under ``data/``. The most
+    recently used ones are also kept in memory, so a hot hit is a dict
+    lookup with no I/O. Eviction is least-recently-used by total response
+    size; ``ttl_s`` optionally expires entries by age. Access times for
+    memory hits are buffered and written with the next insert, so hits
+    never write to disk.
+
+    ``_lock`` guards only the in-memory state and is never held across
+    SQLite I/O, so memory-tier lookups from the event loop do not wait on
+    a disk write; ``_write_lock`` serialises the writers.
+
+    Stats are kept per caller (``answer``, ``extract``, ``review``...);
+    ``bytes_saved`` counts the request and response bytes that did not go
+    over the network.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 268435456, ttl_s: float = 0, memory_entries: int = 1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.memory_entries = memory_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # key -> (response, request bytes, created_at)
+        self._memory: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        with self._conn() as conn:
+            conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    caller TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    request_bytes INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at);
+                CREATE INDEX IF NOT EXISTS ix_responses_created_at ON responses (created_at);
+            """)
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, caller: str, outcome: str, amount: int = 1):
+        stats = self._stats.setdefault(caller, {"hits": 0, "misses": 0, "bytes_saved": 0})
+        stats[outcome] += amount
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_s) and now - created_at > self.ttl_s
+
+    def _remember(self, key: str, entry: Tuple[str, int, float]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_memory(self, key: str, caller: str) -> Optional[str]:
+        """Response from the memory tier, without touching disk; misses are not counted"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            now = time.time()
+            if self._expired(entry[2], now):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._touched[key] = now
+            self._count(caller, "hits")
+            self._count(caller, "bytes_saved", entry[1] + len(entry[0]))
+            return entry[0]
+
+    def get(self, key: str, caller: str) -> Optional[str]:
+        """Cached response, from memory or disk"""
+        response = self.get_memory(key, caller)
+        if response is not None:
+            return response
+        row = self._conn().execute(
+            "SELECT response, request_bytes, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        with self._lock:
+            if row is None or self._expired(row[2], now):
+                self._count(caller, "misses")
+                if row is not None:
+                    # Removed with the next write
+                    self._touched[key] = -1.0
+                return None
+            self._remember(key, tuple(row))
+            self._touched[key] = now
+            self._count(caller, "hits")
+            self._count(caller, "bytes_saved", row[1] + len(row[0]))
+        return row[0]
+
+    def put(self, key: str, caller: str, response: str, request_bytes: int):
+        """Store a response and evict least recently used entries beyond ``max_bytes``"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._remember(key, (response, request_bytes, now))
+            touched, self._touched = self._touched, {}
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for touched_key, accessed_at in touched.items():
+                    if accessed_at < 0:
+                        self._delete(conn, touched_key)
+                    else:
+                        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (accessed_at, touched_key))
+                self._delete(conn, key)
+                conn.execute(
+                    "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, caller, response, request_bytes, size, now, now)
+                )
+                self._bytes += size
+                evicted = self._evict(conn)
+        if evicted:
+            with self._lock:
+                for evicted_key in evicted:
+                    self._memory.pop(evicted_key, None)
+
+    def _delete(self, conn: sqlite3.Connection, key: str):
+        row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bytes -= row[0]
+
+    def _evict(self, conn: sqlite3.Connection) -> List[str]:
+        """Delete expired and least recently used rows, returning their keys; caller holds the write lock"""
+        evicted = []
+        if self.ttl_s:
+            expired = conn.execute(
+                "SELECT key, size FROM responses WHERE created_at < ?", (time.time() - self.ttl_s,)
+            ).fetchall()
+            for key, size in expired:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                evicted.append(key)
+                self._bytes -= size
+        while self._bytes > self.max_bytes:
+            oldest = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if self._bytes <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                evicted.append(key)
+                self._bytes -= size
+        return evicted
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        with self._write_lock:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM responses")
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Size and per-caller hit/miss/bytes-saved counters"""
+        with self._lock:
+            callers = {caller: dict(stats) for caller, stats in self._stats.items()}
+        hits = sum(s["hits"] for s in callers.values())
+        lookups = hits + sum(s["misses"] for s in callers.values())
+        return {
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_entries": len(self._memory),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "bytes_saved": sum(s["bytes_saved"] for s in callers.values()),
+            "callers": callers
+        }
+
+
+_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Get the shared LLM response cache, or None when it is disabled"""
+    global _cache
+    settings = get_settings()
+    if not settings.llm_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = LLMResponseCache(
+            settings.llm_cache_path,
+            max_bytes=settings.llm_cache_max_bytes,
+            ttl_s=settings.llm_cache_ttl_s,
+            memory_entries=settings.llm_cache_memory_entries
+        )
+    return _cache
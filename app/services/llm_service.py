@@ -0,0 +1,723 @@
+"""LLM providers"""
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import weakref
+
+import httpx
+
+from app.core.config import get_settings
+from app.services.lexical_index import tokenize
+from app.services.llm_cache import LLMResponseCache, cache_key, get_llm_cache
+from app.services.metrics import get_metrics
+
+_SENTENCE = re.compile(r"(?<=[.;:!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+def pack_questions(contexts: List[List[str]], budget_tokens: int) -> List[List[int]]:
+    """
+    Group questions so each group's shared context fits a token budget
+
+    ``contexts[i]`` holds the passages retrieved for question ``i``. Groups
+    are filled greedily in question order; passages already in a group
+    cost nothing extra, so questions over overlapping chunks pack tightly.
+    A question whose own context exceeds the budget gets a group to itself.
+
+    Returns:
+    - Lists of question indices
+    """
+    groups: List[List[int]] = []
+    seen: set = set()
+    used = 0
+    for index, passages in enumerate(contexts):
+        fresh = [p for p in dict.fromkeys(passages) if p not in seen]
+        cost = sum(estimate_tokens(p) for p in fresh)
+        if groups and used + cost > budget_tokens:
+            groups.append([])
+            seen, used = set(), 0
+            fresh = list(dict.fromkeys(passages))
+            cost = sum(estimate_tokens(p) for p in fresh)
+        if not groups:
+            groups.append([])
+        groups[-1].append(index)
+        seen.update(fresh)
+        used += cost
+    return groups
+
+
+class LLMProvider(ABC):
+    """Interface shared by every provider"""
+
+    name = "base"
+
+    @abstractmethod
+    def stream_answer(self, question: str, context: List[str]) -> AsyncIterator[str]:
+        """
+        Stream answer tokens for a question grounded in context passages
+
+        Closing the iterator (or cancelling the task consuming it) must stop
+        upstream generation.
+        """
+
+    async def answer_question(self, question: str, context: List[str]) -> str:
+        """Full answer for a question grounded in context passages"""
+        return "".join([token async for token in self.stream_answer(question, context)])
+
+    async def answer_questions(self, questions: List[str], context: List[str]) -> List[str]:
+        """
+        Answers for several questions sharing one context
+
+        Providers that can should override this to answer every question
+        in a single call; the default answers them one by one.
+        """
+        return [await self.answer_question(question, context) for question in questions]
+
+    async def review_clauses(self, clauses: List[Dict[str, str]]) -> List[Optional[bool]]:
+        """
+        Decide whether ambiguous clauses carry the stated risk, in one call
+
+        Each item has ``clause`` and ``risk``. Returns True (risk present),
+        False (not present) or None (no opinion) per clause; the default
+        has no opinion.
+        """
+        return [None] * len(clauses)
+
+    @abstractmethod
+    async def extract_fields(self, text: str, fields: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Extract structured fields from contract text in a single call
+
+        ``fields`` maps field names to descriptions and defaults to the full
+        extraction schema. Fields not found are returned as None.
+        """
+
+
+class LocalLLMProvider(LLMProvider):
+    """
+    Offline provider using extractive heuristics
+
+    Answers with the context sentences sharing the most words with the
+    question. No network calls, so it is the provider used in tests; see
+    ``StubLLMProvider`` for load testing the remote call path.
+    """
+
+    name = "local"
+
+    def __init__(self, max_sentences: int = 2):
+        self.max_sentences = max_sentences
+
+    def _select(self, question: str, context: List[str]) -> List[str]:
+        terms = set(tokenize(question))
+        scored = []
+        for position, passage in enumerate(context):
+            for sentence in _SENTENCE.split(passage.strip()):
+                words = set(tokenize(sentence))
+                overlap = len(terms & words)
+                if overlap:
+                    # Earlier passages are ranked higher by retrieval
+                    scored.append((overlap, -position, sentence.strip()))
+        scored.sort(reverse=True)
+        return [sentence for _, _, sentence in scored[:self.max_sentences]]
+
+    async def stream_answer(self, question: str, context: List[str]) -> AsyncIterator[str]:
+        sentences = self._select(question, context)
+        if not sentences:
+            yield "The provided documents do not answer this question."
+            return
+        for word in " ".join(sentences).split():
+            yield word + " "
+
+    async def extract_fields(self, text: str, fields: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        # Imported here: the extractor depends on this module
+        from app.services.field_extractor import SCHEMA, resolve_fields
+        names = list(fields) if fields is not None else [spec.name for spec in SCHEMA]
+        return resolve_fields(text, names)
+
+
+class LLMError(Exception):
+    """Raised when an upstream LLM call fails after retries"""
+
+
+class ConcurrencyLimiter:
+    """
+    Semaphore shared by every event loop in the process
+
+    Requests run on the API loop and on the job queue's loop, so an
+    ``asyncio.Semaphore`` (bound to one loop) cannot cap them together.
+    Waiters queue in FIFO order and are woken on their own loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed over as we were cancelled; pass it on
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            # Hand the slot straight to the next waiter
+            loop, future = self._waiters.popleft()
+        loop.call_soon_threadsafe(self._wake, future)
+
+    def _wake(self, future: asyncio.Future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that queues callers instead of rejecting them
+
+    Each caller reserves its cost up front and sleeps until the bucket
+    would have refilled enough, so a burst is spread out at the configured
+    rate in arrival order. A rate of zero or less means unlimited.
+    """
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens and return how long to wait before using them"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= cost
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, cost: float = 1.0):
+        delay = self.reserve(cost)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def _parse_json(text: str) -> Any:
+    """JSON from a model reply, tolerating prose or code fences around it"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        match = re.search(r"[\[{].*[\]}]", text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group())
+            except ValueError:
+                pass
+    return None
+
+
+def _numbered(prefix: str, items: List[str]) -> str:
+    return "\n".join(f"{prefix}{i}: {item}" for i, item in enumerate(items, 1))
+
+
+_ANSWER_PROMPT = (
+    "You answer questions about contracts using only the numbered context passages. "
+    "Be concise. If the passages do not contain the answer, say so."
+)
+_BATCH_PROMPT = (
+    "You answer several questions about contracts using only the numbered context passages. "
+    'Reply with JSON {"answers": [...]} holding one concise answer string per question, in order.'
+)
+_REVIEW_PROMPT = (
+    "You review contract clauses flagged by a rule engine. For each clause decide whether it "
+    'really carries the stated risk. Reply with JSON {"verdicts": [...]} holding true, false, '
+    "or null when unsure, one per clause, in order."
+)
+_EXTRACT_PROMPT = (
+    "You extract fields from contract excerpts. Reply with a JSON object keyed by field name; "
+    "use null for fields that are not stated."
+)
+
+
+class RemoteLLMProvider(LLMProvider):
+    """
+    Base for providers behind an HTTP API
+
+    Built for throughput under bursty load:
+
+    - one pooled ``httpx.AsyncClient`` per event loop, kept for the life of
+      the provider, so connections (and TLS sessions) are reused
+    - a process-wide concurrency cap and request/token rate buckets; excess
+      calls wait their turn rather than failing with 429s
+    - completed responses are served from the persistent response cache
+      before any limiter is touched, so repeated prompts cost nothing
+    - identical in-flight requests are coalesced: concurrent callers share
+      one upstream call, which is cancelled only when every caller is gone
+    - retries with backoff on 429/5xx, honouring ``Retry-After``
+
+    Batch answers, clause review and field extraction each take one call.
+    """
+
+    name = "remote"
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str,
+        max_tokens: int = 1024,
+        timeout_s: float = 60,
+        max_connections: int = 20,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 0,
+        max_retries: int = 2,
+        cache: Optional[LLMResponseCache] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_tokens = max_tokens
+        self.timeout_s = timeout_s
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.cache = cache
+        self.transport = transport
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60))
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60, max(1.0, tokens_per_minute / 6)) if tokens_per_minute else None
+        )
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, list]]" = weakref.WeakKeyDictionary()
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.errors = 0
+
+    # Provider specifics
+    @abstractmethod
+    def _endpoint(self) -> Tuple[str, Dict[str, str]]:
+        """Request path and headers"""
+
+    @abstractmethod
+    def _body(self, system: str, prompt: str, json_reply: bool, stream: bool) -> Dict[str, Any]:
+        """Request body for one completion"""
+
+    @abstractmethod
+    def _text(self, data: Dict[str, Any]) -> str:
+        """Completion text from a response body"""
+
+    @abstractmethod
+    def _delta(self, event: Dict[str, Any]) -> Optional[str]:
+        """Text carried by one streamed event, if any"""
+
+    # Transport
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout_s, connect=min(10.0, self.timeout_s)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                transport=self.transport
+            )
+            self._clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """
+        Close the pooled client of the running loop
+
+        A client can only be closed on the loop that opened it, so each loop
+        closes its own. Clients left behind by loops that have already shut
+        down are dropped here.
+        """
+        for loop in [loop for loop in self._clients if loop.is_closed()]:
+            del self._clients[loop]
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def _throttle(self, body: Dict[str, Any]):
+        await self.request_bucket.acquire()
+        if self.token_bucket is not None:
+            await self.token_bucket.acquire(estimate_tokens(json.dumps(body)) + self.max_tokens)
+
+    async def _post(self, body: Dict[str, Any]) -> str:
+        path, headers = self._endpoint()
+        metrics = get_metrics()
+        attempt = 0
+        while True:
+            await self._throttle(body)
+            await self.limiter.acquire()
+            try:
+                self.requests += 1
+                with metrics.timer("llm_request_duration_seconds", provider=self.name):
+                    response = await self._client().post(path, json=body, headers=headers)
+                retry_after = response.headers.get("retry-after")
+                status = response.status_code
+            except httpx.TransportError as e:
+                status, retry_after, error = None, None, e
+            finally:
+                self.limiter.release()
+
+            if status is not None and status < 400:
+                metrics.inc("llm_requests_total", provider=self.name, outcome="ok")
+                return self._text(response.json())
+            retryable = status is None or status == 429 or status >= 500
+            if not retryable or attempt >= self.max_retries:
+                self.errors += 1
+                metrics.inc("llm_requests_total", provider=self.name, outcome="error")
+                if status is None:
+                    raise LLMError(f"{self.name} request failed: {error}") from error
+                raise LLMError(f"{self.name} returned {status}: {response.text[:200]}")
+            attempt += 1
+            self.retries += 1
+            metrics.inc("llm_requests_total", provider=self.name, outcome="retry")
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+            await asyncio.sleep(delay)
+
+    async def _coalesced(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """Share one upstream call between concurrent callers with the same key"""
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.setdefault(loop, {})
+        entry = inflight.get(key)
+        if entry is None:
+            task = loop.create_task(asyncio.wait_for(call(), self.timeout_s))
+            entry = inflight[key] = [task, 0]
+            task.add_done_callback(lambda _: inflight.pop(key, None) if inflight.get(key) is entry else None)
+        else:
+            self.coalesced += 1
+            get_metrics().inc("llm_coalesced_total", provider=self.name)
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not entry[0].done():
+                # Last interested caller is gone, so stop the upstream call
+                entry[0].cancel()
+            raise
+        except asyncio.TimeoutError:
+            raise LLMError(f"{self.name} request timed out after {self.timeout_s}s") from None
+        finally:
+            entry[1] -= 1
+
+    async def _post_and_store(self, body: Dict[str, Any], key: str, caller: str) -> str:
+        text = await self._post(body)
+        if self.cache is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.cache.put, key, caller, text, len(json.dumps(body))
+            )
+        return text
+
+    async def complete(self, system: str, prompt: str, json_reply: bool = False, caller: str = "answer") -> str:
+        """
+        One completion, served from the response cache when possible
+
+        Misses are coalesced with identical in-flight requests. ``caller``
+        labels the cache statistics.
+        """
+        body = self._body(system, prompt, json_reply, stream=False)
+        key = cache_key(self.name, self.model, body)
+        if self.cache is not None:
+            text = self.cache.get_memory(key, caller)
+            if text is None:
+                text = await asyncio.get_running_loop().run_in_executor(None, self.cache.get, key, caller)
+            if text is not None:
+                return text
+        return await self._coalesced(key, lambda: self._post_and_store(body, key, caller))
+
+    # LLMProvider
+    @staticmethod
+    def _context(context: List[str]) -> str:
+        return "\n\n".join(f"[{i}] {passage}" for i, passage in enumerate(context, 1))
+
+    async def stream_answer(self, question: str, context: List[str]) -> AsyncIterator[str]:
+        body = self._body(_ANSWER_PROMPT, f"Context:\n{self._context(context)}\n\nQuestion: {question}", False, stream=True)
+        path, headers = self._endpoint()
+        await self._throttle(body)
+        await self.limiter.acquire()
+        try:
+            self.requests += 1
+            async with self._client().stream("POST", path, json=body, headers=headers) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    self.errors += 1
+                    raise LLMError(f"{self.name} returned {response.status_code}: {response.text[:200]}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    token = self._delta(json.loads(data))
+                    if token:
+                        yield token
+        finally:
+            self.limiter.release()
+
+    async def answer_question(self, question: str, context: List[str]) -> str:
+        return await self.complete(_ANSWER_PROMPT, f"Context:\n{self._context(context)}\n\nQuestion: {question}")
+
+    async def answer_questions(self, questions: List[str], context: List[str]) -> List[str]:
+        if len(questions) == 1:
+            return [await self.answer_question(questions[0], context)]
+        reply = _parse_json(await self.complete(
+            _BATCH_PROMPT,
+            f"Context:\n{self._context(context)}\n\nQuestions:\n{_numbered('Q', questions)}",
+            json_reply=True,
+            caller="answer_batch"
+        ))
+        answers = reply.get("answers") if isinstance(reply, dict) else reply
+        if isinstance(answers, list) and len(answers) == len(questions):
+            return [str(answer) for answer in answers]
+        # Malformed batch reply; fall back to one call per question
+        return await super().answer_questions(questions, context)
+
+    async def review_clauses(self, clauses: List[Dict[str, str]]) -> List[Optional[bool]]:
+        reply = _parse_json(await self.complete(
+            _REVIEW_PROMPT,
+            _numbered("C", [f"{c['clause']}\n   Risk: {c['risk']}" for c in clauses]),
+            json_reply=True,
+            caller="review"
+        ))
+        verdicts = reply.get("verdicts") if isinstance(reply, dict) else reply
+        if not isinstance(verdicts, list) or len(verdicts) != len(clauses):
+            return [None] * len(clauses)
+        return [v if isinstance(v, bool) else None for v in verdicts]
+
+    async def extract_fields(self, text: str, fields: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        if fields is None:
+            # Imported here: the extractor depends on this module
+            from app.services.field_extractor import SCHEMA
+            fields = {spec.name: spec.description for spec in SCHEMA}
+        listing = "\n".join(f"- {name}: {description}" for name, description in fields.items())
+        reply = _parse_json(await self.complete(
+            _EXTRACT_PROMPT, f"Fields:\n{listing}\n\nContract:\n{text}", json_reply=True, caller="extract"
+        ))
+        reply = reply if isinstance(reply, dict) else {}
+        return {name: reply.get(name) for name in fields}
+
+    def stats(self) -> Dict:
+        """Call counters and current queueing"""
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "errors": self.errors,
+            "active": self.limiter.active,
+            "waiting": self.limiter.waiting
+        }
+
+
+class OpenAIProvider(RemoteLLMProvider):
+    """OpenAI chat completions (or any compatible endpoint)"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+
+    def _endpoint(self) -> Tuple[str, Dict[str, str]]:
+        return "/chat/completions", {"Authorization": f"Bearer {self.api_key}"}
+
+    def _body(self, system: str, prompt: str, json_reply: bool, stream: bool) -> Dict[str, Any]:
+        body = {
+            "model": self.model,
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+            "max_tokens": self.max_tokens,
+            "temperature": 0,
+            "stream": stream
+        }
+        if json_reply:
+            body["response_format"] = {"type": "json_object"}
+        return body
+
+    def _text(self, data: Dict[str, Any]) -> str:
+        return data["choices"][0]["message"]["content"] or ""
+
+    def _delta(self, event: Dict[str, Any]) -> Optional[str]:
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+
+class AnthropicProvider(RemoteLLMProvider):
+    """Anthropic messages API"""
+
+    name = "anthropic"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+
+    def _endpoint(self) -> Tuple[str, Dict[str, str]]:
+        return "/messages", {"x-api-key": self.api_key, "anthropic-version": "2023-06-01"}
+
+    def _body(self, system: str, prompt: str, json_reply: bool, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.max_tokens,
+            "temperature": 0,
+            "stream": stream
+        }
+
+    def _text(self, data: Dict[str, Any]) -> str:
+        return "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+
+    def _delta(self, event: Dict[str, Any]) -> Optional[str]:
+        if event.get("type") == "content_block_delta":
+            return event.get("delta", {}).get("text")
+        return None
+
+
+class StubLLMProvider(OpenAIProvider):
+    """
+    OpenAI-compatible provider answered in-process after a fixed latency
+
+    Goes through the same pooling, limiting, rate buckets and coalescing as
+    the real providers, so throughput can be load tested offline. Replies
+    are well-formed but canned.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 200, **kwargs):
+        self.latency_s = latency_ms / 1000
+        kwargs.setdefault("model", "stub")
+        kwargs.setdefault("base_url", "http://llm-stub")
+        super().__init__(api_key="stub", transport=httpx.MockTransport(self._handle), **kwargs)
+
+    @staticmethod
+    def _reply(system: str, prompt: str) -> str:
+        if system == _BATCH_PROMPT:
+            count = len(re.findall(r"^Q\d+:", prompt, re.MULTILINE))
+            return json.dumps({"answers": [f"Stub answer {i}." for i in range(1, count + 1)]})
+        if system == _REVIEW_PROMPT:
+            return json.dumps({"verdicts": [None] * len(re.findall(r"^C\d+:", prompt, re.MULTILINE))})
+        if system == _EXTRACT_PROMPT:
+            return json.dumps({name: None for name in re.findall(r"^- (\w+):", prompt, re.MULTILINE)})
+        return "Stub answer."
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency_s)
+        body = json.loads(request.content)
+        text = self._reply(body["messages"][0]["content"], body["messages"][1]["content"])
+        if not body.get("stream"):
+            return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": text}}]})
+        events = [{"choices": [{"delta": {"content": word + " "}}]} for word in text.split()]
+        stream = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=stream.encode("utf-8"), headers={"content-type": "text/event-stream"})
+
+
+_providers: Dict[str, LLMProvider] = {}
+
+
+def get_llm_provider(name: Optional[str] = None) -> LLMProvider:
+    """Get the shared provider instance by name"""
+    name = name or get_settings().default_llm
+    provider = _providers.get(name)
+    if provider is None:
+        settings = get_settings()
+        if name == "local":
+            # Answered in-process, nothing worth caching
+            provider = LocalLLMProvider()
+            _providers[name] = provider
+            return provider
+        limits = dict(
+            max_tokens=settings.llm_max_tokens,
+            timeout_s=settings.llm_timeout_s,
+            max_connections=settings.llm_max_connections,
+            max_concurrency=settings.llm_max_concurrency,
+            requests_per_minute=settings.llm_requests_per_minute,
+            tokens_per_minute=settings.llm_tokens_per_minute,
+            max_retries=settings.llm_max_retries,
+            cache=get_llm_cache()
+        )
+        if name == "stub":
+            provider = StubLLMProvider(settings.llm_stub_latency_ms, **limits)
+        elif name == "openai":
+            if not settings.openai_api_key:
+                raise ValueError("OPENAI_API_KEY is not set")
+            provider = OpenAIProvider(
+                settings.openai_api_key, model=settings.openai_model, base_url=settings.openai_base_url, **limits
+            )
+        elif name == "anthropic":
+            if not settings.anthropic_api_key:
+                raise ValueError("ANTHROPIC_API_KEY is not set")
+            provider = AnthropicProvider(
+                settings.anthropic_api_key, model=settings.anthropic_model, base_url=settings.anthropic_base_url, **limits
+            )
+        else:
+            raise ValueError(f"Unsupported LLM provider: {name}")
+        _providers[name] = provider
+    return provider
+
+
+def get_default_provider() -> LLMProvider:
+    """Configured provider, falling back to the local one when it has no credentials"""
+    settings = get_settings()
+    if settings.default_llm in _providers:
+        return _providers[settings.default_llm]
+    try:
+        return get_llm_provider(settings.default_llm)
+    except ValueError:
+        return get_llm_provider("local")
+
+
+async def close_llm_providers():
+    """
+    Close pooled LLM clients opened on the running loop
+
+    Called by every loop that makes LLM calls before it stops: the app's
+    loop on shutdown and the job queue's worker loop.
+    """
+    for provider in list(_providers.values()):
+        if isinstance(provider, RemoteLLMProvider):
+            await provider.aclose()
@@ -0,0 +1,213 @@
+"""In-process metrics: counters and fixed-bucket latency histograms"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import threading
+import time
+
+from app.services.profiler import end_span, start_span
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Timing:
+    """Duration of a timed block, available once the block exits"""
+    __slots__ = ("seconds",)
+
+    def __init__(self):
+        self.seconds = 0.0
+
+
+def _key(name: str, labels: Dict[str, str]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Shard:
+    """Metrics written by one thread; only that thread ever mutates it"""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = {}
+        # [bucket counts..., +Inf count, sum]
+        self.histograms: Dict[Key, List[float]] = {}
+
+
+class Metrics:
+    """
+    Counters and histograms sharded per thread
+
+    Each thread writes to its own shard, so recording takes no lock: an
+    increment is a dict update and an observation is a bisect plus two
+    list updates. Readers merge the shards; copying a dict is atomic
+    under the GIL, so a snapshot never sees a half-applied update.
+    Histograms use fixed buckets, which keeps memory constant and lets
+    percentiles be estimated at read time.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    # Recording
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add to a counter"""
+        counters = self._shard().counters
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record a duration in a histogram"""
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(self.buckets) + 2)
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[Timing]:
+        """
+        Observe the duration of a block, including blocks that await
+
+        Inside a profiled request the block is also recorded as a span,
+        named after its label values (``ask.retrieve``).
+        """
+        timing = Timing()
+        span = start_span(name, labels)
+        started = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.perf_counter() - started
+            self.observe(name, timing.seconds, **labels)
+            if span is not None:
+                end_span(span)
+
+    # Reading
+    def _merged(self) -> Tuple[Dict[Key, float], Dict[Key, List[float]]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        counters: Dict[Key, float] = {}
+        histograms: Dict[Key, List[float]] = {}
+        for shard in shards:
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, values in dict(shard.histograms).items():
+                merged = histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+                for i, value in enumerate(list(values)):
+                    merged[i] += value
+        return counters, histograms
+
+    def counter(self, name: str, **labels) -> float:
+        """Current value of a counter; without labels, the sum over all label sets"""
+        counters, _ = self._merged()
+        if labels:
+            return counters.get(_key(name, labels), 0)
+        return sum(value for (n, _), value in counters.items() if n == name)
+
+    def _quantile(self, histogram: List[float], q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within its bucket"""
+        total = sum(histogram[:-1])
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(histogram[:-1]):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        """Counters and histogram summaries (count, mean and percentiles in ms) as JSON"""
+        counters, histograms = self._merged()
+
+        def label_str(labels) -> str:
+            return ",".join(f"{k}={v}" for k, v in labels)
+
+        result: Dict[str, Dict] = {"counters": {}, "histograms": {}}
+        for (name, labels), value in sorted(counters.items()):
+            result["counters"].setdefault(name, {})[label_str(labels)] = value
+        for (name, labels), histogram in sorted(histograms.items()):
+            count = int(sum(histogram[:-1]))
+            summary = {
+                "count": count,
+                "mean_ms": histogram[-1] / count * 1000 if count else None,
+            }
+            for q in (0.5, 0.95, 0.99):
+                value = self._quantile(histogram, q)
+                summary[f"p{int(q * 100)}_ms"] = value * 1000 if value is not None else None
+            result["histograms"].setdefault(name, {})[label_str(labels)] = summary
+        return result
+
+    def mean_ms(self, name: str, **labels) -> Optional[float]:
+        """Mean of a histogram across matching label sets"""
+        _, histograms = self._merged()
+        wanted = set(_key(name, labels)[1])
+        total, count = 0.0, 0
+        for (n, key_labels), histogram in histograms.items():
+            if n == name and wanted.issubset(key_labels):
+                total += histogram[-1]
+                count += sum(histogram[:-1])
+        return total / count * 1000 if count else None
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        counters, histograms = self._merged()
+
+        def fmt(labels, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(labels) + ([extra] if extra else [])
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], histogram[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{fmt(labels, ('le', str(bound)))} {int(cumulative)}")
+            lines.append(f"{name}_sum{fmt(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{fmt(labels)} {int(cumulative)}")
+        lines.append("# TYPE process_uptime_seconds gauge")
+        lines.append(f"process_uptime_seconds {time.time() - self.started}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Get the process-wide metrics registry"""
+    return _metrics
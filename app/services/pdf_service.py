@@ -0,0 +1,155 @@
+"""PDF text extraction"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import multiprocessing
+import re
+import threading
+
+from pypdf import PdfReader
+
+from app.core.config import get_settings
+
+try:
+    import pdfplumber
+except ImportError:  # pragma: no cover - optional layout fallback
+    pdfplumber = None
+
+# Bump whenever extraction output can change so cached text is invalidated
+EXTRACTOR_VERSION = "1"
+
+# A line with three or more runs of 2+ spaces is likely a table row
+_COLUMN_GAP = re.compile(r"\S {2,}\S")
+
+
+@dataclass
+class PageText:
+    """Text extracted from a single page"""
+    number: int
+    text: str
+    method: str
+
+
+def _needs_layout(text: str) -> bool:
+    """Whether a pypdf page result should be redone with pdfplumber"""
+    stripped = text.strip()
+    if len(stripped) < 20:
+        return True
+    lines = [line for line in stripped.splitlines() if line.strip()]
+    tabular = sum(1 for line in lines if len(_COLUMN_GAP.findall(line)) >= 3)
+    return tabular / len(lines) > 0.3
+
+
+def _extract_range(file_path: str, start: int, end: int, layout_fallback: bool) -> List[PageText]:
+    """
+    Extract pages [start, end) of a PDF
+
+    Runs in a worker process. pypdf handles the common case; pages that come
+    back empty or look tabular are re-extracted with pdfplumber's layout mode
+    when it is installed.
+    """
+    reader = PdfReader(file_path)
+    results = []
+    retry = []
+    for index in range(start, end):
+        text = reader.pages[index].extract_text() or ""
+        results.append(PageText(number=index + 1, text=text, method="pypdf"))
+        if layout_fallback and _needs_layout(text):
+            retry.append(index - start)
+
+    if retry and pdfplumber is not None:
+        with pdfplumber.open(file_path) as pdf:
+            for offset in retry:
+                text = pdf.pages[start + offset].extract_text(layout=True) or ""
+                if text.strip():
+                    results[offset] = PageText(number=start + offset + 1, text=text, method="pdfplumber")
+    return results
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked: the pool is created from a process running
+            # threads (uvicorn, the job loop, SQLite sessions) whose held locks
+            # a forked child would inherit
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+class PDFExtractor:
+    """
+    Page-parallel PDF text extractor
+
+    Large documents are split into runs of ``pages_per_task`` pages that are
+    extracted in a shared process pool. ``iter_pages`` yields pages in order
+    as soon as each run finishes, keeping at most two runs per worker in
+    flight, so consumers can start on page 1 while page 300 is still being
+    parsed and memory stays bounded.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        pages_per_task: Optional[int] = None,
+        layout_fallback: bool = True
+    ):
+        settings = get_settings()
+        self.max_workers = max_workers or settings.pdf_workers
+        self.pages_per_task = pages_per_task or settings.pdf_pages_per_task
+        self.layout_fallback = layout_fallback
+
+    @staticmethod
+    def count_pages(file_path) -> int:
+        """Number of pages in a PDF"""
+        return len(PdfReader(str(file_path)).pages)
+
+    def iter_pages(self, file_path) -> Iterator[PageText]:
+        """Yield page text in page order"""
+        path = str(Path(file_path))
+        page_count = self.count_pages(path)
+
+        # Not worth the process hop for short documents
+        if page_count <= self.pages_per_task or self.max_workers <= 1:
+            yield from _extract_range(path, 0, page_count, self.layout_fallback)
+            return
+
+        executor = _get_executor(self.max_workers)
+        ranges = deque(
+            (start, min(start + self.pages_per_task, page_count))
+            for start in range(0, page_count, self.pages_per_task)
+        )
+        window = self.max_workers * 2
+        inflight = deque()
+        try:
+            while ranges or inflight:
+                while ranges and len(inflight) < window:
+                    start, end = ranges.popleft()
+                    inflight.append(executor.submit(_extract_range, path, start, end, self.layout_fallback))
+                yield from inflight.popleft().result()
+        finally:
+            for future in inflight:
+                future.cancel()
+
+    def extract_pages(self, file_path) -> List[PageText]:
+        """Extract every page"""
+        return list(self.iter_pages(file_path))
+
+    def extract_text(self, file_path) -> Tuple[str, int]:
+        """
+        Extract the full text of a PDF
+
+        Returns:
+        - (full text with pages separated by blank lines, page count)
+        """
+        pages = self.extract_pages(file_path)
+        return "\n\n".join(page.text for page in pages), len(pages)
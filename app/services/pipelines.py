@@ -0,0 +1,361 @@
+"""Job pipeline definitions"""
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+
+import numpy as np
+
+from app.core.config import get_settings
+
+from app.services.ann_index import get_ann_index
+from app.services.answer_cache import get_answer_cache
+from app.services.audit_store import get_audit_store
+from app.services.chunker import ClauseChunker
+from app.services.document_store import get_document_store
+from app.services.embedding_service import get_embedding_service
+from app.services.field_extractor import SCHEMA, FieldExtractor
+from app.services.field_store import get_field_store
+from app.services.invalidation import delete_document, schedule_compaction
+from app.services.job_queue import JobQueue, Stage, get_job_queue
+from app.services.lexical_index import get_lexical_index
+from app.services.llm_service import get_default_provider
+from app.services.metrics import get_metrics
+from app.services.pdf_service import EXTRACTOR_VERSION
+from app.services.risk_engine import Finding, RiskEngine, select_rules, summarize
+from app.services.text_cache import get_document_pages, get_text_cache, iter_document_pages, read_cached_pages
+from app.services.vector_store import get_vector_index
+from app.services.webhook_service import get_webhook_dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+# Ingest
+async def parse_and_chunk(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract page text and split it into token-bounded chunks in one pass
+
+    Pages stream from the extractor's process pool straight into the chunker
+    and are written to the text cache on the way through, so only the pages
+    under the current chunk are held in memory however long the document is.
+    """
+    settings = get_settings()
+    document_id = context["document_id"]
+    chunker = ClauseChunker(
+        max_tokens=settings.chunk_max_tokens,
+        overlap_tokens=settings.chunk_overlap_tokens,
+        min_tokens=settings.chunk_min_tokens
+    )
+
+    def run():
+        page_count = 0
+
+        def counted():
+            nonlocal page_count
+            for page in iter_document_pages(document_id):
+                page_count += 1
+                yield page
+
+        chunks = [chunk.to_dict(document_id) for chunk in chunker.chunk(counted())]
+        return chunks, page_count
+
+    chunks, page_count = await run_in_threadpool(run)
+    return {"_chunks": chunks, "pages": page_count, "chunks": len(chunks)}
+
+
+async def index_lexical(context: Dict[str, Any]) -> None:
+    """Add chunks to the BM25 inverted index"""
+    await run_in_threadpool(get_lexical_index().add, context["_chunks"])
+
+
+async def embed_chunks(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store the document's chunk vectors, embedding only text the index has no vector for
+
+    Rows from an earlier run of the same document (a recovered or retried
+    job) are replaced rather than appended to.
+    """
+    chunks = context["_chunks"]
+    if not chunks:
+        return {"embedded": 0, "reused": 0}
+    index = get_vector_index()
+    model = await run_in_threadpool(lambda: get_embedding_service().model_id)
+    # Fails before reusing any vector if the index was built with another model
+    index.check_model(model)
+    texts = [chunk["text"] for chunk in chunks]
+    # Unchanged chunks of a replaced or re-uploaded document keep their vectors;
+    # they are copied out under the index lock, so a compaction cannot shift them
+    reused, stored = await run_in_threadpool(index.reusable_vectors, texts)
+    missing = np.setdiff1d(np.arange(len(chunks)), reused)
+    vectors = np.zeros((len(chunks), stored.shape[1]), dtype=np.float32) if len(reused) else None
+    if len(missing):
+        embedded = await get_embedding_service().aembed_batch([texts[i] for i in missing])
+        if vectors is None:
+            vectors = np.zeros((len(chunks), embedded.shape[1]), dtype=np.float32)
+        vectors[missing] = embedded
+    if len(reused):
+        vectors[reused] = stored
+    await run_in_threadpool(lambda: index.add(vectors, chunks, model, replace=True))
+    await run_in_threadpool(get_ann_index().sync)
+    # A re-run leaves the previous rows tombstoned
+    await run_in_threadpool(schedule_compaction)
+    return {"embedded": len(missing), "reused": len(reused)}
+
+
+async def finalize_ingest(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Mark the document processed once every ingest stage has run"""
+    await run_in_threadpool(
+        get_document_store().mark_processed,
+        context["document_id"],
+        context.get("pages")
+    )
+    # Read after marking processed: a replacement merged into this job later
+    # is retired by the request that merged it (see the ingest router)
+    payload = await run_in_threadpool(get_job_queue().payload, context["job_id"])
+    replaced = payload.get("replaces") or []
+    for previous in [replaced] if isinstance(replaced, str) else replaced:
+        if previous != context["document_id"]:
+            # The new version is searchable, so the old one can go
+            await run_in_threadpool(delete_document, previous)
+    # Newly searchable content can change previously cached answers
+    get_answer_cache().invalidate_document(context["document_id"])
+    get_metrics().inc("documents_ingested_total")
+    get_webhook_dispatcher().emit(
+        "ingest_complete",
+        {"document_id": context["document_id"], "pages": context.get("pages"), "chunks": context.get("chunks")},
+        task_id=context["job_id"]
+    )
+    return {"processed": True}
+
+
+# Maintenance
+async def compact_indexes(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Rewrite the vector index without tombstoned rows and drop them from the ANN lists"""
+    index = get_vector_index()
+    removed = index.tombstoned_rows
+    # One critical section for both, so searches never see renumbered rows with stale lists
+    kept = await run_in_threadpool(get_ann_index().compact)
+    if kept is None:
+        return {"removed_rows": 0, "rows": len(index)}
+    return {"removed_rows": removed, "rows": len(kept)}
+
+
+# Extraction
+async def plan_extraction(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Find the fields with no stored value for the current schema"""
+    if context.get("force"):
+        stale = list(SCHEMA)
+    else:
+        stale = await run_in_threadpool(get_field_store().stale_fields, context["document_id"])
+    return {"_stale": stale, "recomputed": [spec.name for spec in stale]}
+
+
+async def load_text(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Load page text from the text cache"""
+    if not context["_stale"]:
+        return {"_pages": []}
+    pages = await run_in_threadpool(get_document_pages, context["document_id"])
+    return {"_pages": pages}
+
+
+async def extract_fields_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Rule pre-pass over anchor windows, then at most one LLM call, for stale fields only"""
+    document_id = context["document_id"]
+    store = get_field_store()
+    output: Dict[str, Any] = {"llm_calls": 0, "tokens": {"document": 0, "llm": 0}}
+    if context["_stale"]:
+        result = await FieldExtractor(context["_stale"]).extract(context["_pages"], get_default_provider())
+        await run_in_threadpool(store.save, document_id, result)
+        output = {"llm_calls": result.llm_calls, "tokens": result.to_dict()["tokens"]}
+    stored = await run_in_threadpool(store.get, document_id)
+    output = {**output, **{k: stored[k] for k in ("fields", "confidence", "method", "pages", "schema_version")}}
+    get_webhook_dispatcher().emit(
+        "extraction_complete",
+        {"document_id": document_id, "fields": output["fields"], "recomputed": context["recomputed"]},
+        task_id=context["job_id"]
+    )
+    return output
+
+
+# Bulk audit
+async def select_documents(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve the document filter to ids, walking the catalog with keyset pagination"""
+    filters = context.get("filter") or {}
+    if filters.get("document_ids"):
+        return {"_documents": list(dict.fromkeys(filters["document_ids"])), "total": len(filters["document_ids"])}
+
+    store = get_document_store()
+    uploaded_after = filters.get("uploaded_after")
+    uploaded_before = filters.get("uploaded_before")
+    documents, cursor = [], None
+    while True:
+        page, cursor = await run_in_threadpool(
+            store.list,
+            limit=1000,
+            cursor=cursor,
+            filename=filters.get("filename"),
+            min_size=filters.get("min_size"),
+            max_size=filters.get("max_size"),
+            uploaded_after=datetime.fromisoformat(uploaded_after) if uploaded_after else None,
+            uploaded_before=datetime.fromisoformat(uploaded_before) if uploaded_before else None
+        )
+        documents.extend(doc.id for doc in page)
+        if cursor is None:
+            break
+    return {"_documents": documents, "total": len(documents)}
+
+
+_shard_engines: Dict[Tuple, RiskEngine] = {}
+
+
+def audit_shard(
+    text_cache_dir: str,
+    document_ids: List[str],
+    rule_ids: Optional[List[str]]
+) -> List[Tuple[str, Optional[List[Finding]]]]:
+    """Scan a shard of documents in a worker process; text comes straight from the cache files"""
+    key = tuple(rule_ids) if rule_ids is not None else None
+    engine = _shard_engines.get(key)
+    if engine is None:
+        engine = _shard_engines[key] = RiskEngine(select_rules(rule_ids))
+    results = []
+    for document_id in document_ids:
+        pages = read_cached_pages(text_cache_dir, document_id, EXTRACTOR_VERSION)
+        results.append((document_id, engine.scan(pages) if pages is not None else None))
+    return results
+
+
+def bulk_audit_path(job_id: str) -> Path:
+    """NDJSON output of a bulk audit job"""
+    return Path(get_settings().audit_export_dir) / f"{job_id}.ndjson"
+
+
+async def audit_portfolio(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Audit every selected document, streaming results to NDJSON
+
+    Documents already audited on their current text under this rule set are
+    not rescanned; their stored findings are written out as ``reused``.
+    The rest are sharded across the CPU process pool. Ambiguous hits are
+    flagged rather than sent to the LLM, keeping portfolio runs offline.
+    """
+    settings = get_settings()
+    queue = get_job_queue()
+    audits = get_audit_store()
+    text_cache = get_text_cache()
+    job_id = context["job_id"]
+    rule_ids = context.get("rules")
+    version = RiskEngine(select_rules(rule_ids)).version
+    documents = context["_documents"]
+
+    reusable = set() if context.get("force") else await run_in_threadpool(audits.audited, documents, version)
+    pending = [d for d in documents if d not in reusable]
+    shard_size = max(1, settings.bulk_audit_shard_size)
+    shards = [pending[i:i + shard_size] for i in range(0, len(pending), shard_size)]
+
+    path = bulk_audit_path(job_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    counts = {"audited": 0, "reused": 0, "failed": 0, "findings": 0}
+    started = time.perf_counter()
+
+    def progress() -> Dict[str, Any]:
+        done = counts["audited"] + counts["reused"] + counts["failed"]
+        elapsed = time.perf_counter() - started
+        return {
+            "type": "progress",
+            "total": len(documents),
+            "done": done,
+            **counts,
+            "ruleset_version": version,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_sec": round(done / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+    # A recovered or retried job starts its output over; documents it already
+    # audited are written out again as reused rather than duplicated
+    with open(path, "w", encoding="utf-8") as out:
+        def write(record: Dict):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+
+        for document_id in reusable:
+            summary = await run_in_threadpool(audits.summary, document_id, version)
+            findings = await run_in_threadpool(audits.findings, document_id, None, version)
+            write({"type": "document", "document_id": document_id, "reused": True, "summary": summary, "findings": findings})
+            counts["reused"] += 1
+            counts["findings"] += len(findings)
+        if reusable:
+            write(progress())
+
+        async def run_shard(shard: List[str]):
+            # Parse any document whose text is not cached yet before handing it to a worker
+            for document_id in shard:
+                if not text_cache.contains(document_id):
+                    try:
+                        await run_in_threadpool(get_document_pages, document_id)
+                    except Exception:
+                        # The worker reports it as failed
+                        logger.exception("Could not extract text for %s", document_id)
+            return await queue.run_cpu(audit_shard, settings.text_cache_dir, shard, rule_ids)
+
+        in_flight = asyncio.Semaphore(max(1, queue.cpu_workers) * 2)
+
+        async def bounded(shard: List[str]):
+            async with in_flight:
+                return await run_shard(shard)
+
+        for finished in asyncio.as_completed([bounded(shard) for shard in shards]):
+            results = await finished
+            stored = []
+            for document_id, findings in results:
+                if findings is None:
+                    counts["failed"] += 1
+                    write({"type": "error", "document_id": document_id, "error": "No extracted text"})
+                    continue
+                summary = summarize(findings, version)
+                stored.append((document_id, findings, summary, 0))
+                write({
+                    "type": "document",
+                    "document_id": document_id,
+                    "reused": False,
+                    "summary": summary,
+                    "findings": [f.to_dict() for f in findings]
+                })
+                counts["audited"] += 1
+                counts["findings"] += len(findings)
+            await run_in_threadpool(audits.save_many, stored, version)
+            status = progress()
+            write(status)
+            await run_in_threadpool(queue.report, job_id, status)
+
+        result = {**progress(), "type": "done", "output": str(path)}
+        write(result)
+    get_metrics().inc("audit_runs_total", counts["audited"], source="bulk")
+    get_webhook_dispatcher().emit("bulk_audit_complete", {k: v for k, v in result.items() if k != "type"}, task_id=job_id)
+    return {k: v for k, v in result.items() if k != "type"}
+
+
+def register_pipelines(queue: JobQueue):
+    """Register every job kind the API can submit"""
+    queue.register("ingest", [
+        Stage("parse_chunk", parse_and_chunk),
+        Stage("index_lexical", index_lexical),
+        Stage("embed", embed_chunks),
+        Stage("finalize", finalize_ingest),
+    ])
+    queue.register("compact", [
+        Stage("compact", compact_indexes),
+    ])
+    queue.register("bulk_audit", [
+        Stage("select", select_documents),
+        Stage("audit", audit_portfolio),
+    ])
+    queue.register("extract", [
+        Stage("plan", plan_extraction),
+        Stage("load_text", load_text),
+        Stage("extract_fields", extract_fields_stage),
+    ])
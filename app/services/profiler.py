@@ -0,0 +1,240 @@
+"""On-demand request profiling: stack samples and stage spans"""
+from collections import Counter, deque
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+import os
+import sys
+import threading
+import time
+import uuid
+
+from app.core.config import get_settings
+
+# Leaf functions of threads that are parked rather than working
+_IDLE_LEAVES = frozenset({"wait", "select", "poll", "_wait_for_tstate_lock", "accept", "_worker"})
+# Bound on sampling rounds for very long requests, e.g. streams
+MAX_SAMPLES = 20000
+
+
+class Span:
+    """A timed stage within a profiled request"""
+
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    def to_dict(self, origin: float) -> Dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "start_ms": (self.start - origin) * 1000,
+            "duration_ms": (end - self.start) * 1000,
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+
+    def folded(self, prefix: str = "") -> List[str]:
+        """Self time per span path in microseconds, as folded stacks"""
+        path = f"{prefix};{self.name}" if prefix else self.name
+        end = self.end if self.end is not None else time.perf_counter()
+        # Children may overlap (gathered tasks), so self time is clamped at zero
+        own = (end - self.start) - sum(
+            (c.end if c.end is not None else end) - c.start for c in self.children
+        )
+        lines = [f"{path} {int(own * 1e6)}"] if own > 0 else []
+        for child in self.children:
+            lines.extend(child.folded(path))
+        return lines
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("profile_span", default=None)
+
+
+def start_span(name: str, labels: Optional[Dict] = None) -> Optional[Tuple[Span, Token]]:
+    """
+    Open a child of the active span
+
+    Returns None, at the cost of one context lookup, when no request is
+    being profiled. With labels, the span is named after their values.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    span = Span(".".join(str(v) for v in labels.values()) if labels else name)
+    parent.children.append(span)
+    return span, _current_span.set(span)
+
+
+def end_span(handle: Tuple[Span, Token]):
+    span, token = handle
+    span.end = time.perf_counter()
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Closed from a different context than it was opened in, e.g. a generator
+        pass
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of every busy thread at a fixed interval"""
+
+    def __init__(self, interval_s: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval_s):
+            if self.samples >= MAX_SAMPLES:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident or frame.f_code.co_name in _IDLE_LEAVES:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+@dataclass
+class RequestProfile:
+    """Everything captured for one profiled request"""
+    id: str
+    method: str
+    path: str
+    reason: str
+    started_at: str
+    interval_ms: float
+    route: Optional[str] = None
+    status: Optional[int] = None
+    duration_ms: Optional[float] = None
+    samples: int = 0
+    root: Optional[Span] = None
+    stacks: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": self.samples
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            **self.summary(),
+            "interval_ms": self.interval_ms,
+            "spans": self.root.to_dict(self.root.start) if self.root else None,
+            "stacks": self.stacks
+        }
+
+    def collapsed(self) -> str:
+        """Sampled stacks in Brendan Gregg's folded format (flamegraph.pl, speedscope, inferno)"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def collapsed_spans(self) -> str:
+        """The span tree in folded format, weighted by self time in microseconds"""
+        return "".join(line + "\n" for line in self.root.folded()) if self.root else ""
+
+
+class Profiler:
+    """
+    Profiles individual requests and keeps the most recent ones
+
+    A stack sampler is used rather than cProfile: it sees the thread pool
+    work a request hands off, costs nothing per function call, and yields
+    full stacks that flame graph tools read directly. Samples cover every
+    busy thread, so only one request is profiled at a time and concurrent
+    requests can still show up in its stacks; the span tree, which follows
+    the request's own context, is exact.
+    """
+
+    def __init__(self, max_profiles: int = 50, interval_ms: float = 5):
+        self.interval_ms = interval_ms
+        self._profiles: Deque[RequestProfile] = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    def begin(self, method: str, path: str, reason: str) -> Optional[Tuple[RequestProfile, _Sampler, Token]]:
+        """Start profiling the current request, or None if another request is being profiled"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = RequestProfile(
+            id=uuid.uuid4().hex,
+            method=method,
+            path=path,
+            reason=reason,
+            started_at=datetime.now(timezone.utc).isoformat(),
+            interval_ms=self.interval_ms,
+            root=Span(f"{method} {path}")
+        )
+        sampler = _Sampler(self.interval_ms / 1000)
+        sampler.start()
+        return profile, sampler, _current_span.set(profile.root)
+
+    def finish(self, handle: Tuple[RequestProfile, _Sampler, Token], route: Optional[str], status: int):
+        """Stop sampling and store the profile"""
+        profile, sampler, token = handle
+        try:
+            sampler.stop()
+            profile.root.end = time.perf_counter()
+            _current_span.reset(token)
+            profile.route = route
+            profile.status = status
+            profile.duration_ms = (profile.root.end - profile.root.start) * 1000
+            profile.samples = sampler.samples
+            profile.stacks = dict(sampler.stacks)
+            with self._lock:
+                self._profiles.append(profile)
+        finally:
+            self._busy.release()
+
+    def list(self) -> List[Dict]:
+        """Summaries of stored profiles, newest first"""
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles)]
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """Get the shared request profiler"""
+    global _profiler
+    if _profiler is None:
+        settings = get_settings()
+        _profiler = Profiler(settings.profile_buffer_size, settings.profile_interval_ms)
+    return _profiler
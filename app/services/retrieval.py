@@ -0,0 +1,174 @@
+"""Chunk retrieval for question answering"""
+from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+import asyncio
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.ann_index import get_ann_index
+from app.services.embedding_service import get_embedding_service
+from app.services.lexical_index import get_lexical_index
+from app.services.metrics import get_metrics
+from app.services.vector_store import get_vector_index
+
+RETRIEVAL_MODES = ("hybrid", "lexical", "vector")
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+
+
+@dataclass
+class RetrievedChunk:
+    """A chunk selected as context for an answer"""
+    chunk_id: str
+    document_id: str
+    page: Optional[int]
+    text: str
+    score: float
+
+    def to_source(self, snippet_chars: int = 300) -> Dict:
+        source = asdict(self)
+        source["text"] = self.text[:snippet_chars]
+        return source
+
+
+def chunk_key(metadata: Dict) -> str:
+    """Stable id shared by the vector and lexical indexes"""
+    return metadata.get("chunk_id") or f"{metadata['document_id']}:{metadata.get('page')}"
+
+
+def _check_model():
+    """Refuse to compare query vectors with stored vectors from another embedding model"""
+    get_vector_index().check_model(get_embedding_service().model_id)
+
+
+async def _vector_search(question: str, document_ids: Optional[List[str]], limit: int) -> List[RetrievedChunk]:
+    query = await get_embedding_service().aembed_batch([question])
+    _check_model()
+    with get_metrics().timer("stage_duration_seconds", pipeline="retrieval", stage="vector"):
+        hits = await run_in_threadpool(get_ann_index().search, query[0], limit, document_ids)
+    return [
+        RetrievedChunk(
+            chunk_id=chunk_key(hit.metadata),
+            document_id=hit.metadata["document_id"],
+            page=hit.metadata.get("page"),
+            text=hit.metadata["text"],
+            score=hit.score
+        )
+        for hit in hits
+    ]
+
+
+async def _lexical_search(question: str, document_ids: Optional[List[str]], limit: int) -> List[RetrievedChunk]:
+    with get_metrics().timer("stage_duration_seconds", pipeline="retrieval", stage="lexical"):
+        hits = await run_in_threadpool(get_lexical_index().search, question, limit, document_ids)
+    return [
+        RetrievedChunk(
+            chunk_id=hit.chunk_id,
+            document_id=hit.document_id,
+            page=hit.page,
+            text=hit.text,
+            score=hit.score
+        )
+        for hit in hits
+    ]
+
+
+def fuse(rankings: List[List[RetrievedChunk]], top_k: int) -> List[RetrievedChunk]:
+    """
+    Reciprocal rank fusion
+
+    Scores are normalised by the best possible fused score, so a chunk
+    ranked first by every retriever scores 1.0.
+    """
+    fused: Dict[str, float] = {}
+    chunks: Dict[str, RetrievedChunk] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking):
+            fused[chunk.chunk_id] = fused.get(chunk.chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            chunks.setdefault(chunk.chunk_id, chunk)
+
+    best_possible = len(rankings) / (RRF_K + 1)
+    ordered = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [
+        RetrievedChunk(**{**asdict(chunks[key]), "score": fused[key] / best_possible})
+        for key in ordered
+    ]
+
+
+async def retrieve(
+    question: str,
+    document_ids: Optional[List[str]] = None,
+    top_k: int = 5,
+    mode: Optional[str] = None
+) -> List[RetrievedChunk]:
+    """
+    Top-k chunks for a question, optionally limited to some documents
+
+    ``hybrid`` fuses BM25 and vector rankings with RRF; ``lexical`` never
+    touches the embedding model, which makes it the cheapest path.
+    """
+    mode = mode or get_settings().retrieval_mode
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    if mode == "vector":
+        return await _vector_search(question, document_ids, top_k)
+    if mode == "lexical":
+        return await _lexical_search(question, document_ids, top_k)
+
+    # Fetch deeper candidate lists so fusion has overlap to work with
+    depth = top_k * 4
+    lexical, vector = await asyncio.gather(
+        _lexical_search(question, document_ids, depth),
+        _vector_search(question, document_ids, depth)
+    )
+    return fuse([r for r in (lexical, vector) if r], top_k)
+
+
+async def retrieve_many(
+    questions: List[str],
+    document_ids: Optional[List[str]] = None,
+    top_k: int = 5,
+    mode: Optional[str] = None,
+    embeddings: Optional[np.ndarray] = None
+) -> List[List[RetrievedChunk]]:
+    """
+    Top-k chunks for several questions over the same documents
+
+    Questions are embedded in one batch (unless ``embeddings`` are passed
+    in) and the vector side runs as a single multi-query search.
+    """
+    mode = mode or get_settings().retrieval_mode
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    depth = top_k if mode != "hybrid" else top_k * 4
+
+    vector: List[List[RetrievedChunk]] = [[] for _ in questions]
+    if mode != "lexical":
+        if embeddings is None:
+            embeddings = await get_embedding_service().aembed_batch(questions)
+        _check_model()
+        with get_metrics().timer("stage_duration_seconds", pipeline="retrieval", stage="vector"):
+            results = await run_in_threadpool(get_ann_index().search_many, embeddings, depth, document_ids)
+        vector = [
+            [
+                RetrievedChunk(
+                    chunk_id=chunk_key(hit.metadata),
+                    document_id=hit.metadata["document_id"],
+                    page=hit.metadata.get("page"),
+                    text=hit.metadata["text"],
+                    score=hit.score
+                )
+                for hit in hits
+            ]
+            for hits in results
+        ]
+    if mode == "vector":
+        return vector
+
+    lexical = await asyncio.gather(*[_lexical_search(q, document_ids, depth) for q in questions])
+    if mode == "lexical":
+        return list(lexical)
+    return [fuse([r for r in pair if r], top_k) for pair in zip(lexical, vector)]
@@ -0,0 +1,341 @@
+"""Rule-based clause risk engine"""
+from bisect import bisect_right
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import hashlib
+import inspect
+import re
+
+from app.services.llm_service import LLMProvider
+from app.services.metrics import get_metrics
+from app.services.pdf_service import PageText
+
+SEVERITIES = ("high", "medium", "low")
+
+_SENTENCE_END = re.compile(r"[.;!?]\s|\n\s*\n")
+_MUTUAL = re.compile(r"\b(?:either|each|both|any)\s+part(?:y|ies)\b|\bmutual(?:ly)?\b", re.IGNORECASE)
+# A capitalised word other than a sentence-initial determiner, e.g. "Supplier"
+_NAMED_PARTY = re.compile(r"\b(?!(?:The|This|That|Such|It|Its|Any)\b)[A-Z][a-z]+\b")
+_NEGATION = re.compile(r"\b(?:no|not|never|neither|nor|without)\b[^.;]{0,40}$", re.IGNORECASE)
+
+
+@dataclass
+class RiskRule:
+    """
+    A clause pattern and what it means
+
+    ``check`` looks at the sentence around a hit and returns True to keep
+    it, False to drop it, or None when the wording is ambiguous and needs
+    a second opinion. The ruleset version covers the pattern and the
+    check's source; bump ``version`` for any other change in behaviour,
+    such as a helper regex the check relies on.
+    """
+    id: str
+    clause_type: str
+    severity: str
+    pattern: str
+    description: str
+    recommendation: str
+    check: Optional[Callable[[str, str], Optional[bool]]] = None
+    version: int = 1
+
+
+@dataclass
+class Finding:
+    """A rule hit in a document; offsets index the document text"""
+    rule_id: str
+    clause_type: str
+    severity: str
+    description: str
+    recommendation: str
+    start: int
+    end: int
+    page: Optional[int]
+    text: str
+    method: str = "rule"
+    ambiguous: bool = False
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _negated(sentence: str, match: str) -> Optional[bool]:
+    """Drop hits preceded by a negation in the same sentence ("shall not have unlimited liability")"""
+    prefix = sentence[:sentence.find(match)] if match in sentence else ""
+    return None if _NEGATION.search(prefix) else True
+
+
+def _one_sided(sentence: str, match: str) -> Optional[bool]:
+    """Mutual rights are balanced; rights granted to one named party are not"""
+    prefix = sentence[:sentence.find(match)] if match in sentence else sentence
+    if _MUTUAL.search(prefix):
+        return False
+    # With no subject in the sentence we cannot tell who holds the right
+    return True if _NAMED_PARTY.search(prefix) else None
+
+
+RULES: Sequence[RiskRule] = (
+    RiskRule(
+        "auto_renewal", "auto_renewal", "medium",
+        r"automatic(?:ally)?\s+renew\w*|auto-?renew\w*|renew\w*\s+automatically|evergreen",
+        "Agreement renews automatically unless cancelled",
+        "Calendar the non-renewal notice deadline or negotiate renewal by mutual written agreement"
+    ),
+    RiskRule(
+        "unlimited_liability", "limitation_of_liability", "high",
+        r"unlimited\s+liability|liability\s+(?:shall|will)\s+(?:not\s+be\s+limited|be\s+unlimited)"
+        r"|without\s+(?:any\s+)?limit(?:ation)?\s+(?:of|on|as\s+to)\s+(?:its\s+)?liability",
+        "Liability is uncapped",
+        "Negotiate an aggregate liability cap, e.g. fees paid in the preceding 12 months",
+        _negated
+    ),
+    RiskRule(
+        "broad_indemnity", "indemnification", "high",
+        r"indemnify,?\s+defend,?\s+and\s+hold\s+harmless"
+        r"|indemnify\b[^.;]{0,80}?\b(?:any\s+and\s+all|all)\s+(?:claims|losses|liabilities|damages)",
+        "Broad indemnity covering all claims or losses",
+        "Limit indemnity to third-party claims caused by the indemnifying party and make it mutual",
+        _one_sided
+    ),
+    RiskRule(
+        "unilateral_termination", "termination", "high",
+        r"(?:may|can)\s+terminate\s+(?:this\s+agreement\s+)?(?:at\s+any\s+time|for\s+(?:any\s+reason|convenience)"
+        r"|without\s+(?:cause|reason))",
+        "One party may terminate at will",
+        "Require a notice period and make termination for convenience mutual",
+        _one_sided
+    ),
+    RiskRule(
+        "unilateral_amendment", "amendment", "high",
+        r"(?:may|reserves\s+the\s+right\s+to)\s+(?:modify|amend|change|update)\s+(?:this\s+agreement|these\s+terms|the\s+terms)",
+        "Terms can be changed by one party",
+        "Require amendments to be in writing and signed by both parties",
+        _one_sided
+    ),
+    RiskRule(
+        "price_increase", "pricing", "medium",
+        r"(?:may|reserves\s+the\s+right\s+to)\s+(?:increase|adjust|change|raise)\s+(?:the\s+|its\s+)?(?:fees|prices|pricing|rates)",
+        "Prices can be raised unilaterally",
+        "Cap increases (e.g. CPI or a fixed percentage) and require advance notice",
+        _one_sided
+    ),
+    RiskRule(
+        "exclusivity", "exclusivity", "medium",
+        r"exclusive\s+(?:supplier|provider|dealer|distributor|reseller|right)s?"
+        r"|shall\s+not\s+(?:engage|contract|purchase)\s+[^.;]{0,40}?from\s+any\s+(?:other|third)",
+        "Exclusivity obligation",
+        "Limit exclusivity in scope and duration, with exit rights on poor performance"
+    ),
+    RiskRule(
+        "non_compete", "non_compete", "medium",
+        r"non-?compet\w*|shall\s+not\s+(?:directly\s+or\s+indirectly\s+)?compete",
+        "Non-compete restriction",
+        "Narrow the restricted activities, territory and duration"
+    ),
+    RiskRule(
+        "liquidated_damages", "damages", "medium",
+        r"liquidated\s+damages|penalt(?:y|ies)\s+(?:of|equal\s+to)",
+        "Liquidated damages or penalties",
+        "Check the amounts are a genuine pre-estimate of loss and are capped"
+    ),
+    RiskRule(
+        "assignment_without_consent", "assignment", "low",
+        r"may\s+assign\s+(?:this\s+agreement|its\s+rights)[^.;]{0,60}?without\s+(?:the\s+)?(?:prior\s+)?(?:written\s+)?consent",
+        "Agreement can be assigned without consent",
+        "Require consent for assignment except to successors in a merger",
+        _one_sided
+    ),
+    RiskRule(
+        "late_payment_interest", "payment", "low",
+        r"interest\s+(?:at\s+)?(?:(?:the\s+|a\s+)?rate\s+of\s+)?\d+(?:\.\d+)?\s*%\s+per\s+(?:month|annum|year)",
+        "Interest on late payment",
+        "Confirm the rate is acceptable and add a grace period"
+    ),
+    RiskRule(
+        "perpetual_confidentiality", "confidentiality", "low",
+        r"confidential\w*[^.;]{0,80}?(?:in\s+perpetuity|perpetual(?:ly)?|indefinitely)",
+        "Confidentiality obligations never expire",
+        "Limit confidentiality to a fixed term, except for trade secrets"
+    ),
+)
+
+
+def _check_source(check: Optional[Callable]) -> str:
+    if check is None:
+        return ""
+    try:
+        return inspect.getsource(check)
+    except (OSError, TypeError):
+        # No source available (e.g. a frozen build); fall back to its name
+        return check.__qualname__
+
+
+def ruleset_version(rules: Sequence[RiskRule]) -> str:
+    """Changes whenever a rule does, so stored audits can be recognised as stale"""
+    key = "\x1e".join(
+        f"{r.id}\x1f{r.version}\x1f{r.severity}\x1f{r.pattern}\x1f{r.description}\x1f{_check_source(r.check)}"
+        for r in rules
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+RULESET_VERSION = ruleset_version(RULES)
+
+
+def select_rules(rule_ids: Optional[Sequence[str]] = None) -> List[RiskRule]:
+    """The default rules, or the named subset of them"""
+    if rule_ids is None:
+        return list(RULES)
+    known = {rule.id: rule for rule in RULES}
+    unknown = [rule_id for rule_id in rule_ids if rule_id not in known]
+    if unknown:
+        raise ValueError(f"Unknown rules: {', '.join(unknown)}")
+    return [known[rule_id] for rule_id in dict.fromkeys(rule_ids)]
+
+
+def document_text(pages: Sequence[PageText]) -> Tuple[str, List[int]]:
+    """Pages joined into one string, with the offset each page starts at"""
+    starts, parts, offset = [], [], 0
+    for page in pages:
+        starts.append(offset)
+        parts.append(page.text)
+        offset += len(page.text) + 1
+    return "\n".join(parts), starts
+
+
+class RiskEngine:
+    """
+    Scan documents for risky clauses
+
+    Every rule is compiled into one alternation of lookaheads with a named
+    group per rule, so a document is scanned in a single linear pass
+    regardless of how many rules exist. Lookaheads consume nothing, so a
+    hit never hides a later one of another rule inside it; where several
+    rules match at the same position, the rules after the first are tried
+    there directly. Each hit is checked against its sentence; hits the
+    check cannot decide are sent, all together, to the LLM.
+    """
+
+    def __init__(self, rules: Sequence[RiskRule] = RULES):
+        self.rules = {rule.id: rule for rule in rules}
+        self.version = ruleset_version(rules)
+        self._pattern = re.compile(
+            "|".join(f"(?=(?P<{rule.id}>{rule.pattern}))" for rule in rules),
+            re.IGNORECASE
+        )
+        self._patterns = [(rule, re.compile(rule.pattern, re.IGNORECASE)) for rule in rules]
+        self._order = {rule.id: i for i, rule in enumerate(rules)}
+
+    def _hits(self, text: str) -> Iterator[Tuple[RiskRule, int, int]]:
+        """(rule, start, end) in document order; hits of one rule do not overlap each other"""
+        ends: Dict[str, int] = {}
+        for match in self._pattern.finditer(text):
+            position = match.start()
+            first = self._order[match.lastgroup]
+            spans = [(self.rules[match.lastgroup], match.end(match.lastgroup))]
+            for rule, pattern in self._patterns[first + 1:]:
+                hit = pattern.match(text, position)
+                if hit:
+                    spans.append((rule, hit.end()))
+            for rule, end in spans:
+                # The lookahead is retried at every position inside a hit
+                if position < ends.get(rule.id, 0):
+                    continue
+                ends[rule.id] = end
+                yield rule, position, end
+
+    @staticmethod
+    def _sentence(text: str, start: int, end: int) -> Tuple[int, int]:
+        """Bounds of the sentence containing text[start:end]"""
+        window = max(0, start - 400)
+        sentence_start = window
+        for match in _SENTENCE_END.finditer(text, window, start):
+            sentence_start = match.end()
+        match = _SENTENCE_END.search(text, end)
+        sentence_end = match.start() + 1 if match and match.start() - end < 400 else min(len(text), end + 400)
+        return sentence_start, sentence_end
+
+    def scan(self, pages: Sequence[PageText]) -> List[Finding]:
+        """Rule hits with sentence checks applied; undecided hits are flagged ambiguous"""
+        text, starts = document_text(pages)
+        findings = []
+        for rule, start, end in self._hits(text):
+            sentence_start, sentence_end = self._sentence(text, start, end)
+            sentence = text[sentence_start:sentence_end]
+            verdict = rule.check(sentence, text[start:end]) if rule.check else True
+            if verdict is False:
+                continue
+            page_index = bisect_right(starts, start) - 1
+            findings.append(Finding(
+                rule_id=rule.id,
+                clause_type=rule.clause_type,
+                severity=rule.severity,
+                description=rule.description,
+                recommendation=rule.recommendation,
+                start=start,
+                end=end,
+                page=pages[page_index].number if page_index >= 0 else None,
+                text=" ".join(sentence.split()),
+                ambiguous=verdict is None
+            ))
+        return findings
+
+    async def audit(self, pages: Sequence[PageText], provider: Optional[LLMProvider] = None) -> Tuple[List[Finding], int]:
+        """
+        Findings for a document
+
+        Returns:
+        - (findings, number of LLM calls made)
+        """
+        metrics = get_metrics()
+        with metrics.timer("stage_duration_seconds", pipeline="audit", stage="scan"):
+            findings = self.scan(pages)
+        ambiguous = [f for f in findings if f.ambiguous]
+        if not ambiguous or provider is None:
+            return findings, 0
+
+        with metrics.timer("stage_duration_seconds", pipeline="audit", stage="llm"):
+            verdicts = await provider.review_clauses([
+                {"clause": f.text, "risk": f.description} for f in ambiguous
+            ])
+        metrics.inc("llm_calls_total", operation="review_clauses")
+        dropped = set()
+        for finding, verdict in zip(ambiguous, verdicts):
+            if verdict is None:
+                continue
+            finding.method = "llm"
+            finding.ambiguous = False
+            if not verdict:
+                dropped.add(id(finding))
+        return [f for f in findings if id(f) not in dropped], 1
+
+
+def summarize(findings: Sequence[Finding], version: str = RULESET_VERSION) -> Dict:
+    """Counts by severity and clause type, with an overall risk level"""
+    by_severity = {severity: 0 for severity in SEVERITIES}
+    by_clause: Dict[str, int] = {}
+    for finding in findings:
+        by_severity[finding.severity] += 1
+        by_clause[finding.clause_type] = by_clause.get(finding.clause_type, 0) + 1
+    score = min(100, 25 * by_severity["high"] + 10 * by_severity["medium"] + 3 * by_severity["low"])
+    level = "high" if by_severity["high"] else "medium" if by_severity["medium"] else "low"
+    return {
+        "total_findings": len(findings),
+        "by_severity": by_severity,
+        "by_clause_type": by_clause,
+        "ambiguous": sum(1 for f in findings if f.ambiguous),
+        "risk_score": score,
+        "risk_level": level if findings else "none",
+        "ruleset_version": version
+    }
+
+
+_engine: Optional[RiskEngine] = None
+
+
+def get_risk_engine() -> RiskEngine:
+    """Get the shared risk engine"""
+    global _engine
+    if _engine is None:
+        _engine = RiskEngine()
+    return _engine
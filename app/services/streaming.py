@@ -0,0 +1,69 @@
+"""Token stream helpers"""
+from typing import AsyncIterator, List
+import asyncio
+import contextlib
+import time
+
+_END = object()
+
+
+async def coalesce_tokens(
+    tokens: AsyncIterator[str],
+    max_chars: int = 64,
+    max_delay_ms: float = 50
+) -> AsyncIterator[List[str]]:
+    """
+    Group a token stream into batches
+
+    A batch is flushed once it holds ``max_chars`` characters or its oldest
+    token has waited ``max_delay_ms``, whichever comes first, so fast
+    providers produce a few large frames and slow ones still reach the
+    client promptly. The upstream iterator is drained by a separate task;
+    closing this generator cancels that task, which in turn closes the
+    upstream iterator and stops generation.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for token in tokens:
+                await queue.put(token)
+        finally:
+            aclose = getattr(tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            queue.put_nowait(_END)
+
+    pump_task = asyncio.create_task(pump())
+    max_delay = max_delay_ms / 1000.0
+    batch: List[str] = []
+    size = 0
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _END:
+                break
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + max_delay
+                batch.append(item)
+                size += len(item)
+            if batch and (item is None or size >= max_chars):
+                yield batch
+                batch, size, deadline = [], 0, None
+
+        if batch:
+            yield batch
+        # Surface upstream errors
+        await pump_task
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await pump_task
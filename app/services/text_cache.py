@@ -0,0 +1,279 @@
+"""Persistent extracted-text cache"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import threading
+import uuid
+import zlib
+
+from app.core.config import get_settings
+from app.services.document_store import get_document_store
+from app.services.pdf_service import EXTRACTOR_VERSION, PageText, PDFExtractor
+
+
+def _read_entry(path: Path) -> List[PageText]:
+    with open(path, "rb") as f:
+        raw = json.loads(zlib.decompress(f.read()))
+    return [PageText(number=n, text=t, method=m) for n, m, t in raw]
+
+
+def read_cached_pages(root: str, sha256: str, version: str = EXTRACTOR_VERSION) -> Optional[List[PageText]]:
+    """
+    Read a cache entry directly, without building a ``TextCache``
+
+    For worker processes that only read; LRU bookkeeping stays with the
+    cache instance in the main process.
+    """
+    try:
+        return _read_entry(Path(root) / version / sha256[:2] / f"{sha256}.z")
+    except (OSError, zlib.error, ValueError):
+        return None
+
+
+class _Extraction:
+    """Pages of one in-progress extraction, shared with concurrent readers"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pages: List[PageText] = []
+        self.done = False
+        self.failed = False
+        # Callers using this record; it leaves the cache's table with the last one
+        self.users = 0
+
+
+class TextCache:
+    """
+    Disk cache of per-page extracted text
+
+    Entries are keyed by (document SHA-256, extractor version) and stored as
+    zlib-compressed JSON under ``<root>/<version>/<aa>/<sha256>.z``. An
+    in-memory LRU index of entry sizes is rebuilt from the directory on
+    startup (ordered by mtime); once the total exceeds ``max_bytes`` the least
+    recently used entries are deleted. Bumping ``EXTRACTOR_VERSION`` makes
+    old entries unreachable and they age out through the same eviction.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1073741824):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._extractions: Dict[Tuple[str, str], _Extraction] = {}
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_index()
+
+    def _load_index(self):
+        files = [(p.stat().st_mtime, p) for p in self.root.glob("*/*/*.z")]
+        for _, path in sorted(files):
+            size = path.stat().st_size
+            self._entries[path] = size
+            self._total_bytes += size
+
+    def _path(self, sha256: str, version: str) -> Path:
+        return self.root / version / sha256[:2] / f"{sha256}.z"
+
+    def get(self, sha256: str, version: str = EXTRACTOR_VERSION) -> Optional[List[PageText]]:
+        """Cached pages for a document, or None"""
+        path = self._path(sha256, version)
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+        try:
+            pages = _read_entry(path)
+            os.utime(path)
+        except (OSError, zlib.error, ValueError):
+            self._forget(path)
+            return None
+        return pages
+
+    def contains(self, sha256: str, version: str = EXTRACTOR_VERSION) -> bool:
+        """Whether pages for a document are cached, without reading them"""
+        with self._lock:
+            return self._path(sha256, version) in self._entries
+
+    def put(self, sha256: str, pages: List[PageText], version: str = EXTRACTOR_VERSION):
+        """Store pages for a document"""
+        path = self._path(sha256, version)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = zlib.compress(
+            json.dumps([[p.number, p.method, p.text] for p in pages]).encode("utf-8"),
+            6
+        )
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        self._commit(path, len(payload))
+
+    def _commit(self, path: Path, size: int):
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._evict()
+
+    def _extract_into(self, path: Path, file_path) -> Iterator[PageText]:
+        """Yield pages from the extractor while compressing them into a new entry"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        compressor = zlib.compressobj(6)
+        try:
+            with open(tmp_path, "wb") as f:
+                separator = b"["
+                for page in PDFExtractor().iter_pages(file_path):
+                    record = json.dumps([page.number, page.method, page.text]).encode("utf-8")
+                    f.write(compressor.compress(separator + record))
+                    separator = b","
+                    yield page
+                f.write(compressor.compress(b"[]" if separator == b"[" else b"]"))
+                f.write(compressor.flush())
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            # Includes the consumer abandoning the iterator: no partial entry is kept
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self._commit(path, size)
+
+    def iter_or_extract(self, sha256: str, file_path, version: str = EXTRACTOR_VERSION) -> Iterator[PageText]:
+        """
+        Cached pages, or pages streamed from the extractor on a miss
+
+        On a miss each page is written into the cache entry as it is
+        yielded, so the caller can work on page 1 while later pages are still
+        being parsed; the entry is committed once the last page is read.
+        Concurrent callers for the same document read the pages as that
+        single extraction publishes them rather than parsing the PDF in
+        parallel; no lock is held while any caller works on a page. If the
+        extracting caller stops early, a waiting one extracts the rest.
+        """
+        pages = self.get(sha256, version)
+        if pages is not None:
+            yield from pages
+            return
+
+        key = (sha256, version)
+        with self._lock:
+            extraction = self._extractions.get(key)
+            owner = extraction is None
+            if owner:
+                extraction = self._extractions[key] = _Extraction()
+            extraction.users += 1
+        try:
+            if owner:
+                yield from self._publish(key, extraction, file_path)
+                return
+            read = 0
+            while True:
+                with extraction.condition:
+                    while read == len(extraction.pages) and not (extraction.done or extraction.failed):
+                        extraction.condition.wait()
+                    if read < len(extraction.pages):
+                        page = extraction.pages[read]
+                    elif extraction.done:
+                        return
+                    else:
+                        break
+                read += 1
+                yield page
+            # The extracting caller gave up; start over and skip what was already read
+            for page in self.iter_or_extract(sha256, file_path, version):
+                if read:
+                    read -= 1
+                else:
+                    yield page
+        finally:
+            with self._lock:
+                extraction.users -= 1
+                if extraction.users == 0 and self._extractions.get(key) is extraction:
+                    del self._extractions[key]
+
+    def _publish(self, key: Tuple[str, str], extraction: _Extraction, file_path) -> Iterator[PageText]:
+        """Run the extraction, handing each page to waiting readers before yielding it"""
+        try:
+            for page in self._extract_into(self._path(*key), file_path):
+                with extraction.condition:
+                    extraction.pages.append(page)
+                    extraction.condition.notify_all()
+                yield page
+        except BaseException:
+            # Unlisted before readers wake, so one taking over starts a fresh extraction
+            with self._lock:
+                if self._extractions.get(key) is extraction:
+                    del self._extractions[key]
+            with extraction.condition:
+                extraction.failed = True
+                extraction.condition.notify_all()
+            raise
+        with extraction.condition:
+            extraction.done = True
+            extraction.condition.notify_all()
+
+    def get_or_extract(self, sha256: str, file_path, version: str = EXTRACTOR_VERSION) -> List[PageText]:
+        """Cached pages, extracting and storing them on a miss"""
+        return list(self.iter_or_extract(sha256, file_path, version))
+
+    def invalidate(self, sha256: str):
+        """Drop every cached version of a document"""
+        for path in self.root.glob(f"*/{sha256[:2]}/{sha256}.z"):
+            self._forget(path)
+
+    def _forget(self, path: Path):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+        path.unlink(missing_ok=True)
+
+    def _evict(self):
+        """Drop least recently used entries; caller must hold the lock"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+_cache: Optional[TextCache] = None
+
+
+def get_text_cache() -> TextCache:
+    """Get the shared text cache"""
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = TextCache(settings.text_cache_dir, max_bytes=settings.text_cache_max_bytes)
+    return _cache
+
+
+def get_document_pages(document_id: str) -> List[PageText]:
+    """Page text for a stored document, parsing the PDF at most once per extractor version"""
+    store = get_document_store()
+    return get_text_cache().get_or_extract(document_id, store.object_path(document_id))
+
+
+def iter_document_pages(document_id: str) -> Iterator[PageText]:
+    """Page text for a stored document in page order, streamed as it is parsed on a cache miss"""
+    store = get_document_store()
+    return get_text_cache().iter_or_extract(document_id, store.object_path(document_id))
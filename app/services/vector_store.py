@@ -0,0 +1,479 @@
+"""Local vector index"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from app.core.config import get_settings
+
+
+@dataclass
+class SearchHit:
+    """A retrieved chunk"""
+    row: int
+    score: float
+    metadata: Dict
+
+
+class RWLock:
+    """Many readers or one writer; a waiting writer holds back new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def chunk_hash(text: str) -> int:
+    """64-bit content hash of a chunk's text; 0 is reserved for rows stored without one"""
+    value = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+    return value or 1
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped cosine-similarity index
+
+    Layout under ``root``:
+
+    - ``vectors.f32``: row-major float32 matrix, one L2-normalised row per chunk
+    - ``docs.i32``: document ordinal per row, for vectorised ``document_ids`` filters
+    - ``meta.jsonl`` / ``meta.i64``: one JSON metadata line per row and its byte offset
+    - ``hashes.i64``: content hash of each row's text, so unchanged chunks can reuse vectors
+    - ``index.json``: dimension, embedding model, the ordinal -> document id table and deleted ordinals
+
+    Appends only ever extend the files, so adding chunks never rewrites
+    existing data. Opening maps the files without reading them, and search
+    scans the mapping in blocks with ``argpartition``, so only the top-k
+    metadata lines are ever parsed onto the Python heap.
+
+    Deleting a document only tombstones its ordinal: its rows are masked
+    out of every search until ``compact`` rewrites the files without them.
+    A document ingested again after deletion gets a fresh ordinal.
+
+    The index records the embedding model its vectors came from and
+    refuses vectors or queries from another one: two models can share a
+    dimension while their similarities mean nothing to each other.
+
+    ``lock`` is shared with the ANN index built on top: writes (append,
+    delete, compaction) hold it exclusively and reads share it, so row
+    numbers never change under a search. Public methods take it; the
+    underscored variants expect the caller to hold it.
+    """
+
+    BLOCK_ROWS = 65536
+
+    def __init__(self, root: str, dim: Optional[int] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.root / "vectors.f32"
+        self.docs_path = self.root / "docs.i32"
+        self.meta_path = self.root / "meta.jsonl"
+        self.offsets_path = self.root / "meta.i64"
+        self.hashes_path = self.root / "hashes.i64"
+        self.header_path = self.root / "index.json"
+
+        self.lock = RWLock()
+        self.dim = dim
+        self.model: Optional[str] = None
+        self.documents: List[str] = []
+        self.deleted: Set[int] = set()
+        if self.header_path.exists():
+            with open(self.header_path, "r", encoding="utf-8") as f:
+                header = json.load(f)
+            self.dim = header["dim"]
+            self.model = header.get("model")
+            self.documents = header["documents"]
+            self.deleted = set(header.get("deleted", []))
+        self._doc_ordinals = {doc: i for i, doc in enumerate(self.documents) if i not in self.deleted}
+
+        self._rows = 0
+        self._vectors: Optional[np.memmap] = None
+        self._docs: Optional[np.memmap] = None
+        self._offsets: Optional[np.memmap] = None
+        self._hashes: Optional[np.memmap] = None
+        self._live: Optional[np.ndarray] = None
+        self._remap()
+
+    # Storage
+    def _save_header(self):
+        tmp_path = self.header_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"dim": self.dim, "model": self.model, "documents": self.documents, "deleted": sorted(self.deleted)},
+                f
+            )
+        os.replace(tmp_path, self.header_path)
+
+    def _file_rows(self, path: Path, row_bytes: int) -> int:
+        return path.stat().st_size // row_bytes if path.exists() else 0
+
+    def _remap(self):
+        """Map the files; rows are the count every file agrees on"""
+        if not self.dim:
+            return
+        rows = min(
+            self._file_rows(self.vectors_path, 4 * self.dim),
+            self._file_rows(self.docs_path, 4),
+            self._file_rows(self.offsets_path, 8)
+        )
+        self._rows = rows
+        self._live = None
+        if rows == 0:
+            self._vectors = self._docs = self._offsets = self._hashes = None
+            return
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        self._docs = np.memmap(self.docs_path, dtype=np.int32, mode="r", shape=(rows,))
+        self._offsets = np.memmap(self.offsets_path, dtype=np.int64, mode="r", shape=(rows,))
+        # Indexes written before hashes were stored have fewer (or no) hash rows
+        hashed = min(rows, self._file_rows(self.hashes_path, 8))
+        self._hashes = np.memmap(self.hashes_path, dtype=np.int64, mode="r", shape=(hashed,)) if hashed else None
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def check_model(self, model: Optional[str]):
+        """Raise ValueError if the index holds vectors from a different embedding model"""
+        if model and self.model and model != self.model:
+            raise ValueError(
+                f"Vector index was built with embedding model {self.model!r}, not {model!r}; "
+                "re-embed the corpus into a new index to switch models"
+            )
+
+    def vectors(self) -> np.ndarray:
+        """Read-only view of the stored matrix"""
+        if self._vectors is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._vectors
+
+    def row_documents(self) -> np.ndarray:
+        """Document ordinal of each row"""
+        if self._docs is None:
+            return np.zeros(0, dtype=np.int32)
+        return self._docs
+
+    def document_ordinals(self, document_ids: Iterable[str]) -> np.ndarray:
+        """Ordinals for known document ids"""
+        return np.array(
+            [self._doc_ordinals[d] for d in document_ids if d in self._doc_ordinals],
+            dtype=np.int32
+        )
+
+    def live_mask(self) -> Optional[np.ndarray]:
+        """Boolean mask of rows not tombstoned, or None when nothing is deleted"""
+        if not self.deleted or self._rows == 0:
+            return None
+        live = self._live
+        if live is None:
+            live = ~np.isin(self.row_documents(), np.fromiter(self.deleted, dtype=np.int32))
+            self._live = live
+        return live
+
+    @property
+    def tombstoned_rows(self) -> int:
+        """Rows still stored for deleted documents"""
+        live = self.live_mask()
+        return 0 if live is None else int(self._rows - np.count_nonzero(live))
+
+    def find_rows(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Rows already holding a vector for each text, or -1
+
+        Tombstoned rows count: a document replaced by a new version (or
+        deleted and uploaded again) shares vectors with it until compaction.
+        """
+        with self.lock.read():
+            return self._find_rows(texts)
+
+    def reusable_vectors(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stored vectors for texts the index already holds
+
+        Returns:
+        - (positions in ``texts`` that were found, a copy of their vectors)
+        """
+        with self.lock.read():
+            rows = self._find_rows(texts)
+            found = np.flatnonzero(rows >= 0)
+            if len(found) == 0:
+                return found, np.zeros((0, self.dim or 0), dtype=np.float32)
+            return found, np.array(self._vectors[rows[found]])
+
+    def _find_rows(self, texts: Sequence[str]) -> np.ndarray:
+        found = np.full(len(texts), -1, dtype=np.int64)
+        stored = self._hashes
+        if stored is None or len(texts) == 0:
+            return found
+        wanted = np.array([chunk_hash(text) for text in texts], dtype=np.int64)
+        rows = np.flatnonzero(np.isin(stored, wanted))
+        latest = {int(h): int(row) for h, row in zip(stored[rows], rows)}
+        for i, h in enumerate(wanted):
+            found[i] = latest.get(int(h), -1)
+        return found
+
+    # Writes
+    def add(
+        self,
+        vectors: np.ndarray,
+        metadatas: Sequence[Dict],
+        model: Optional[str] = None,
+        replace: bool = False
+    ) -> List[int]:
+        """
+        Append rows
+
+        Every metadata dict must carry a ``document_id``. Vectors are
+        normalised here, so search scores are cosine similarities.
+        ``model`` names the embedding model; the first one recorded is the
+        only one accepted afterwards. With ``replace``, rows already stored
+        for the same documents are tombstoned in the same write, so adding
+        a document twice never duplicates its rows and searches never see
+        it missing.
+
+        Returns:
+        - Row numbers assigned to the new vectors
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(metadatas):
+            raise ValueError("vectors must be (n, dim) with one metadata dict per row")
+        if len(vectors) == 0:
+            return []
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+        with self.lock.write():
+            self.check_model(model)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.model = model
+                self._save_header()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            elif model and self.model is None:
+                # Index written before models were recorded
+                self.model = model
+                self._save_header()
+
+            if replace:
+                for doc in dict.fromkeys(m["document_id"] for m in metadatas):
+                    ordinal = self._doc_ordinals.pop(doc, None)
+                    if ordinal is not None:
+                        self.deleted.add(ordinal)
+            new_docs = [m["document_id"] for m in metadatas if m["document_id"] not in self._doc_ordinals]
+            for doc in dict.fromkeys(new_docs):
+                self._doc_ordinals[doc] = len(self.documents)
+                self.documents.append(doc)
+            if new_docs:
+                self._save_header()
+
+            start = self._rows
+            offsets = np.empty(len(metadatas), dtype=np.int64)
+            with open(self.meta_path, "ab") as f:
+                position = f.tell()
+                for i, metadata in enumerate(metadatas):
+                    line = json.dumps(metadata).encode("utf-8") + b"\n"
+                    offsets[i] = position
+                    f.write(line)
+                    position += len(line)
+
+            ordinals = np.array([self._doc_ordinals[m["document_id"]] for m in metadatas], dtype=np.int32)
+            hashes = np.array([chunk_hash(m.get("text", "")) for m in metadatas], dtype=np.int64)
+            hashed = self._file_rows(self.hashes_path, 8)
+            if hashed != start:
+                # Pad rows stored before hashes existed (or drop a torn tail) so hashes stay row-aligned
+                with open(self.hashes_path, "ab") as f:
+                    f.truncate(min(hashed, start) * 8)
+                    f.write(np.zeros(max(0, start - hashed), dtype=np.int64).tobytes())
+            # Vectors are written last: a crash part-way leaves the row uncounted
+            for path, data in (
+                (self.offsets_path, offsets),
+                (self.docs_path, ordinals),
+                (self.hashes_path, hashes),
+                (self.vectors_path, vectors)
+            ):
+                with open(path, "ab") as f:
+                    f.write(data.tobytes())
+
+            self._remap()
+            return list(range(start, start + len(vectors)))
+
+    def delete_document(self, document_id: str) -> int:
+        """Tombstone a document's rows, returning how many were masked"""
+        with self.lock.write():
+            ordinal = self._doc_ordinals.pop(document_id, None)
+            if ordinal is None:
+                return 0
+            self.deleted.add(ordinal)
+            self._save_header()
+            self._live = None
+            return int(np.count_nonzero(self.row_documents() == ordinal))
+
+    def compact(self) -> Optional[np.ndarray]:
+        """
+        Rewrite the files without tombstoned rows
+
+        Surviving rows keep their order and documents are renumbered
+        densely, streaming in blocks. An ANN index over this one must be
+        compacted in the same critical section (``IVFIndex.compact``).
+
+        Returns:
+        - Old row numbers of the surviving rows (the new row i was old row
+          ``kept[i]``), or None when there was nothing to compact
+        """
+        with self.lock.write():
+            return self._compact()
+
+    def _compact(self) -> Optional[np.ndarray]:
+        live = self.live_mask()
+        if live is None:
+            return None
+        kept = np.flatnonzero(live)
+        renumber = np.full(len(self.documents), -1, dtype=np.int32)
+        survivors = [i for i in range(len(self.documents)) if i not in self.deleted]
+        renumber[survivors] = np.arange(len(survivors), dtype=np.int32)
+
+        hashed = 0 if self._hashes is None else len(self._hashes)
+        tmp = {path: path.with_suffix(path.suffix + ".tmp") for path in (
+            self.vectors_path, self.docs_path, self.hashes_path, self.meta_path, self.offsets_path
+        )}
+        with open(self.meta_path, "rb") as meta_in, \
+                open(tmp[self.meta_path], "wb") as meta_out, \
+                open(tmp[self.offsets_path], "wb") as offsets_out, \
+                open(tmp[self.vectors_path], "wb") as vectors_out, \
+                open(tmp[self.docs_path], "wb") as docs_out, \
+                open(tmp[self.hashes_path], "wb") as hashes_out:
+            for start in range(0, len(kept), self.BLOCK_ROWS):
+                rows = kept[start:start + self.BLOCK_ROWS]
+                vectors_out.write(np.asarray(self._vectors[rows]).tobytes())
+                docs_out.write(renumber[self._docs[rows]].tobytes())
+                hashes = np.zeros(len(rows), dtype=np.int64)
+                if hashed:
+                    has_hash = rows < hashed
+                    hashes[has_hash] = self._hashes[rows[has_hash]]
+                hashes_out.write(hashes.tobytes())
+                offsets = np.empty(len(rows), dtype=np.int64)
+                for i, row in enumerate(rows):
+                    meta_in.seek(int(self._offsets[row]))
+                    line = meta_in.readline()
+                    offsets[i] = meta_out.tell()
+                    meta_out.write(line)
+                offsets_out.write(offsets.tobytes())
+
+        # Vectors last, as in ``add``; the header switches to the new ordinals at the end
+        for path in (self.meta_path, self.offsets_path, self.docs_path, self.hashes_path, self.vectors_path):
+            os.replace(tmp[path], path)
+        self.documents = [self.documents[i] for i in survivors]
+        self._doc_ordinals = {doc: i for i, doc in enumerate(self.documents)}
+        self.deleted = set()
+        self._save_header()
+        self._remap()
+        return kept
+
+    # Reads
+    def metadata(self, row: int) -> Dict:
+        """Metadata stored for a row"""
+        with self.lock.read():
+            return self._metadata(row)
+
+    def _metadata(self, row: int) -> Dict:
+        with open(self.meta_path, "rb") as f:
+            f.seek(int(self._offsets[row]))
+            return json.loads(f.readline())
+
+    def row_mask(self, document_ids: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        """Boolean mask of live rows belonging to the given documents, or None for all rows"""
+        if document_ids is None:
+            return self.live_mask()
+        return np.isin(self.row_documents(), self.document_ordinals(document_ids))
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        document_ids: Optional[Iterable[str]] = None
+    ) -> List[SearchHit]:
+        """Exact cosine top-k, optionally restricted to some documents"""
+        with self.lock.read():
+            return self._search(query, top_k, document_ids)
+
+    def _search(self, query: np.ndarray, top_k: int, document_ids: Optional[Iterable[str]]) -> List[SearchHit]:
+        if self._rows == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        mask = self.row_mask(document_ids)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        for start in range(0, self._rows, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, self._rows)
+            scores = self._vectors[start:end] @ query
+            rows = np.arange(start, end)
+            if mask is not None:
+                keep = mask[start:end]
+                scores, rows = scores[keep], rows[keep]
+            if len(scores) > top_k:
+                part = np.argpartition(-scores, top_k - 1)[:top_k]
+                scores, rows = scores[part], rows[part]
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, rows])
+            if len(best_scores) > top_k:
+                part = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_scores, best_rows = best_scores[part], best_rows[part]
+
+        order = np.argsort(-best_scores)
+        return [
+            SearchHit(row=int(best_rows[i]), score=float(best_scores[i]), metadata=self._metadata(int(best_rows[i])))
+            for i in order
+        ]
+
+
+_index: Optional[LocalVectorIndex] = None
+
+
+def get_vector_index() -> LocalVectorIndex:
+    """Get the shared vector index"""
+    global _index
+    if _index is None:
+        _index = LocalVectorIndex(get_settings().vector_db_path)
+    return _index
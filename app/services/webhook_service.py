@@ -0,0 +1,424 @@
+"""Webhook registration and delivery"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import uuid
+
+import httpx
+
+from app.core.config import get_settings
+from app.models.database import Webhook, WebhookDelivery, create_tables, get_session_local
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = (
+    "ingest_complete",
+    "extraction_complete",
+    "audit_complete",
+    "bulk_audit_complete",
+)
+
+# Per-document events that arrive in bursts; these are delivered in batches
+COALESCED_EVENTS = frozenset({"ingest_complete", "extraction_complete", "audit_complete"})
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def sign(secret: str, body: bytes) -> str:
+    """HMAC-SHA256 signature sent in ``X-Webhook-Signature``"""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class WebhookDispatcher:
+    """
+    Delivers events to registered webhooks without blocking callers
+
+    ``emit`` is safe to call from any thread and returns immediately.
+    Deliveries are written to the ``webhook_deliveries`` table before they
+    are attempted, so the table doubles as a persistent retry queue: failed
+    attempts are rescheduled with exponential backoff and jitter, and
+    pending deliveries survive a restart.
+
+    A dedicated event loop thread owns one pooled ``httpx.AsyncClient``;
+    each endpoint gets its own concurrency limit so a slow receiver only
+    delays its own deliveries. Events in ``COALESCED_EVENTS`` are buffered
+    per (webhook, event type) for ``batch_window_ms`` or ``batch_max``
+    events and sent as one payload.
+    """
+
+    def __init__(
+        self,
+        database_url: Optional[str] = None,
+        timeout_s: float = 10,
+        max_connections: int = 100,
+        endpoint_concurrency: int = 4,
+        batch_window_ms: float = 1000,
+        batch_max: int = 100,
+        max_attempts: int = 8,
+        backoff_base_s: float = 2,
+        backoff_max_s: float = 600,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.timeout_s = timeout_s
+        self.max_connections = max_connections
+        self.endpoint_concurrency = endpoint_concurrency
+        self.batch_window = batch_window_ms / 1000.0
+        self.batch_max = batch_max
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        # Tests pass an httpx.MockTransport acting as a stub receiver
+        self.transport = transport
+
+        create_tables(database_url)
+        self.SessionLocal = get_session_local(database_url)
+
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Tuple[str, Set[str], Optional[str]]] = {}
+        self._load_subscriptions()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._scheduler: Optional[asyncio.Task] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._buffers: Dict[Tuple[str, str], List[Dict]] = {}
+        self._flush_handles: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self.delivered = 0
+        self.failed_attempts = 0
+
+    # Registration
+    def _load_subscriptions(self):
+        with self.SessionLocal() as session:
+            rows = session.query(Webhook).all()
+        with self._lock:
+            self._subscriptions = {
+                row.id: (row.url, set(json.loads(row.events)), row.secret) for row in rows
+            }
+
+    def register(self, url: str, events: List[str], secret: Optional[str] = None) -> Dict:
+        """Register an endpoint for some event types"""
+        unknown = [e for e in events if e not in EVENT_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown event types: {', '.join(unknown)}")
+        if not events:
+            raise ValueError("At least one event type is required")
+        row = Webhook(
+            id=uuid.uuid4().hex,
+            url=url,
+            events=json.dumps(sorted(set(events))),
+            secret=secret,
+            created_at=_utcnow()
+        )
+        with self.SessionLocal() as session:
+            session.add(row)
+            session.commit()
+        self._load_subscriptions()
+        return self._to_dict(row)
+
+    def unregister(self, webhook_id: str) -> bool:
+        """Remove an endpoint and its undelivered payloads"""
+        with self.SessionLocal() as session:
+            row = session.get(Webhook, webhook_id)
+            if row is None:
+                return False
+            session.query(WebhookDelivery).filter(WebhookDelivery.webhook_id == webhook_id).delete()
+            session.delete(row)
+            session.commit()
+        self._load_subscriptions()
+        return True
+
+    @staticmethod
+    def _to_dict(row: Webhook) -> Dict:
+        return {
+            "webhook_id": row.id,
+            "url": row.url,
+            "events": json.loads(row.events),
+            "signed": row.secret is not None,
+            "created_at": row.created_at.isoformat()
+        }
+
+    def list(self) -> List[Dict]:
+        """Registered endpoints"""
+        with self.SessionLocal() as session:
+            rows = session.query(Webhook).order_by(Webhook.created_at).all()
+        return [self._to_dict(row) for row in rows]
+
+    def deliveries(self, webhook_id: str, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Most recent deliveries to an endpoint"""
+        with self.SessionLocal() as session:
+            query = session.query(WebhookDelivery).filter(WebhookDelivery.webhook_id == webhook_id)
+            if status is not None:
+                query = query.filter(WebhookDelivery.status == status)
+            rows = query.order_by(WebhookDelivery.created_at.desc()).limit(limit).all()
+        return [
+            {
+                "id": row.id,
+                "event_type": row.event_type,
+                "status": row.status,
+                "attempts": row.attempts,
+                "next_attempt_at": row.next_attempt_at.isoformat(),
+                "last_error": row.last_error,
+                "created_at": row.created_at.isoformat()
+            }
+            for row in rows
+        ]
+
+    # Lifecycle
+    def start(self):
+        """Start the delivery loop"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="webhooks", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def stop(self):
+        """Flush buffered events to the retry queue and stop the delivery loop"""
+        with self._lock:
+            if self._thread is None:
+                return
+            loop, thread = self._loop, self._thread
+            self._thread = None
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    def _run_loop(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout_s,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            transport=self.transport
+        )
+        self._scheduler = loop.create_task(self._schedule())
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _shutdown(self):
+        for key in list(self._buffers):
+            await self._flush(key)
+        self._scheduler.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._scheduler, *self._tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    # Emitting
+    def emit(self, event_type: str, data: Dict[str, Any], task_id: Optional[str] = None):
+        """Queue an event for every subscribed endpoint; never blocks on delivery"""
+        with self._lock:
+            targets = [wid for wid, (_, events, _) in self._subscriptions.items() if event_type in events]
+        if not targets:
+            return
+        self.start()
+        event = {"task_id": task_id, "data": data, "timestamp": _utcnow().isoformat()}
+        self._loop.call_soon_threadsafe(self._accept, event_type, event, targets)
+
+    def _accept(self, event_type: str, event: Dict, targets: List[str]):
+        for webhook_id in targets:
+            if event_type not in COALESCED_EVENTS:
+                self._spawn(self._enqueue(webhook_id, event_type, {"event_type": event_type, **event}))
+                continue
+            key = (webhook_id, event_type)
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append(event)
+            if len(buffer) >= self.batch_max:
+                self._spawn(self._flush(key))
+            elif key not in self._flush_handles:
+                self._flush_handles[key] = self._loop.call_later(
+                    self.batch_window, lambda key=key: self._spawn(self._flush(key))
+                )
+
+    async def _flush(self, key: Tuple[str, str]):
+        handle = self._flush_handles.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        events = self._buffers.pop(key, None)
+        if not events:
+            return
+        webhook_id, event_type = key
+        if len(events) == 1:
+            payload = {"event_type": event_type, **events[0]}
+        else:
+            payload = {
+                "event_type": event_type,
+                "task_id": None,
+                "batched": True,
+                "count": len(events),
+                "data": {"events": events},
+                "timestamp": _utcnow().isoformat()
+            }
+        await self._enqueue(webhook_id, event_type, payload)
+
+    async def _enqueue(self, webhook_id: str, event_type: str, payload: Dict):
+        now = _utcnow()
+        row = WebhookDelivery(
+            id=uuid.uuid4().hex,
+            webhook_id=webhook_id,
+            event_type=event_type,
+            payload=json.dumps(payload, default=str),
+            status="pending",
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now,
+            updated_at=now
+        )
+
+        def insert():
+            with self.SessionLocal() as session:
+                session.add(row)
+                session.commit()
+
+        await self._loop.run_in_executor(None, insert)
+        self._wake.set()
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Delivery
+    def _due(self, in_flight: List[str]) -> Tuple[List[WebhookDelivery], Optional[datetime]]:
+        """Due pending deliveries not already being attempted, and when the next one falls due"""
+        now = _utcnow()
+        with self.SessionLocal() as session:
+            pending = session.query(WebhookDelivery).filter(WebhookDelivery.status == "pending")
+            if in_flight:
+                pending = pending.filter(WebhookDelivery.id.notin_(in_flight))
+            due = pending.filter(WebhookDelivery.next_attempt_at <= now).order_by(WebhookDelivery.next_attempt_at).limit(200).all()
+            upcoming = (
+                pending.filter(WebhookDelivery.next_attempt_at > now)
+                .order_by(WebhookDelivery.next_attempt_at)
+                .with_entities(WebhookDelivery.next_attempt_at)
+                .first()
+            )
+        return due, upcoming[0] if upcoming else None
+
+    async def _schedule(self):
+        while True:
+            self._wake.clear()
+            due, upcoming = await self._loop.run_in_executor(None, self._due, list(self._in_flight))
+            for delivery in due:
+                self._in_flight.add(delivery.id)
+                self._spawn(self._deliver(delivery))
+            timeout = 5.0
+            if upcoming is not None:
+                timeout = min(timeout, max(0.05, (upcoming - _utcnow()).total_seconds()))
+            if due:
+                timeout = min(timeout, 0.5)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max_s, self.backoff_base_s * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _deliver(self, delivery: WebhookDelivery):
+        try:
+            with self._lock:
+                subscription = self._subscriptions.get(delivery.webhook_id)
+            if subscription is None:
+                return
+            url, _, secret = subscription
+            limit = self._limits.setdefault(delivery.webhook_id, asyncio.Semaphore(self.endpoint_concurrency))
+            body = delivery.payload.encode("utf-8")
+            headers = {
+                "Content-Type": "application/json",
+                "X-Webhook-Event": delivery.event_type,
+                "X-Webhook-Delivery": delivery.id
+            }
+            if secret:
+                headers["X-Webhook-Signature"] = sign(secret, body)
+
+            error = None
+            async with limit:
+                try:
+                    response = await self._client.post(url, content=body, headers=headers)
+                    if response.status_code >= 300:
+                        error = f"HTTP {response.status_code}"
+                except httpx.HTTPError as e:
+                    error = f"{type(e).__name__}: {e}"
+
+            attempts = delivery.attempts + 1
+            if error is None:
+                self.delivered += 1
+                fields = {"status": "delivered", "attempts": attempts, "last_error": None}
+            else:
+                self.failed_attempts += 1
+                logger.warning("Webhook delivery %s to %s failed: %s", delivery.id, url, error)
+                fields = {"attempts": attempts, "last_error": error}
+                if attempts >= self.max_attempts:
+                    fields["status"] = "failed"
+                else:
+                    fields["next_attempt_at"] = _utcnow() + timedelta(seconds=self._backoff(attempts))
+            await self._loop.run_in_executor(None, lambda: self._update(delivery.id, **fields))
+        finally:
+            self._in_flight.discard(delivery.id)
+            self._wake.set()
+
+    def _update(self, delivery_id: str, **fields):
+        with self.SessionLocal() as session:
+            row = session.get(WebhookDelivery, delivery_id)
+            if row is None:
+                return
+            for key, value in fields.items():
+                setattr(row, key, value)
+            row.updated_at = _utcnow()
+            session.commit()
+
+    def stats(self) -> Dict:
+        """Delivery counters"""
+        with self.SessionLocal() as session:
+            pending = session.query(WebhookDelivery).filter(WebhookDelivery.status == "pending").count()
+            failed = session.query(WebhookDelivery).filter(WebhookDelivery.status == "failed").count()
+        return {
+            "webhooks": len(self._subscriptions),
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "pending": pending,
+            "dead": failed
+        }
+
+
+_dispatcher: Optional[WebhookDispatcher] = None
+
+
+def get_webhook_dispatcher() -> WebhookDispatcher:
+    """Get the shared webhook dispatcher"""
+    global _dispatcher
+    if _dispatcher is None:
+        settings = get_settings()
+        _dispatcher = WebhookDispatcher(
+            database_url=settings.database_url,
+            timeout_s=settings.webhook_timeout_s,
+            max_connections=settings.webhook_max_connections,
+            endpoint_concurrency=settings.webhook_endpoint_concurrency,
+            batch_window_ms=settings.webhook_batch_window_ms,
+            batch_max=settings.webhook_batch_max,
+            max_attempts=settings.webhook_max_attempts,
+            backoff_base_s=settings.webhook_backoff_base_s,
+            backoff_max_s=settings.webhook_backoff_max_s
+        )
+    return _dispatcher
@@ -2,11 +2,30 @@
 Client library for Contract Intelligence API
 """
 import requests
+import httpx
+import asyncio
+import inspect
 import json
-from typing import List, Dict, Optional, Tuple
+import random
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
 
 
+def _parse_sse_line(line: str) -> Optional[Dict]:
+    """Payload of one ``data:`` line of the answer stream, or None"""
+    if not line.startswith("data: "):
+        return None
+    chunk = line[6:]
+    if chunk == "[DONE]":
+        return None
+    try:
+        return json.loads(chunk)
+    except json.JSONDecodeError:
+        return {"error": chunk}
+
+
 class ContractIntelligenceAPI:
     """Python client for Contract Intelligence API"""
     
@@ -70,6 +89,14 @@ class ContractIntelligenceAPI:
         response.raise_for_status()
         return response.json()
     
+    def export_fields(self) -> Iterator[Dict]:
+        """Stream extracted fields for every document"""
+        with self.session.get(f"{self.base_url}/extract/export", stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
     # Question Answering
     def ask(self, question: str, document_ids: Optional[List[str]] = None, top_k: int = 5) -> Dict:
         """Ask a question about contracts"""
@@ -102,14 +129,9 @@ class ContractIntelligenceAPI:
         
         for line in response.iter_lines():
             if line:
-                data = line.decode("utf-8")
-                if data.startswith("data: "):
-                    chunk = data[6:]
-                    if chunk != "[DONE]":
-                        try:
-                            yield json.loads(chunk)
-                        except json.JSONDecodeError:
-                            yield {"error": chunk}
+                event = _parse_sse_line(line.decode("utf-8"))
+                if event is not None:
+                    yield event
     
     def get_query_history(self, skip: int = 0, limit: int = 10) -> List[Dict]:
         """Get query history"""
@@ -149,6 +171,20 @@ class ContractIntelligenceAPI:
         response.raise_for_status()
         return response.json()
     
+    def bulk_audit(self, rules: Optional[List[str]] = None, **filters) -> Dict:
+        """Start a portfolio audit; filters match the document listing filters"""
+        response = self.session.post(f"{self.base_url}/audit/bulk", json={"rules": rules, **filters})
+        response.raise_for_status()
+        return response.json()
+    
+    def stream_bulk_audit(self, job_id: str) -> Iterator[Dict]:
+        """Follow a portfolio audit's NDJSON output until the job ends"""
+        with self.session.get(f"{self.base_url}/audit/bulk/{job_id}/stream", stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
     # Admin
     def health_check(self) -> Dict:
         """Check API health"""
@@ -191,6 +227,263 @@ class ContractIntelligenceAPI:
         return response.json()
 
 
+@dataclass
+class UploadResult:
+    """Outcome of one file in ``ingest_many``"""
+    path: str
+    document_id: Optional[str] = None
+    job_id: Optional[str] = None
+    duplicate: bool = False
+    size: int = 0
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class IngestProgress:
+    """Running totals passed to the ``ingest_many`` progress callback"""
+    total: Optional[int]
+    done: int = 0
+    failed: int = 0
+    duplicates: int = 0
+    bytes_sent: int = 0
+    last: Optional[UploadResult] = None
+
+
+class AsyncContractIntelligenceAPI:
+    """
+    Asynchronous Python client for Contract Intelligence API
+    
+    All calls share one pooled ``httpx.AsyncClient`` with keep-alive, so
+    concurrent requests reuse connections instead of reconnecting. Transport
+    errors and 429/502/503/504 responses are retried with exponential
+    backoff, honouring ``Retry-After``; uploads are keyed by content hash on
+    the server, so retrying one never creates a duplicate.
+    
+    Use as ``async with AsyncContractIntelligenceAPI(...) as client`` or
+    call ``aclose()`` when done.
+    """
+    
+    RETRY_STATUSES = frozenset({429, 502, 503, 504})
+    
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        max_connections: int = 16,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        max_retries: int = 5,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=timeout,
+            transport=transport
+        )
+    
+    async def __aenter__(self) -> "AsyncContractIntelligenceAPI":
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        await self.client.aclose()
+    
+    # Transport
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max_s)
+            except ValueError:
+                pass
+        return min(self.backoff_base_s * 2 ** attempt, self.backoff_max_s) * random.uniform(0.5, 1.0)
+    
+    async def _retrying(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Call ``send`` until it succeeds or retries run out; ``send`` must rebuild the request body"""
+        attempt = 0
+        while True:
+            try:
+                response = await send()
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                delay = self._retry_delay(attempt, response)
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._retrying(lambda: self.client.request(method, url, **kwargs))
+    
+    # Ingestion
+    async def _upload(self, url: str, field: str, path: str, method: str = "POST") -> Tuple[httpx.Response, UploadResult]:
+        file_path = Path(path)
+        result = UploadResult(path=str(path), size=file_path.stat().st_size)
+        
+        async def send() -> httpx.Response:
+            result.attempts += 1
+            # Reopened per attempt; httpx streams the body from disk rather than loading it
+            with open(file_path, "rb") as f:
+                return await self.client.request(
+                    method, url, files=[(field, (file_path.name, f, "application/pdf"))]
+                )
+        
+        return await self._retrying(send), result
+    
+    async def ingest(self, file_path: str) -> Dict:
+        """Upload one PDF, returning its document entry"""
+        response, _ = await self._upload("/ingest/", "files", file_path)
+        return response.json()["documents"][0]
+    
+    async def ingest_many(
+        self,
+        file_paths: Iterable[str],
+        concurrency: int = 8,
+        on_progress: Optional[Callable[[IngestProgress], Any]] = None
+    ) -> List[UploadResult]:
+        """
+        Upload many PDFs, one request per file, at most ``concurrency`` at a time
+        
+        ``file_paths`` is consumed lazily, so a directory walk can feed it
+        directly; a file is only opened while its upload runs. Failures are
+        recorded on the result rather than raised, so one bad file does not
+        stop a batch. ``on_progress`` (plain or async) is called after each
+        file.
+        
+        Returns:
+        - One UploadResult per path, in input order
+        """
+        total = len(file_paths) if hasattr(file_paths, "__len__") else None
+        progress = IngestProgress(total=total)
+        pending = enumerate(file_paths)
+        results: Dict[int, UploadResult] = {}
+        
+        async def worker():
+            # Workers share one iterator; next() never yields to the loop, so each path is taken once
+            for index, path in pending:
+                try:
+                    response, result = await self._upload("/ingest/", "files", path)
+                    entry = response.json()["documents"][0]
+                    result.document_id = entry["id"]
+                    result.job_id = entry.get("job_id")
+                    result.duplicate = entry.get("duplicate", False)
+                    progress.bytes_sent += result.size
+                    progress.duplicates += result.duplicate
+                except (OSError, httpx.HTTPError, KeyError, ValueError) as e:
+                    result = UploadResult(path=str(path), error=str(e) or type(e).__name__)
+                    progress.failed += 1
+                results[index] = result
+                progress.done += 1
+                progress.last = result
+                if on_progress is not None:
+                    outcome = on_progress(progress)
+                    if inspect.isawaitable(outcome):
+                        await outcome
+        
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        return [results[i] for i in range(len(results))]
+    
+    async def replace_document(self, document_id: str, file_path: str) -> Dict:
+        """Upload a new version of a document"""
+        response, _ = await self._upload(f"/ingest/documents/{document_id}", "file", file_path, method="PUT")
+        return response.json()
+    
+    async def list_documents(self, page_size: int = 100, **filters) -> AsyncIterator[Dict]:
+        """Iterate over every document matching the listing filters, one page request at a time"""
+        params = {
+            k: v.isoformat() if isinstance(v, datetime) else v
+            for k, v in filters.items() if v is not None
+        }
+        params["limit"] = page_size
+        while True:
+            response = await self._request("GET", "/ingest/documents", params=params)
+            for document in response.json():
+                yield document
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                return
+            params["cursor"] = cursor
+    
+    async def get_document(self, document_id: str) -> Dict:
+        """Get document details"""
+        return (await self._request("GET", f"/ingest/documents/{document_id}")).json()
+    
+    async def delete_document(self, document_id: str) -> Dict:
+        """Delete a document"""
+        return (await self._request("DELETE", f"/ingest/documents/{document_id}")).json()
+    
+    async def get_job(self, job_id: str) -> Dict:
+        """Get background job status"""
+        return (await self._request("GET", f"/jobs/{job_id}")).json()
+    
+    # Extraction
+    async def extract_fields(self, document_id: str) -> Dict:
+        """Extract structured fields from contract"""
+        return (await self._request("POST", "/extract/", params={"document_id": document_id})).json()
+    
+    # Question Answering
+    async def ask(self, question: str, document_ids: Optional[List[str]] = None, top_k: int = 5) -> Dict:
+        """Ask a question about contracts"""
+        response = await self._request(
+            "POST", "/ask/", json={"question": question, "document_ids": document_ids, "top_k": top_k}
+        )
+        return response.json()
+    
+    async def stream_answer(
+        self,
+        question: str,
+        document_ids: Optional[List[str]] = None,
+        top_k: int = 5
+    ) -> AsyncIterator[Dict]:
+        """Iterate over answer stream events (metadata, token frames, done)"""
+        params = {"question": question, "top_k": top_k}
+        if document_ids:
+            params["document_ids"] = ",".join(document_ids) if isinstance(document_ids, list) else document_ids
+        async with self.client.stream("GET", "/ask/stream", params=params) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                event = _parse_sse_line(line)
+                if event is not None:
+                    yield event
+    
+    # Audit
+    async def audit(self, document_id: str) -> Dict:
+        """Run risk audit on contract"""
+        return (await self._request("POST", "/audit/", params={"document_id": document_id})).json()
+    
+    # Admin
+    async def health_check(self) -> Dict:
+        """Check API health"""
+        return (await self._request("GET", "/admin/healthz")).json()
+    
+    async def get_metrics(self) -> Dict:
+        """Get system metrics"""
+        return (await self._request("GET", "/admin/metrics")).json()
+    
+    async def get_status(self) -> Dict:
+        """Get detailed system status"""
+        return (await self._request("GET", "/admin/status")).json()
+
+
 # Usage examples
 if __name__ == "__main__":
     client = ContractIntelligenceAPI("http://localhost:8000")
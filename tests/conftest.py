@@ -0,0 +1,25 @@
+"""
+Shared test configuration
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+
+def pytest_configure(config):
+    """Point every on-disk store at a scratch directory before the app is imported"""
+    root = tempfile.mkdtemp(prefix="contract-intelligence-tests-")
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{root}/db/contracts.db",
+        "VECTOR_DB_PATH": f"{root}/db/vectors",
+        "LEXICAL_INDEX_PATH": f"{root}/db/lexical.db",
+        "LLM_CACHE_PATH": f"{root}/cache/llm.db",
+        "UPLOAD_DIR": f"{root}/uploads",
+        "TEXT_CACHE_DIR": f"{root}/cache/text",
+        "AUDIT_EXPORT_DIR": f"{root}/audits",
+        "PROFILING_ENABLED": "true",
+        "ADMIN_TOKEN": "test-admin-token",
+    })
+    os.makedirs(f"{root}/db", exist_ok=True)
@@ -28,6 +28,32 @@ class TestIngest:
         response = client.get("/ingest/documents")
         assert response.status_code == 200
         assert isinstance(response.json(), list)
+
+    def test_ingest_duplicate_content(self):
+        """Test identical bytes under different names resolve to one document"""
+        content = b"%PDF-1.4 duplicate ingest test"
+        first = client.post("/ingest", files=[("files", ("first.pdf", content, "application/pdf"))])
+        second = client.post("/ingest", files=[("files", ("second.pdf", content, "application/pdf"))])
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json()["document_ids"] == second.json()["document_ids"]
+        assert second.json()["documents"][0]["duplicate"] is True
+
+    def test_ingest_oversized_upload(self, tmp_path, monkeypatch):
+        """Test an upload over the size limit is refused with 413 partway through and leaves no file behind"""
+        from app.routers import ingest
+        from app.services.document_store import DocumentStore
+        
+        store = DocumentStore(
+            str(tmp_path / "docs"), database_url=f"sqlite:///{tmp_path / 'docs.db'}", chunk_size=8, max_size=32
+        )
+        monkeypatch.setattr(ingest, "get_document_store", lambda: store)
+        response = client.post("/ingest", files=[("files", ("big.pdf", b"%PDF-1.4 " + b"x" * 64, "application/pdf"))])
+        
+        assert response.status_code == 413
+        assert "big.pdf" in response.json()["detail"]
+        assert not [p for p in (tmp_path / "docs").rglob("*") if p.is_file()]
+        assert store.list()[0] == []
     
     def test_get_metrics(self):
         """Test metrics endpoint"""
@@ -47,6 +73,43 @@ class TestExtraction:
         assert response.status_code == 404
 
 
+    def test_extract_force_with_active_job(self, tmp_path, monkeypatch):
+        """Test force reaches a queued extraction and is refused for a running one"""
+        import threading
+        import time
+        from app.routers import extract
+        from app.services.job_queue import JobQueue, Stage
+        
+        queue = JobQueue(database_url=f"sqlite:///{tmp_path / 'jobs.db'}", io_workers=1)
+        release = threading.Event()
+        
+        async def wait(context):
+            await asyncio.get_running_loop().run_in_executor(None, release.wait)
+            return {}
+        
+        queue.register("extract", [Stage("wait", wait)])
+        monkeypatch.setattr(extract, "get_job_queue", lambda: queue)
+        monkeypatch.setattr(extract, "get_document_store", lambda: type("Store", (), {"get": lambda self, d: d})())
+        try:
+            running = queue.submit("extract", document_id="a", payload={"force": False})
+            queued = queue.submit("extract", document_id="b", payload={"force": False})
+            for _ in range(100):
+                if queue.get(running)["status"] == "running":
+                    break
+                time.sleep(0.02)
+            
+            response = client.post("/extract?document_id=b&force=true")
+            assert response.status_code == 200
+            assert response.json()["job_id"] == queued and queue.payload(queued) == {"force": True}
+            
+            response = client.post("/extract?document_id=a&force=true")
+            assert response.status_code == 409
+            assert running in response.json()["detail"]
+        finally:
+            release.set()
+            queue.stop()
+
+
 class TestAsk:
     """Test Q&A endpoints"""
     
@@ -58,6 +121,139 @@ class TestAsk:
         })
         # Should fail because no documents
         assert response.status_code in [400, 500]
+    
+    def test_stream_no_matching_content(self):
+        """Test streaming fails with 400 before the stream starts when retrieval finds nothing"""
+        response = client.get("/ask/stream", params={"question": "What is the payment term?", "document_ids": "nonexistent"})
+        assert response.status_code == 400
+        assert not response.headers["content-type"].startswith("text/event-stream")
+
+
+    def test_answer_cache_hits_invalidation_and_replay(self, monkeypatch):
+        """Test repeated questions are answered from the cache, replayed over SSE, and dropped when a document changes"""
+        from app.routers import ask
+        from app.services.answer_cache import AnswerCache
+        from app.services.retrieval import RetrievedChunk
+        
+        cache = AnswerCache()
+        calls = {"retrieve": 0, "llm": 0}
+        
+        async def retrieve(question, document_ids, top_k, mode):
+            calls["retrieve"] += 1
+            return [RetrievedChunk(chunk_id="d1:0", document_id="d1", page=1, text="Payment is due in 30 days", score=0.8)]
+        
+        class Provider:
+            name = "fake"
+            
+            async def answer_question(self, question, contexts):
+                calls["llm"] += 1
+                return "Within 30 days."
+            
+            async def stream_answer(self, question, contexts):
+                calls["llm"] += 1
+                for token in ("Within", " 30", " days."):
+                    yield token
+        
+        monkeypatch.setattr(ask, "get_answer_cache", lambda: cache)
+        monkeypatch.setattr(ask, "retrieve", retrieve)
+        monkeypatch.setattr(ask, "get_default_provider", lambda: Provider())
+        
+        def frames(response):
+            return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+        
+        params = {"question": "What are the payment terms?", "document_ids": "d1", "mode": "lexical"}
+        streamed = frames(client.get("/ask/stream", params=params))
+        assert streamed[0]["cached"] is False and streamed[-1]["type"] == "done"
+        assert "".join(f["token"] for f in streamed if f["type"] == "token") == "Within 30 days."
+        
+        # Same question up to case and punctuation, same scope
+        body = {"question": "what are the payment terms", "document_ids": ["d1"], "mode": "lexical"}
+        response = client.post("/ask", json=body)
+        assert response.status_code == 200
+        assert response.json()["cached"] is True and response.json()["answer"] == "Within 30 days."
+        assert response.json()["question"] == "what are the payment terms"
+        assert calls == {"retrieve": 1, "llm": 1}
+        
+        replay = frames(client.get("/ask/stream", params=params))
+        assert [f["type"] for f in replay] == ["metadata", "token", "done"]
+        assert replay[0]["cached"] is True and replay[0]["sources"][0]["chunk_id"] == "d1:0"
+        assert replay[1]["token"] == "Within 30 days." and replay[2]["cached"] is True
+        assert calls == {"retrieve": 1, "llm": 1}
+        
+        # A different scope is a miss; changing another document keeps d1's answers
+        assert client.post("/ask", json={**body, "top_k": 3}).json()["cached"] is False
+        cache.invalidate_document("d2")
+        assert client.post("/ask", json=body).json()["cached"] is True
+        cache.invalidate_document("d1")
+        assert client.post("/ask", json=body).json()["cached"] is False
+        assert calls == {"retrieve": 3, "llm": 3}
+        assert cache.stats()["exact_hits"] == 3 and cache.stats()["invalidations"] == 2
+    
+    def test_ask_batch_results_in_question_order(self, tmp_path, monkeypatch):
+        """Test /ask/batch answers each question from its own retrieval, in request order, when streamed too"""
+        from app.routers import ask
+        from app.services import retrieval
+        from app.services.answer_cache import AnswerCache
+        from app.services.lexical_index import BM25Index
+        
+        index = BM25Index(str(tmp_path / "lexical.db"))
+        index.add([
+            {"chunk_id": "d1:0", "document_id": "d1", "page": 1, "text": "Customer shall pay invoices within thirty days"},
+            {"chunk_id": "d1:1", "document_id": "d1", "page": 2, "text": "Either party may terminate on ninety days notice"},
+            {"chunk_id": "d1:2", "document_id": "d1", "page": 3, "text": "Supplier shall indemnify Customer against claims"}
+        ])
+        calls = []
+        
+        class Provider:
+            name = "fake"
+            
+            async def answer_questions(self, questions, contexts):
+                calls.append(list(questions))
+                # Later groups finish first, so streamed lines arrive out of order
+                await asyncio.sleep(0.05 / len(calls))
+                return [f"answer to {q}" for q in questions]
+        
+        monkeypatch.setattr(retrieval, "get_lexical_index", lambda: index)
+        monkeypatch.setattr(ask, "get_answer_cache", lambda: AnswerCache())
+        monkeypatch.setattr(ask, "get_default_provider", lambda: Provider())
+        # Room for about one question's chunk per call
+        monkeypatch.setattr(ask.settings, "llm_context_tokens", 12)
+        questions = ["When may a party terminate?", "Who pays invoices?", "Any force majeure?", "Who must indemnify?"]
+        body = {"questions": questions, "document_ids": ["d1"], "top_k": 1, "mode": "lexical"}
+        
+        data = client.post("/ask/batch", json=body).json()
+        results = data["results"]
+        assert [r["question"] for r in results] == questions
+        assert [r["sources"][0]["chunk_id"] if "sources" in r else None for r in results] == ["d1:1", "d1:0", None, "d1:2"]
+        assert results[0]["answer"] == "answer to When may a party terminate?"
+        assert "error" in results[2]
+        assert data["llm_calls"] == len(calls) == 3
+        
+        # Fresh cache, so every matched question goes back to the provider
+        monkeypatch.setattr(ask, "get_answer_cache", lambda: AnswerCache())
+        calls.clear()
+        lines = [json.loads(line) for line in client.post("/ask/batch", json={**body, "stream": True}).text.splitlines()]
+        assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+        assert lines[0]["index"] == 2
+        assert [line["index"] for line in lines[1:]] == [3, 1, 0]
+        assert all(line["question"] == questions[line["index"]] for line in lines)
+        assert all(line["answer"] == f"answer to {line['question']}" for line in lines if "answer" in line)
+    
+    def test_answer_cache_semantic_match(self):
+        """Test a close question embedding hits within its scope only"""
+        import numpy as np
+        from app.services.answer_cache import AnswerCache
+        
+        cache = AnswerCache(threshold=0.95)
+        scope = cache.scope(["d1"], "hybrid", 5)
+        cache.put(scope, "When is payment due?", {"answer": "In 30 days"}, np.array([1.0, 0.0], dtype=np.float32))
+        close = np.array([0.99, 0.141], dtype=np.float32)
+        
+        assert cache.get(scope, "By when must invoices be paid?", close).response["answer"] == "In 30 days"
+        assert cache.get(scope, "Who can terminate?", np.array([0.0, 1.0], dtype=np.float32)) is None
+        assert cache.get(cache.scope(None, "hybrid", 5), "When is payment due?", close) is None
+        cache.invalidate_document("d1")
+        assert cache.get(scope, "When is payment due?") is None
 
 
 class TestAudit:
@@ -69,6 +265,72 @@ class TestAudit:
         assert response.status_code == 404
 
 
+    def test_bulk_audit_stream(self):
+        """Test a bulk audit job streams its NDJSON output and rejects unknown rules"""
+        response = client.post("/audit/bulk", json={"rules": ["no_such_rule"]})
+        assert response.status_code == 400
+        
+        response = client.post("/audit/bulk", json={"filename": "no-such-prefix-"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["stream"] == f"/audit/bulk/{data['job_id']}/stream"
+        
+        stream = client.get(data["stream"], params={"poll_ms": 10})
+        assert stream.status_code == 200
+        assert stream.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in stream.text.splitlines()]
+        assert records[-1]["type"] == "done" and records[-1]["total"] == 0
+        assert client.get("/audit/bulk/nonexistent/stream").status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_bulk_audit_rerun_rewrites_output(self):
+        """Test re-running the audit stage of a recovered job does not duplicate its output"""
+        from app.services.pipelines import audit_portfolio, bulk_audit_path
+        
+        job_id = client.post("/audit/bulk", json={"filename": "no-such-prefix-"}).json()["job_id"]
+        client.get(f"/audit/bulk/{job_id}/stream", params={"poll_ms": 10})
+        await audit_portfolio({"job_id": job_id, "_documents": []})
+        
+        lines = bulk_audit_path(job_id).read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["type"] for line in lines] == ["done"]
+
+
+class TestWebhooks:
+    """Test webhook endpoints"""
+    
+    def test_register_list_delete(self, tmp_path, monkeypatch):
+        """Test the webhook lifecycle under the /webhooks prefix"""
+        from app.routers import webhook
+        from app.services.webhook_service import WebhookDispatcher
+        
+        dispatcher = WebhookDispatcher(f"sqlite:///{tmp_path}/webhooks.db")
+        monkeypatch.setattr(webhook, "get_webhook_dispatcher", lambda: dispatcher)
+        
+        response = client.post("/webhooks/register", json={
+            "url": "https://example.com/hook",
+            "events": ["ingest_complete", "audit_complete", "ingest_complete"],
+            "secret": "s3cret"
+        })
+        assert response.status_code == 200
+        registered = response.json()
+        assert registered["events"] == ["audit_complete", "ingest_complete"] and registered["signed"] is True
+        assert "secret" not in registered
+        
+        assert client.post("/webhooks/register", json={"url": "ftp://example.com", "events": ["ingest_complete"]}).status_code == 400
+        response = client.post("/webhooks/register", json={"url": "https://example.com", "events": ["no_such_event"]})
+        assert response.status_code == 400 and "ingest_complete" in response.json()["detail"]
+        
+        listed = client.get("/webhooks/list").json()
+        assert [w["webhook_id"] for w in listed] == [registered["webhook_id"]]
+        assert client.get(f"/webhooks/{registered['webhook_id']}/deliveries").json() == []
+        # The router is no longer mounted under the old singular prefix
+        assert client.get("/webhook/list").status_code == 404
+        
+        assert client.delete(f"/webhooks/{registered['webhook_id']}").status_code == 200
+        assert client.get("/webhooks/list").json() == []
+        assert client.delete(f"/webhooks/{registered['webhook_id']}").status_code == 404
+
+
 class TestAdmin:
     """Test admin endpoints"""
     
@@ -106,13 +368,670 @@ async def test_llm_service():
 
 
 @pytest.mark.asyncio
-async def test_embedding_service():
+async def test_field_extractor_rules():
+    """Test that deterministic fields skip the LLM"""
+    from app.services.field_extractor import FieldExtractor
+    from app.services.llm_service import get_llm_provider
+    from app.services.pdf_service import PageText
+    
+    pages = [PageText(1, "This Agreement is effective as of March 1, 2024 and is governed by the laws of the State of Delaware.", "text")]
+    result = await FieldExtractor().extract(pages, get_llm_provider("local"))
+    assert result.fields["effective_date"] == "2024-03-01"
+    assert result.fields["governing_law"] == "Delaware"
+    assert result.method["governing_law"] == "rule"
+
+
+def test_risk_engine_scan():
+    """Test clause rules and offsets"""
+    from app.services.pdf_service import PageText
+    from app.services.risk_engine import RiskEngine, RiskRule
+    
+    text = "Supplier may terminate this agreement at any time. Either party may terminate for convenience."
+    findings = RiskEngine().scan([PageText(1, text, "text")])
+    assert [f.rule_id for f in findings] == ["unilateral_termination"]
+    assert text[findings[0].start:findings[0].end] == "may terminate this agreement at any time"
+    assert findings[0].severity == "high"
+    
+    # Hits of different rules over the same words are all kept
+    text = "Customer shall not purchase non-competing goods from any other vendor."
+    findings = RiskEngine().scan([PageText(1, text, "text")])
+    assert [f.rule_id for f in findings] == ["exclusivity", "non_compete"]
+    
+    # Including rules matching at the same position, each rule's own hits staying non-overlapping
+    rules = [
+        RiskRule("late_fee", "payment", "low", r"late\s+fees?", "Late fee", "Review"),
+        RiskRule("late", "payment", "low", r"late\w*", "Late", "Review")
+    ]
+    findings = RiskEngine(rules).scan([PageText(1, "A late fee applies; lateness is noted.", "text")])
+    assert [(f.rule_id, f.start, f.end) for f in findings] == [("late_fee", 2, 10), ("late", 2, 6), ("late", 20, 28)]
+
+
+def test_clause_chunker():
+    """Test chunks respect the token budget, overlap, section headings and document offsets"""
+    from app.services.chunker import ClauseChunker, count_tokens
+    from app.services.pdf_service import PageText
+    from app.services.risk_engine import document_text
+    
+    pages = [
+        PageText(1, "1. Payment\nCustomer shall pay within 30 days. " + "Fees accrue monthly. " * 20, "text"),
+        PageText(2, "ARTICLE II\nSupplier shall indemnify Customer against third party claims.", "text")
+    ]
+    text, _ = document_text(pages)
+    chunks = list(ClauseChunker(max_tokens=40, overlap_tokens=8, min_tokens=8).chunk(iter(pages)))
+    
+    assert all(c.tokens <= 40 and c.tokens == count_tokens(c.text) for c in chunks)
+    assert all(text[c.start:c.end] == c.text for c in chunks)
+    assert chunks[0].section == "1. Payment"
+    assert chunks[1].start < chunks[0].end  # overlap
+    assert chunks[-1].page == 2 and chunks[-1].text.startswith("ARTICLE II")
+    assert chunks[-1].to_dict("doc")["chunk_id"] == f"doc:{len(chunks) - 1}"
+    
+    # Chunks spanning page breaks keep the whitespace around them and blank pages between
+    pages = [
+        PageText(1, "Customer shall pay within thirty days. ", "text"),
+        PageText(2, "   ", "text"),
+        PageText(3, "  and fees accrue monthly. ", "text"),
+        PageText(4, "Late fees apply.\n", "text")
+    ]
+    text, _ = document_text(pages)
+    for max_tokens in (40, 9):
+        chunks = list(ClauseChunker(max_tokens=max_tokens, overlap_tokens=4, min_tokens=2).chunk(iter(pages)))
+        assert any(c.page != c.page_end for c in chunks)
+        assert all(text[c.start:c.end] == c.text for c in chunks)
+
+
+def test_document_listing_filters(tmp_path):
+    """Test filename prefixes match % and _ literally and aware datetimes compare as UTC"""
+    from datetime import datetime, timedelta, timezone
+    from app.models.database import Contract
+    from app.services.document_store import DocumentStore, encode_cursor
+    
+    store = DocumentStore(str(tmp_path / "docs"), database_url=f"sqlite:///{tmp_path / 'docs.db'}")
+    noon = datetime(2024, 1, 1, 12, 0)
+    with store.SessionLocal() as session:
+        for i, name in enumerate(["100%_final.pdf", "100-draft.pdf", "1000_final.pdf"]):
+            session.add(Contract(id=f"{i:064d}", filename=name, size=1, upload_date=noon + timedelta(hours=i)))
+        session.commit()
+    
+    documents, _ = store.list(filename="100%_")
+    assert [d.filename for d in documents] == ["100%_final.pdf"]
+    
+    # 14:00 at UTC+2 is 12:00 UTC
+    plus_two = timezone(timedelta(hours=2))
+    documents, _ = store.list(uploaded_after=datetime(2024, 1, 1, 14, 0, tzinfo=plus_two))
+    assert len(documents) == 3
+    documents, _ = store.list(cursor=encode_cursor(datetime(2024, 1, 1, 14, 0, tzinfo=plus_two), "0" * 64))
+    assert [d.filename for d in documents] == ["100-draft.pdf", "1000_final.pdf"]
+
+
+def test_text_cache_streams_pages(tmp_path, monkeypatch):
+    """Test pages are yielded as extracted and cached only once fully read"""
+    from app.services import text_cache
+    from app.services.pdf_service import PageText
+
+    extracted = []
+
+    def iter_pages(self, file_path):
+        for n in range(1, 4):
+            extracted.append(n)
+            yield PageText(n, f"page {n}", "pypdf")
+
+    monkeypatch.setattr(text_cache.PDFExtractor, "iter_pages", iter_pages)
+    cache = text_cache.TextCache(str(tmp_path))
+
+    pages = cache.iter_or_extract("ab" * 32, "unused.pdf")
+    assert next(pages).number == 1 and extracted == [1]
+    pages.close()
+    assert not cache.contains("ab" * 32)
+    assert not list(tmp_path.rglob("*.tmp"))
+
+    assert [p.text for p in cache.iter_or_extract("ab" * 32, "unused.pdf")] == ["page 1", "page 2", "page 3"]
+    assert cache.contains("ab" * 32)
+    extracted.clear()
+    assert [p.number for p in cache.get_or_extract("ab" * 32, "unused.pdf")] == [1, 2, 3]
+    assert extracted == []
+
+
+def test_text_cache_concurrent_readers(tmp_path, monkeypatch):
+    """Test a second reader gets published pages without waiting on the first, and takes over if it stops"""
+    import threading
+    from app.services import text_cache
+    from app.services.pdf_service import PageText
+
+    extracted = []
+
+    def iter_pages(self, file_path):
+        for n in range(1, 4):
+            extracted.append(n)
+            yield PageText(n, f"page {n}", "pypdf")
+
+    monkeypatch.setattr(text_cache.PDFExtractor, "iter_pages", iter_pages)
+    cache = text_cache.TextCache(str(tmp_path))
+    first_read = threading.Event()
+    read = []
+
+    def follow():
+        for page in cache.iter_or_extract("cd" * 32, "unused.pdf"):
+            read.append(page.number)
+            first_read.set()
+
+    owner = cache.iter_or_extract("cd" * 32, "unused.pdf")
+    assert next(owner).number == 1
+    follower = threading.Thread(target=follow, daemon=True)
+    follower.start()
+    # Page 1 is handed over while the owner is still working on it
+    assert first_read.wait(5) and read == [1]
+    owner.close()
+    follower.join(5)
+
+    assert read == [1, 2, 3] and extracted == [1, 1, 2, 3]
+    assert cache.contains("cd" * 32) and not cache._extractions
+
+
+def test_index_tombstones_and_compaction(tmp_path):
+    """Test deleting a document masks only its rows, and compaction keeps the ANN lists consistent"""
+    import numpy as np
+    from app.services.ann_index import IVFIndex
+    from app.services.lexical_index import BM25Index
+    from app.services.vector_store import LocalVectorIndex
+    
+    rng = np.random.default_rng(0)
+    index = LocalVectorIndex(str(tmp_path / "vectors"))
+    ann = IVFIndex(index, nprobe=4, min_rows=10, exact_threshold=0)
+    lexical = BM25Index(str(tmp_path / "lexical.db"))
+    for doc in ("a", "b"):
+        chunks = [{"chunk_id": f"{doc}:{i}", "document_id": doc, "text": f"{doc} clause {i}"} for i in range(20)]
+        index.add(rng.normal(size=(20, 8)), chunks)
+        lexical.add(chunks)
+    ann.sync()
+    
+    assert index.delete_document("a") == 20
+    assert lexical.delete_document("a") == 20
+    assert index.tombstoned_rows == 20 and len(lexical) == 20
+    assert {hit.metadata["document_id"] for hit in ann.search(rng.normal(size=8), top_k=40)} == {"b"}
+    assert lexical.search("clause", top_k=40)[0].document_id == "b"
+    # Vectors of unchanged text stay reusable until compaction
+    assert index.find_rows(["a clause 3", "b clause 4", "new text"]).tolist() == [3, 24, -1]
+    
+    query = index.vectors()[30].copy()
+    assert ann.compact().tolist() == list(range(20, 40))
+    reopened = LocalVectorIndex(str(tmp_path / "vectors"))
+    assert len(reopened) == 20 and reopened.tombstoned_rows == 0 and reopened.documents == ["b"]
+    assert ann.search(query, top_k=1)[0].metadata["chunk_id"] == "b:10"
+
+
+def test_bm25_ranking(tmp_path):
+    """Test BM25 scores and order match the textbook formula over the index's own tokenizer"""
+    import math
+    from collections import Counter
+    from app.services.lexical_index import BM25Index, tokenize
+    
+    texts = {
+        "a:0": "Supplier shall indemnify Customer against all claims",
+        "a:1": "Customer shall pay all invoices within thirty days of receipt of the invoice",
+        "a:2": "Indemnification obligations survive termination",
+        "b:0": "Either party may terminate this agreement for convenience on notice",
+        "b:1": "Invoices are payable within thirty days; late invoices accrue interest on invoices",
+        "b:2": "Payment terms"
+    }
+    index = BM25Index(str(tmp_path / "lexical.db"))
+    index.add([{"chunk_id": key, "document_id": key[0], "page": 1, "text": text} for key, text in texts.items()])
+    
+    tokens = {key: tokenize(text) for key, text in texts.items()}
+    avg_length = sum(map(len, tokens.values())) / len(tokens)
+    
+    def reference(query):
+        scores = Counter()
+        for term in dict.fromkeys(tokenize(query)):
+            df = sum(term in t for t in tokens.values())
+            idf = math.log(1 + (len(tokens) - df + 0.5) / (df + 0.5))
+            for key, t in tokens.items():
+                tf = t.count(term)
+                if tf:
+                    scores[key] += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(t) / avg_length))
+        return scores
+    
+    for query in ("invoices thirty days", "indemnification", "terminate payment", "invoice invoice"):
+        expected = reference(query)
+        hits = index.search(query, top_k=10)
+        assert [hit.chunk_id for hit in hits] == sorted(expected, key=expected.get, reverse=True)
+        assert all(hit.score == pytest.approx(expected[hit.chunk_id]) for hit in hits)
+    
+    # Stemming joins indemnify / indemnification; repeating a term does not count it twice
+    assert {hit.chunk_id for hit in index.search("indemnification")} == {"a:0", "a:2"}
+    assert index.search("invoice invoice")[0].score == pytest.approx(index.search("invoice")[0].score)
+    # Higher term frequency wins over a single mention of the same term
+    assert index.search("invoices", top_k=2)[0].chunk_id == "b:1"
+    assert [hit.chunk_id for hit in index.search("invoices thirty days", document_ids=["a"])] == ["a:1"]
+    assert index.search("the of and") == []
+
+
+def test_fuse_and_retrieval_modes(tmp_path, monkeypatch):
+    """Test RRF deduplicates chunks found by both retrievers and each mode uses the right ones"""
+    from app.services import retrieval
+    from app.services.lexical_index import BM25Index
+    from app.services.retrieval import RRF_K, RetrievedChunk, fuse
+    
+    def ranking(*ids):
+        return [RetrievedChunk(chunk_id=i, document_id=i[0], page=1, text=f"text {i}", score=1.0) for i in ids]
+    
+    fused = fuse([ranking("a:0", "a:1", "b:0"), ranking("b:0", "a:0", "c:0")], top_k=10)
+    assert [c.chunk_id for c in fused] == ["a:0", "b:0", "a:1", "c:0"]
+    assert fused[0].score == pytest.approx((1 / (RRF_K + 1) + 1 / (RRF_K + 2)) / (2 / (RRF_K + 1)))
+    assert fuse([ranking("a:0"), ranking("a:0")], top_k=10)[0].score == pytest.approx(1.0)
+    assert [c.chunk_id for c in fuse([ranking("a:0", "a:1", "b:0"), ranking("b:0", "a:0", "c:0")], top_k=2)] == ["a:0", "b:0"]
+    
+    index = BM25Index(str(tmp_path / "lexical.db"))
+    index.add([
+        {"chunk_id": "a:0", "document_id": "a", "page": 1, "text": "Customer shall pay invoices within thirty days"},
+        {"chunk_id": "a:1", "document_id": "a", "page": 2, "text": "Supplier shall indemnify Customer"},
+        {"chunk_id": "b:0", "document_id": "b", "page": 1, "text": "Late invoices accrue interest"}
+    ])
+    
+    async def vector_search(question, document_ids, limit):
+        return ranking("b:0", "c:0")[:limit]
+    
+    def no_embeddings():
+        raise AssertionError("lexical mode must not embed the question")
+    
+    monkeypatch.setattr(retrieval, "get_lexical_index", lambda: index)
+    monkeypatch.setattr(retrieval, "_vector_search", vector_search)
+    monkeypatch.setattr(retrieval, "get_embedding_service", no_embeddings)
+    
+    lexical = asyncio.run(retrieval.retrieve("invoices", top_k=5, mode="lexical"))
+    assert [c.chunk_id for c in lexical] == ["b:0", "a:0"]
+    hybrid = asyncio.run(retrieval.retrieve("invoices", top_k=5, mode="hybrid"))
+    assert [c.chunk_id for c in hybrid] == ["b:0", "a:0", "c:0"]
+    assert hybrid[0].score == pytest.approx(1.0) and hybrid[0].text == "Late invoices accrue interest"
+    many = asyncio.run(retrieval.retrieve_many(["indemnify", "invoices"], top_k=5, mode="lexical"))
+    assert [[c.chunk_id for c in r] for r in many] == [["a:1"], ["b:0", "a:0"]]
+    with pytest.raises(ValueError):
+        asyncio.run(retrieval.retrieve("invoices", mode="semantic"))
+
+
+def test_ivf_recall_against_exact_search(tmp_path):
+    """Test IVF top-k recall against brute force, before and after a document is tombstoned and compacted"""
+    import numpy as np
+    from app.services.ann_index import IVFIndex
+    from app.services.vector_store import LocalVectorIndex
+    
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(0, 20, size=2000)] + rng.normal(scale=0.4, size=(2000, 32))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = LocalVectorIndex(str(tmp_path / "vectors"))
+    for doc in range(4):
+        rows = range(doc * 500, (doc + 1) * 500)
+        index.add(vectors[rows.start:rows.stop], [{"document_id": f"d{doc}", "chunk_id": f"d{doc}:{i}"} for i in rows])
+    ann = IVFIndex(index, nprobe=8, min_rows=100, exact_threshold=0)
+    ann.sync()
+    assert ann.trained
+    queries = vectors[rng.choice(2000, size=50, replace=False)] + rng.normal(scale=0.1, size=(50, 32)).astype(np.float32)
+    
+    def recall(live):
+        # search_many scores the union of every query's candidates, so it finds at least as much
+        exact = np.argsort(-(queries @ vectors[live].T), axis=1)[:, :10]
+        single, batched = 0, 0
+        for query, expected, hits in zip(queries, exact, ann.search_many(queries, top_k=10)):
+            expected = {f"d{live[i] // 500}:{live[i]}" for i in expected}
+            single += len(expected & {hit.metadata["chunk_id"] for hit in ann.search(query, top_k=10)})
+            batched += len(expected & {hit.metadata["chunk_id"] for hit in hits})
+        assert batched >= single
+        return single / (10 * len(queries))
+    
+    assert recall(np.arange(2000)) >= 0.9
+    # Probing every list is exact
+    hits = ann.search(queries[0], top_k=10, nprobe=len(ann.centroids))
+    assert [hit.metadata["chunk_id"] for hit in hits] == [f"d{i // 500}:{i}" for i in np.argsort(-(vectors @ queries[0]))[:10]]
+    
+    index.delete_document("d1")
+    live = np.concatenate([np.arange(0, 500), np.arange(1000, 2000)])
+    assert recall(live) >= 0.9
+    assert all(hit.metadata["document_id"] != "d1" for hits in ann.search_many(queries, top_k=10) for hit in hits)
+    ann.compact()
+    assert len(index) == 1500 and recall(live) >= 0.9
+
+
+@pytest.mark.asyncio
+async def test_embed_stage_rerun_is_idempotent(tmp_path, monkeypatch):
+    """Test re-running the embed stage (a recovered or retried job) replaces the document's rows"""
+    from app.services import pipelines
+    from app.services.ann_index import IVFIndex
+    from app.services.vector_store import LocalVectorIndex
+    
+    index = LocalVectorIndex(str(tmp_path / "vectors"))
+    monkeypatch.setattr(pipelines, "get_vector_index", lambda: index)
+    monkeypatch.setattr(pipelines, "get_ann_index", lambda: IVFIndex(index, min_rows=1000))
+    monkeypatch.setattr(pipelines, "schedule_compaction", lambda: None)
+    chunks = [
+        {"chunk_id": "d:0", "document_id": "d", "text": "Supplier shall deliver the goods"},
+        {"chunk_id": "d:1", "document_id": "d", "text": "Customer shall pay within 30 days"}
+    ]
+    first = await pipelines.embed_chunks({"_chunks": chunks})
+    second = await pipelines.embed_chunks({"_chunks": chunks})
+    
+    assert first == {"embedded": 2, "reused": 0} and second == {"embedded": 0, "reused": 2}
+    assert len(index) - index.tombstoned_rows == 2
+    hits = index.search(index.vectors()[-1], top_k=10)
+    assert sorted(hit.metadata["chunk_id"] for hit in hits) == ["d:0", "d:1"]
+    index.compact()
+    assert len(index) == 2
+
+
+@pytest.mark.asyncio
+async def test_replace_merges_into_active_ingest(tmp_path, monkeypatch):
+    """Test replacing into an already active ingest still retires the old version"""
+    import asyncio
+    import threading
+    from app.services import pipelines
+    from app.services.job_queue import JobQueue, Stage
+    
+    queue = JobQueue(database_url=f"sqlite:///{tmp_path / 'jobs.db'}")
+    release = threading.Event()
+    deleted, processed = [], []
+    
+    async def wait(context):
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+        return {}
+    
+    queue.register("ingest", [Stage("wait", wait), Stage("finalize", pipelines.finalize_ingest)])
+    monkeypatch.setattr(pipelines, "get_job_queue", lambda: queue)
+    monkeypatch.setattr(pipelines, "delete_document", deleted.append)
+    monkeypatch.setattr(
+        pipelines, "get_document_store",
+        lambda: type("Store", (), {"mark_processed": lambda self, *args: processed.append(args[0])})()
+    )
+    try:
+        job_id = queue.submit("ingest", document_id="new")
+        # A replace arriving while that ingest is running is deduped onto it
+        assert queue.submit("ingest", document_id="new", payload={"replaces": ["v1"]}, merge=True) == job_id
+        assert queue.submit("ingest", document_id="new", payload={"replaces": ["v2", "v1"]}, merge=True) == job_id
+        assert queue.payload(job_id) == {"replaces": ["v1", "v2"]}
+        release.set()
+        for _ in range(200):
+            if queue.get(job_id)["status"] not in ("queued", "running"):
+                break
+            await asyncio.sleep(0.02)
+        
+        assert queue.get(job_id)["status"] == "succeeded"
+        assert processed == ["new"] and deleted == ["v1", "v2"]
+    finally:
+        release.set()
+        queue.stop()
+
+
+def test_compaction_concurrent_with_search_and_ingest(tmp_path):
+    """Test searches and ingest running during compaction always see consistent rows"""
+    import threading
+    import numpy as np
+    from app.services.ann_index import IVFIndex
+    from app.services.vector_store import LocalVectorIndex
+    
+    rng = np.random.default_rng(1)
+    vectors = {}
+    
+    def add_document(index, doc, rows=30):
+        texts = [f"{doc} clause {i}" for i in range(rows)]
+        batch = rng.normal(size=(rows, 16)).astype(np.float32)
+        batch /= np.linalg.norm(batch, axis=1, keepdims=True)
+        vectors.update(zip(texts, batch))
+        index.add(batch, [{"document_id": doc, "text": text} for text in texts])
+    
+    index = LocalVectorIndex(str(tmp_path / "vectors"))
+    ann = IVFIndex(index, nprobe=10000, min_rows=50, exact_threshold=0)
+    for i in range(10):
+        add_document(index, f"keep{i}")
+        add_document(index, f"drop{i}")
+    ann.sync()
+    errors = []
+    done = threading.Event()
+    
+    def guard(fn):
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                errors.append(e)
+                done.set()
+        return run
+    
+    @guard
+    def compact():
+        for i in range(10):
+            index.delete_document(f"drop{i}")
+            ann.compact()
+    
+    @guard
+    def search():
+        while not done.is_set():
+            text = f"keep{rng.integers(10)} clause {rng.integers(30)}"
+            assert ann.search(vectors[text], top_k=1)[0].metadata["text"] == text
+    
+    @guard
+    def ingest():
+        for i in range(10):
+            add_document(index, f"new{i}")
+            ann.sync()
+            texts = [f"keep{i} clause 3", f"new{i} clause 7"]
+            found, stored = index.reusable_vectors(texts)
+            assert found.tolist() == [0, 1]
+            assert np.allclose(stored, [vectors[t] for t in texts])
+    
+    writers = [threading.Thread(target=fn) for fn in (compact, ingest)]
+    readers = [threading.Thread(target=search) for _ in range(2)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+    assert not errors, errors
+    assert index.tombstoned_rows == 0 and len(index) == 600
+
+
+def test_webhook_batching_and_retry(tmp_path):
+    """Test webhook delivery against a stub receiver"""
+    import httpx
+    import time
+    from app.services.webhook_service import WebhookDispatcher
+    
+    received = []
+    failures = {"left": 1}
+    
+    def receiver(request):
+        if failures["left"]:
+            failures["left"] -= 1
+            return httpx.Response(503)
+        received.append(json.loads(request.content))
+        return httpx.Response(200)
+    
+    dispatcher = WebhookDispatcher(
+        f"sqlite:///{tmp_path}/webhooks.db",
+        batch_window_ms=50,
+        backoff_base_s=0.01,
+        transport=httpx.MockTransport(receiver)
+    )
+    dispatcher.register("http://receiver/hook", ["extraction_complete"])
+    try:
+        for i in range(5):
+            dispatcher.emit("extraction_complete", {"document_id": f"doc-{i}"})
+        deadline = time.time() + 5
+        while not received and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        dispatcher.stop()
+    
+    assert len(received) == 1
+    assert received[0]["batched"] is True
+    assert received[0]["count"] == 5
+
+
+def test_metrics_shards_and_prometheus():
+    """Test counters merge across threads and histograms render as Prometheus text"""
+    import threading
+    from app.services.metrics import Metrics
+
+    metrics = Metrics(buckets=(0.01, 0.1, 1.0))
+    threads = [
+        threading.Thread(target=lambda: [metrics.inc("queries_total", endpoint="ask") for _ in range(1000)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for seconds in (0.005, 0.05, 0.05, 5.0):
+        metrics.observe("stage_duration_seconds", seconds, pipeline="ask", stage="llm")
+
+    assert metrics.counter("queries_total") == 4000
+    summary = metrics.snapshot()["histograms"]["stage_duration_seconds"]["pipeline=ask,stage=llm"]
+    assert summary["count"] == 4
+    assert 10 <= summary["p50_ms"] <= 100
+    text = metrics.prometheus()
+    assert 'stage_duration_seconds_bucket{pipeline="ask",stage="llm",le="0.1"} 3' in text
+    assert 'stage_duration_seconds_bucket{pipeline="ask",stage="llm",le="+Inf"} 4' in text
+    assert 'queries_total{endpoint="ask"} 4000' in text
+
+
+def test_request_profiling():
+    """Test the profile header captures a span tree served by the admin endpoints"""
+    import time
+    from app.services.metrics import get_metrics
+    from app.services.profiler import Profiler
+
+    profiler = Profiler(max_profiles=2, interval_ms=1)
+    handle = profiler.begin("POST", "/ask/", "header")
+    with get_metrics().timer("stage_duration_seconds", pipeline="ask", stage="retrieve"):
+        with get_metrics().timer("stage_duration_seconds", pipeline="retrieval", stage="lexical"):
+            time.sleep(0.01)
+    profiler.finish(handle, "/ask/", 200)
+    profile = profiler.get(handle[0].id)
+    assert profile.to_dict()["spans"]["children"][0]["name"] == "ask.retrieve"
+    assert "POST /ask/;ask.retrieve;retrieval.lexical" in profile.collapsed_spans()
+
+    # Both the profile header and the profile endpoints need the admin token
+    assert "x-profile-id" not in client.get("/admin/healthz", headers={"X-Profile": "1"}).headers
+    assert client.get("/admin/profiles").status_code == 403
+    response = client.get("/admin/healthz", headers={"X-Profile": "test-admin-token"})
+    profile_id = response.headers["x-profile-id"]
+    assert "x-profile-id" not in client.get("/admin/healthz").headers
+    admin = {"X-Admin-Token": "test-admin-token"}
+    assert client.get("/admin/profiles", headers=admin).json()[0]["id"] == profile_id
+    assert client.get(f"/admin/profiles/{profile_id}", headers=admin).json()["route"] == "/admin/healthz"
+    assert client.get(f"/admin/profiles/{profile_id}", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_remote_provider_coalescing_and_limits():
+    """Test identical prompts share one upstream call and distinct ones respect the concurrency cap"""
+    import time
+    from app.services.llm_service import StubLLMProvider
+    
+    provider = StubLLMProvider(latency_ms=50, max_concurrency=2, requests_per_minute=60000)
+    answers = await asyncio.gather(*[provider.answer_question("Who pays?", ["ctx"]) for _ in range(10)])
+    assert len(set(answers)) == 1
+    assert provider.stats()["requests"] == 1
+    assert provider.stats()["coalesced"] == 9
+    
+    started = time.perf_counter()
+    await asyncio.gather(*[provider.answer_question(f"Question {i}", ["ctx"]) for i in range(4)])
+    assert time.perf_counter() - started >= 0.1
+    assert await provider.answer_questions(["a", "b"], ["ctx"]) == ["Stub answer 1.", "Stub answer 2."]
+    
+    # A rate of 0 means unlimited
+    unlimited = StubLLMProvider(latency_ms=1, requests_per_minute=0)
+    assert await unlimited.answer_question("Who pays?", ["ctx"]) == "Stub answer."
+    
+    # Clients of loops that have shut down are dropped, the running loop's is closed
+    await asyncio.to_thread(asyncio.run, unlimited.answer_question("Other loop", ["ctx"]))
+    await unlimited.aclose()
+    assert len(unlimited._clients) == 0
+
+
+@pytest.mark.asyncio
+async def test_llm_response_cache(tmp_path):
+    """Test repeated prompts are served from the persistent cache and size-bounded"""
+    from app.services.llm_cache import LLMResponseCache
+    from app.services.llm_service import StubLLMProvider
+    
+    cache = LLMResponseCache(str(tmp_path / "llm.db"), max_bytes=100)
+    provider = StubLLMProvider(latency_ms=1, cache=cache)
+    for _ in range(3):
+        await provider.extract_fields("Boilerplate clause.", {"parties": "Contracting parties"})
+    assert provider.stats()["requests"] == 1
+    assert cache.stats()["callers"]["extract"]["hits"] == 2
+    
+    for i in range(20):
+        await provider.answer_question(f"Question {i}", ["ctx"])
+    assert cache.stats()["bytes"] <= 100
+    
+    # Survives a restart
+    restarted = StubLLMProvider(latency_ms=1, cache=LLMResponseCache(str(tmp_path / "llm.db"), max_bytes=100))
+    await restarted.answer_question("Question 19", ["ctx"])
+    assert restarted.stats()["requests"] == 0
+    
+    # Memory-tier hits do not wait on a disk write in progress
+    key = next(iter(cache._memory))
+    with cache._write_lock:
+        assert cache.get_memory(key, "answer") is not None
+
+
+@pytest.mark.asyncio
+async def test_async_client_ingest_many(tmp_path):
+    """Test bulk upload bounds concurrency, retries throttled uploads and reports progress"""
+    pytest.importorskip("requests")
+    import httpx
+    from client import AsyncContractIntelligenceAPI
+    
+    state = {"active": 0, "peak": 0, "throttled": 0}
+    
+    async def server(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        if state["throttled"] < 3:
+            state["throttled"] += 1
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        name = request.content.split(b'filename="')[1].split(b'"')[0].decode()
+        return httpx.Response(200, json={"documents": [{"id": name, "job_id": "job", "duplicate": False}]})
+    
+    paths = []
+    for i in range(12):
+        path = tmp_path / f"contract{i}.pdf"
+        path.write_bytes(f"%PDF-1.4 contract {i}".encode())
+        paths.append(str(path))
+    progress = []
+    
+    async with AsyncContractIntelligenceAPI("http://api", transport=httpx.MockTransport(server)) as api:
+        results = await api.ingest_many(iter(paths), concurrency=4, on_progress=lambda p: progress.append(p.done))
+    
+    assert [r.document_id for r in results] == [f"contract{i}.pdf" for i in range(12)]
+    assert sum(r.attempts for r in results) == 15
+    assert state["peak"] <= 4
+    assert progress == list(range(1, 13))
+
+
+@pytest.mark.asyncio
+async def test_embedding_service(tmp_path):
     """Test embedding service"""
-    from app.services.embedding_service import EmbeddingService
+    import numpy as np
+    from app.services.embedding_service import EmbeddingService, SentenceTransformer
+    from app.services.vector_store import LocalVectorIndex
     
     service = EmbeddingService()
     embedding = service.embed_text("sample contract text")
     assert embedding is not None
+    if SentenceTransformer is None:
+        assert service.model_id == "hashing"
+    
+    # An index refuses vectors from a model other than the one it was built with
+    index = LocalVectorIndex(str(tmp_path / "vectors"))
+    index.add(np.ones((1, 4)), [{"document_id": "a"}], model="hashing")
+    with pytest.raises(ValueError):
+        index.add(np.ones((1, 4)), [{"document_id": "b"}], model="all-MiniLM-L6-v2")
+    assert LocalVectorIndex(str(tmp_path / "vectors")).model == "hashing"
 
 
 if __name__ == "__main__":
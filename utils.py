@@ -64,6 +64,32 @@ def stop_docker_compose():
     print("Services stopped!")
 
 
+def benchmark_ann(rows: int = 200000, dim: int = 384, queries: int = 200):
+    """Benchmark approximate vector search against exact search"""
+    import tempfile
+    import numpy as np
+    from app.services.ann_index import IVFIndex, benchmark
+    from app.services.vector_store import LocalVectorIndex
+    
+    print(f"Building {rows} x {dim} synthetic index...")
+    rng = np.random.default_rng(0)
+    # Clustered data resembles real embeddings better than uniform noise
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, 256, rows)] + 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    
+    with tempfile.TemporaryDirectory() as root:
+        base = LocalVectorIndex(root)
+        base.add(vectors, [{"document_id": f"doc-{i % 1000}"} for i in range(rows)])
+        index = IVFIndex(base, min_rows=0)
+        index.train()
+        sample = vectors[rng.choice(rows, queries, replace=False)] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+        
+        print(f"{'nprobe':>8} {'recall@10':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for row in benchmark(index, sample, top_k=10):
+            nprobe = "exact" if row["nprobe"] is None else row["nprobe"]
+            print(f"{nprobe:>8} {row['recall']:>10.3f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+
 def generate_sample_curl_commands():
     """Generate sample curl commands"""
     commands = {
@@ -98,6 +124,7 @@ Commands:
   docker-up   - Start Docker Compose
   docker-down - Stop Docker Compose
   examples    - Show sample curl commands
+  bench-ann   - Benchmark approximate vector search
 """)
         sys.exit(1)
     
@@ -119,6 +146,8 @@ Commands:
         stop_docker_compose()
     elif command == "examples":
         generate_sample_curl_commands()
+    elif command == "bench-ann":
+        benchmark_ann()
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)